@@ -1,21 +1,66 @@
 import os
+import threading
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
 
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 
 from .database import Base, engine
 from .routes import router
+from .services.background_validator import validator_from_env
+from .services.cpu_executor import cpu_executor
+from .services.schema_migration import migrate_schema
+from .services.storage_etags import storage_etag
+from .utils.static_files import ImmutableStaticFiles
 
 Base.metadata.create_all(bind=engine)
+migrate_schema(engine)
 
-app = FastAPI(title="Image Modification Service")
+VALIDATOR_MODE = os.getenv("APP_VALIDATOR_MODE", "external")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    """
+    Run the in-process validator in a background thread
+    when APP_VALIDATOR_MODE is "embedded", and let queued
+    CPU work finish on shutdown.
+    """
+    try:
+        if VALIDATOR_MODE != "embedded":
+            yield
+            return
+
+        validator = validator_from_env(
+            direct=True, executor=cpu_executor, embedded=True
+        )
+        thread = threading.Thread(
+            target=validator.run,
+            kwargs={
+                "wait_seconds": float(os.getenv("APP_VALIDATOR_WAIT_SECONDS", "30"))
+            },
+            name="validator",
+            daemon=True,
+        )
+        thread.start()
+        try:
+            yield
+        finally:
+            validator.stop()
+            thread.join(timeout=30)
+    finally:
+        cpu_executor.shutdown()
+
+
+app = FastAPI(title="Image Modification Service", lifespan=lifespan)
 
 storage_path = os.getenv("APP_STORAGE_BASE_PATH", "storage")
 os.makedirs(storage_path, exist_ok=True)
 
 app.mount(
     f"/{storage_path}",
-    StaticFiles(directory=storage_path),
+    ImmutableStaticFiles(directory=storage_path, etag_for=storage_etag),
     name=storage_path,
 )
 
@@ -1,7 +1,7 @@
 from datetime import datetime
 from typing import Optional
 
-from sqlalchemy import DateTime, ForeignKey, func
+from sqlalchemy import DateTime, ForeignKey, Index, func
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from app.database import Base
@@ -9,9 +9,15 @@ from app.database import Base
 
 class DBImage(Base):
     __tablename__ = "images"
+    # ids of discarded uploads are never reused, since their storage and
+    # thumbnail URLs are served as immutable
+    __table_args__ = {"sqlite_autoincrement": True}
 
     id: Mapped[int] = mapped_column(primary_key=True, index=True)
     original_image_path: Mapped[str] = mapped_column(nullable=False)
+    digest: Mapped[Optional[str]] = mapped_column(
+        nullable=True, unique=True, index=True
+    )
     created_at: Mapped[datetime] = mapped_column(DateTime, default=func.now())
 
     modifications = relationship("DBImageModification", back_populates="image")
@@ -19,17 +25,30 @@ class DBImage(Base):
 
 class DBImageModification(Base):
     __tablename__ = "image_modifications"
+    __table_args__ = (
+        Index("ix_image_modifications_status_id", "verification_status", "id"),
+        {"sqlite_autoincrement": True},
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True, index=True)
     image_id: Mapped[int] = mapped_column(
         ForeignKey("images.id"), nullable=False, index=True
     )
     modified_image_path: Mapped[str] = mapped_column(nullable=False)
+    storage_mode: Mapped[str] = mapped_column(default="file")
+    codec: Mapped[str] = mapped_column(default="png")
     modification_algorithm: Mapped[str] = mapped_column(nullable=False)
     modification_params: Mapped[str] = mapped_column(nullable=False)
     num_modifications: Mapped[int] = mapped_column(nullable=False)
     verification_status: Mapped[str] = mapped_column(default="pending")
     created_at: Mapped[datetime] = mapped_column(DateTime, default=func.now())
     verified_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    lease_owner: Mapped[Optional[str]] = mapped_column(nullable=True)
+    lease_expires_at: Mapped[Optional[datetime]] = mapped_column(
+        DateTime, nullable=True
+    )
+    # claims so far, so a modification whose reversal keeps failing
+    # stops being claimed after MAX_VERIFY_ATTEMPTS
+    verify_attempts: Mapped[int] = mapped_column(default=0)
 
     image = relationship("DBImage", back_populates="modifications")
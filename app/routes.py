@@ -1,45 +1,126 @@
-import asyncio
 import os
-from typing import Optional
+from typing import IO, Iterator, Optional
 
-from fastapi import APIRouter, Depends, File, HTTPException, Query, UploadFile
+from fastapi import (
+    APIRouter,
+    Depends,
+    File,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+    UploadFile,
+)
+from fastapi.responses import FileResponse, StreamingResponse
+from PIL.Image import DecompressionBombError, UnidentifiedImageError
 from sqlalchemy import desc
 from sqlalchemy.orm import Session, defer, load_only, selectinload
 
-from app.database import get_db
+from app.database import SessionLocal, get_db
 from app.models import DBImage, DBImageModification
 from app.schemas import (
+    CacheStats,
+    ClaimRequest,
+    ClaimResponse,
+    ExecutorStats,
     ImageDetailResponse,
     ImageListResponse,
+    JobResponse,
     ModificationResponse,
+    ReverseBatchRequest,
     ReverseImageRequest,
     ReverseModificationResponse,
+    StatsResponse,
+    Thumbnail,
     UploadResponse,
 )
-from app.services.generator_service import GeneratorService
+from app.services.cpu_executor import cpu_executor
+from app.services.generator_service import (
+    NUM_VARIANTS,
+    GeneratorService,
+    PreparedUpload,
+    decoded_originals,
+    mapped_originals,
+    rendered_variants,
+)
+from app.services.image_processor import image_pixels
+from app.services.modification_leases import claim_modifications
+from app.services.upload_jobs import UploadJob, upload_jobs
+from app.utils.archive_stream import ARCHIVE_MEDIA_TYPES
+from app.utils.static_files import IMMUTABLE_CACHE_CONTROL
 
 router = APIRouter(prefix="/api", tags=["Images"])
 
 STORAGE_PATH = os.getenv("APP_STORAGE_BASE_PATH", "storage")
+MODIFICATION_ALGORITHM = os.getenv("APP_MODIFICATION_ALGORITHM", "pixel_color")
+GENERATION_WORKERS = int(os.getenv("APP_GENERATION_WORKERS", "0"))
+VARIANT_STORAGE = os.getenv("APP_VARIANT_STORAGE", "file")
+VERIFICATION_MODE = os.getenv("APP_VERIFICATION_MODE", "region")
+VARIANT_CODEC = os.getenv("APP_VARIANT_CODEC", "png")
+PNG_COMPRESS_LEVEL = int(os.getenv("APP_PNG_COMPRESS_LEVEL", "6"))
+RAW_ORIGINALS = os.getenv("APP_RAW_ORIGINALS", "false").lower() == "true"
+THUMBNAIL_SIZES = {
+    int(size) for size in os.getenv("APP_THUMBNAIL_SIZES", "128,256,512").split(",")
+}
+MAX_UPLOAD_BYTES = int(os.getenv("APP_MAX_UPLOAD_BYTES", str(64 * 1024 * 1024)))
+MAX_UPLOAD_PIXELS = int(os.getenv("APP_MAX_UPLOAD_PIXELS", "50000000"))
 
 
-@router.post("/images", response_model=UploadResponse)
+@router.post(
+    "/images",
+    response_model=UploadResponse | JobResponse,
+    responses={202: {"model": JobResponse}},
+)
 async def upload_image(
-    file: UploadFile = File(...), db: Session = Depends(get_db)  # noqa: B008
+    response: Response,
+    file: UploadFile = File(...),  # noqa: B008
+    background: bool = Query(False),  # noqa: B008
+    db: Session = Depends(get_db),  # noqa: B008
 ):
     """
     Accept an image file and generate 100 variants with random modifications.
+    Returns 413 for files over APP_MAX_UPLOAD_BYTES or images over
+    APP_MAX_UPLOAD_PIXELS, and 503 with Retry-After when the CPU executor
+    queue is full.
+    With background=true, return 202 with an upload job as soon as the
+    original is saved, and generate the variants in the background.
     """
     if not file.content_type or not file.content_type.startswith("image/"):
         raise HTTPException(status_code=400, detail="File must be an image")
 
     try:
-        contents = await file.read()
+        # the multipart parser has already spooled the upload to a temp file
+        # in chunks, so it is decoded from there instead of read into memory
+        _check_upload_size(file)
+        pixels = _upload_pixels(file.file)
 
-        service = GeneratorService(db=db, storage_path=STORAGE_PATH)
-        result = await asyncio.to_thread(service.process_uploaded_image, contents)
+        service = GeneratorService(
+            db=db,
+            storage_path=STORAGE_PATH,
+            generation_workers=GENERATION_WORKERS,
+            variant_storage=VARIANT_STORAGE,
+            variant_codec=VARIANT_CODEC,
+            png_compress_level=PNG_COMPRESS_LEVEL,
+            raw_originals=RAW_ORIGINALS,
+            max_upload_pixels=MAX_UPLOAD_PIXELS,
+        )
+        if not background:
+            return await cpu_executor.run(
+                service.process_uploaded_image,
+                file.file,
+                modification_algorithm=MODIFICATION_ALGORITHM,
+                cost=pixels * NUM_VARIANTS,
+            )
 
-        return result
+        upload = await cpu_executor.run(
+            service.prepare_upload,
+            file.file,
+            modification_algorithm=MODIFICATION_ALGORITHM,
+            cost=pixels,
+        )
+        if isinstance(upload, UploadResponse):
+            return upload
+        db.commit()
 
     except HTTPException:
         raise
@@ -47,6 +128,56 @@ async def upload_image(
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Error processing image: {str(e)}")
 
+    try:
+        job = upload_jobs.submit(
+            image_id=upload.image_id,
+            total_variants=NUM_VARIANTS,
+            run=lambda job: _generate_upload_variants(upload, job),
+            cost=pixels * NUM_VARIANTS,
+        )
+    except HTTPException:
+        service.discard_upload(upload)
+        raise
+
+    response.status_code = 202
+    response.headers["Location"] = f"/api/jobs/{job.id}"
+    return job.snapshot()
+
+
+@router.get("/jobs/{job_id}", response_model=JobResponse)
+def get_job(job_id: str) -> JobResponse:
+    """
+    Get the progress of a background upload job.
+    """
+    return _get_upload_job(job_id).snapshot()
+
+
+@router.get(
+    "/jobs/{job_id}/events",
+    response_class=StreamingResponse,
+    responses={200: {"content": {"text/event-stream": {}}}},
+)
+def stream_job_events(job_id: str) -> StreamingResponse:
+    """
+    Stream the progress of a background upload job as server-sent events,
+    one JobResponse per change, until the job finishes.
+    """
+    job = _get_upload_job(job_id)
+
+    def events() -> Iterator[str]:
+        for snapshot in job.watch():
+            if snapshot is None:
+                yield ": keepalive\n\n"
+                continue
+            event = "done" if job.is_finished else "progress"
+            yield f"event: {event}\ndata: {snapshot.model_dump_json()}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
+
 
 @router.post(
     "/modifications/{modification_id}/reverse/",
@@ -62,13 +193,15 @@ def reverse_modification(
     and optionally save the result to the reversed folder.
     """
     try:
-        result = GeneratorService(
-            db=db, storage_path=STORAGE_PATH
-        ).reverse_modification(
+        service = GeneratorService(
+            db=db, storage_path=STORAGE_PATH, verification_mode=VERIFICATION_MODE
+        )
+        return cpu_executor.submit(
+            service.reverse_modification,
             modification_id=modification_id,
             should_save_reversed_img=body.should_save_reversed_img,
-        )
-        return result
+            cost=service.estimate_reversal_cost([modification_id]),
+        ).result()
 
     except HTTPException:
         raise
@@ -78,20 +211,106 @@ def reverse_modification(
         )
 
 
+@router.post(
+    "/modifications/reverse-batch",
+    response_class=StreamingResponse,
+    responses={200: {"content": {"application/x-ndjson": {}}}},
+)
+def reverse_modifications_batch(
+    body: ReverseBatchRequest,
+    db: Session = Depends(get_db),  # noqa: B008
+) -> StreamingResponse:
+    """
+    Reverse several modifications, grouped by image,
+    streaming one ReverseBatchItem JSON line per id as it completes.
+    Returns 503 with Retry-After when the CPU executor queue is full.
+    """
+    service = GeneratorService(
+        db=db,
+        storage_path=STORAGE_PATH,
+        verification_mode=VERIFICATION_MODE,
+        executor=cpu_executor,
+    )
+    cpu_executor.check_capacity(service.estimate_reversal_cost(body.modification_ids))
+    results = service.reverse_modifications_batch(
+        modification_ids=body.modification_ids,
+        should_save_reversed_img=body.should_save_reversed_img,
+    )
+
+    return StreamingResponse(
+        (item.model_dump_json() + "\n" for item in results),
+        media_type="application/x-ndjson",
+    )
+
+
+@router.get(
+    "/modifications/{modification_id}/image",
+    response_class=Response,
+    responses={200: {"content": {"image/png": {}, "image/webp": {}}}},
+)
+def get_modification_image(
+    modification_id: int,
+    db: Session = Depends(get_db),  # noqa: B008
+) -> Response:
+    """
+    Get the variant image of a modification, rendering it from the original
+    for delta-stored variants and as PNG for formats browsers cannot show.
+    """
+    variant_image = GeneratorService(
+        db=db, storage_path=STORAGE_PATH
+    ).get_modification_image(modification_id)
+
+    if variant_image.content is not None:
+        return Response(content=variant_image.content, media_type="image/png")
+
+    if variant_image.path is None:
+        raise HTTPException(
+            status_code=404, detail=f"Modification {modification_id} has no image"
+        )
+
+    return FileResponse(variant_image.path, media_type=variant_image.media_type)
+
+
+@router.post("/modifications/claim", response_model=ClaimResponse)
+def claim_pending_modifications(
+    body: ClaimRequest,
+    db: Session = Depends(get_db),  # noqa: B008
+) -> ClaimResponse:
+    """
+    Atomically claim a batch of pending or lease-expired modifications
+    for a validator worker, long-polling up to wait_seconds when none
+    are available.
+    """
+    return claim_modifications(
+        db,
+        worker_id=body.worker_id,
+        limit=body.limit,
+        lease_seconds=body.lease_seconds,
+        wait_seconds=body.wait_seconds,
+    )
+
+
 @router.get("/modifications", response_model=list[ModificationResponse])
 def get_modifications(
-    skip: int = 0,
-    limit: int = 50,
+    response: Response,
+    skip: int = Query(0, deprecated=True),  # noqa: B008
+    limit: int = Query(50, ge=1, le=1000),  # noqa: B008
+    after_id: Optional[int] = None,
     status: Optional[str] = Query(None),  # noqa: B008
     db: Session = Depends(get_db),  # noqa: B008
 ):
-    """Get list of modifications."""
-    print(status)
+    """
+    Get list of modifications ordered by id.
+    Pass the X-Next-Cursor header of a full page as after_id to get the next page.
+    """
     query = db.query(DBImageModification).options(
         load_only(
             DBImageModification.id,
             DBImageModification.image_id,
             DBImageModification.modified_image_path,
+            DBImageModification.storage_mode,
+            DBImageModification.codec,
+            DBImageModification.modification_algorithm,
             DBImageModification.num_modifications,
             DBImageModification.verification_status,
             DBImageModification.created_at,
@@ -102,30 +321,53 @@ def get_modifications(
     if status:
         query = query.filter(DBImageModification.verification_status == status)
 
-    modifications = query.offset(skip).limit(limit).all()
+    if after_id is not None:
+        query = query.filter(DBImageModification.id > after_id)
+
+    modifications = (
+        query.order_by(DBImageModification.id).offset(skip).limit(limit).all()
+    )
+
+    if len(modifications) == limit:
+        response.headers["X-Next-Cursor"] = str(modifications[-1].id)
 
     return modifications
 
 
 @router.get("/images", response_model=list[ImageListResponse])
 def get_images(
-    skip: int = 0,
-    limit: int = 50,
+    response: Response,
+    skip: int = Query(0, deprecated=True),  # noqa: B008
+    limit: int = Query(50, ge=1, le=1000),  # noqa: B008
+    cursor: Optional[str] = None,
     db: Session = Depends(get_db),  # noqa: B008
 ):
+    """
+    Get list of images, newest first.
+    Pass the X-Next-Cursor header of a full page as cursor to get the next page.
+    Ids are assigned in upload order, so the cursor is the last id of a page.
+    """
     query = (
         db.query(DBImage)
         .options(
             load_only(
                 DBImage.id,
                 DBImage.original_image_path,
+                DBImage.digest,
                 DBImage.created_at,
             )
         )
-        .order_by(desc(DBImage.created_at))
+        .order_by(desc(DBImage.id))
     )
 
+    if cursor:
+        query = query.filter(DBImage.id < _decode_image_cursor(cursor))
+
     images = query.offset(skip).limit(limit).all()
+
+    if len(images) == limit:
+        response.headers["X-Next-Cursor"] = str(images[-1].id)
+
     return images
 
 
@@ -152,3 +394,189 @@ async def get_image_details(
         raise HTTPException(status_code=404, detail=f"Image {image_id} not found")
 
     return image
+
+
+@router.get(
+    "/images/{image_id}/thumbnail",
+    response_class=Response,
+    responses={200: {"content": {"image/jpeg": {}}}, 304: {}},
+)
+def get_image_thumbnail(
+    image_id: int,
+    request: Request,
+    size: int = Query(256),  # noqa: B008
+    db: Session = Depends(get_db),  # noqa: B008
+) -> Response:
+    """
+    Get a JPEG thumbnail of an original, at most size pixels on each side.
+    """
+    _check_thumbnail_size(size)
+    thumbnail = GeneratorService(db=db, storage_path=STORAGE_PATH).get_image_thumbnail(
+        image_id, size
+    )
+    return _immutable_response(request, thumbnail)
+
+
+@router.get(
+    "/images/{image_id}/export",
+    response_class=StreamingResponse,
+    responses={200: {"content": {"application/zip": {}, "application/x-tar": {}}}},
+)
+def export_image(
+    image_id: int,
+    archive_format: str = Query("zip", alias="format"),  # noqa: B008
+    db: Session = Depends(get_db),  # noqa: B008
+) -> StreamingResponse:
+    """
+    Download all variants of an image as a ZIP or tar archive built while
+    it is sent, with a manifest.json of their modification metadata.
+    """
+    if archive_format not in ARCHIVE_MEDIA_TYPES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Archive format must be one of {sorted(ARCHIVE_MEDIA_TYPES)}",
+        )
+
+    chunks = GeneratorService(db=db, storage_path=STORAGE_PATH).export_image(
+        image_id, archive_format
+    )
+    return StreamingResponse(
+        chunks,
+        media_type=ARCHIVE_MEDIA_TYPES[archive_format],
+        headers={
+            "Content-Disposition": (
+                f'attachment; filename="image_{image_id}.{archive_format}"'
+            )
+        },
+    )
+
+
+@router.get(
+    "/modifications/{modification_id}/thumbnail",
+    response_class=Response,
+    responses={200: {"content": {"image/jpeg": {}}}, 304: {}},
+)
+def get_modification_thumbnail(
+    modification_id: int,
+    request: Request,
+    size: int = Query(256),  # noqa: B008
+    db: Session = Depends(get_db),  # noqa: B008
+) -> Response:
+    """
+    Get a JPEG thumbnail of a variant, at most size pixels on each side.
+    """
+    _check_thumbnail_size(size)
+    thumbnail = GeneratorService(
+        db=db, storage_path=STORAGE_PATH
+    ).get_modification_thumbnail(modification_id, size)
+    return _immutable_response(request, thumbnail)
+
+
+@router.get("/stats", response_model=StatsResponse)
+def get_stats() -> StatsResponse:
+    """
+    Get per-process cache and CPU executor statistics.
+    """
+    return StatsResponse(
+        caches={
+            "decoded_originals": CacheStats(**decoded_originals.stats()),
+            "mapped_originals": CacheStats(**mapped_originals.stats()),
+            "rendered_variants": CacheStats(**rendered_variants.stats()),
+        },
+        executors={"cpu": ExecutorStats(**cpu_executor.stats())},
+    )
+
+
+def _check_thumbnail_size(size: int) -> None:
+    if size not in THUMBNAIL_SIZES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Thumbnail size must be one of {sorted(THUMBNAIL_SIZES)}",
+        )
+
+
+def _immutable_response(request: Request, thumbnail: Thumbnail) -> Response:
+    """
+    Respond with content that never changes for its URL, or with
+    304 Not Modified when the client already has it.
+    """
+    headers = {"ETag": thumbnail.etag, "Cache-Control": IMMUTABLE_CACHE_CONTROL}
+    if _etag_matches(request.headers.get("if-none-match"), thumbnail.etag):
+        return Response(status_code=304, headers=headers)
+
+    return Response(
+        content=thumbnail.content, media_type=thumbnail.media_type, headers=headers
+    )
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+
+def _check_upload_size(file: UploadFile) -> None:
+    size = file.size
+    if size is None:
+        size = file.file.seek(0, os.SEEK_END)
+
+    if MAX_UPLOAD_BYTES and size > MAX_UPLOAD_BYTES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"File has {size} bytes, at most {MAX_UPLOAD_BYTES} are allowed",
+        )
+
+
+def _upload_pixels(file: IO[bytes]) -> int:
+    """
+    Pixel count the upload will be decoded at, read from its header.
+    """
+    try:
+        file.seek(0)
+        pixels = image_pixels(file)
+    except UnidentifiedImageError:
+        raise HTTPException(status_code=400, detail="File is not a readable image")
+    except DecompressionBombError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+    if MAX_UPLOAD_PIXELS:
+        return min(pixels, MAX_UPLOAD_PIXELS)
+    return pixels
+
+
+def _generate_upload_variants(upload: PreparedUpload, job: UploadJob) -> UploadResponse:
+    with SessionLocal() as db:
+        service = GeneratorService(
+            db=db,
+            storage_path=STORAGE_PATH,
+            generation_workers=GENERATION_WORKERS,
+            variant_storage=VARIANT_STORAGE,
+            variant_codec=VARIANT_CODEC,
+            png_compress_level=PNG_COMPRESS_LEVEL,
+        )
+        try:
+            return service.generate_upload_variants(
+                upload,
+                modification_algorithm=MODIFICATION_ALGORITHM,
+                on_variant=lambda _: job.advance(),
+            )
+        except Exception:
+            db.rollback()
+            service.discard_upload(upload)
+            raise
+
+
+def _get_upload_job(job_id: str) -> UploadJob:
+    job = upload_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job
+
+
+def _decode_image_cursor(cursor: str) -> int:
+    try:
+        return int(cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid cursor: {cursor}")
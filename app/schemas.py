@@ -1,7 +1,7 @@
 import datetime as dt
 from typing import Optional
 
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, Field
 
 
 class Paths(BaseModel):
@@ -11,6 +11,18 @@ class Paths(BaseModel):
     og_image_path: str
 
 
+class VariantImage(BaseModel):
+    path: Optional[str] = None
+    content: Optional[bytes] = None
+    media_type: str = "image/png"
+
+
+class Thumbnail(BaseModel):
+    content: bytes
+    etag: str
+    media_type: str = "image/jpeg"
+
+
 class Modification(BaseModel):
     model_config = ConfigDict(from_attributes=True)
     id: int
@@ -26,10 +38,47 @@ class UploadResponse(BaseModel):
     modifications: list[Modification]
 
 
+class JobResponse(BaseModel):
+    id: str
+    image_id: int
+    status: str
+    total_variants: int
+    completed_variants: int
+    created_at: dt.datetime
+    finished_at: Optional[dt.datetime] = None
+    result: Optional[UploadResponse] = None
+    error: Optional[str] = None
+
+
 class ReverseImageRequest(BaseModel):
     should_save_reversed_img: bool = False
 
 
+class ClaimRequest(BaseModel):
+    worker_id: str
+    limit: int = Field(default=100, ge=1, le=1000)
+    lease_seconds: int = Field(default=300, ge=1)
+    wait_seconds: float = Field(default=0, ge=0, le=60)
+
+
+class ClaimResponse(BaseModel):
+    worker_id: str
+    lease_expires_at: dt.datetime
+    modification_ids: list[int]
+
+
+class ReverseBatchRequest(BaseModel):
+    modification_ids: list[int]
+    should_save_reversed_img: bool = False
+
+
+class ReverseBatchItem(BaseModel):
+    modification_id: int
+    is_reversible: Optional[bool] = None
+    reversed_path: Optional[str] = None
+    error: Optional[str] = None
+
+
 class ReverseModificationResponse(BaseModel):
     modification_id: int
     message: str
@@ -43,6 +92,8 @@ class ModificationResponse(BaseModel):
     id: int
     image_id: int
     modified_image_path: str
+    storage_mode: str
+    codec: str
     modification_algorithm: str
     num_modifications: int
     verification_status: str
@@ -53,8 +104,37 @@ class ModificationResponse(BaseModel):
 class ImageListResponse(BaseModel):
     id: int
     original_image_path: str
+    digest: Optional[str] = None
     created_at: dt.datetime
 
 
 class ImageDetailResponse(ImageListResponse):
     modifications: list[ModificationResponse]
+
+
+class CacheStats(BaseModel):
+    entries: int
+    current_bytes: int
+    max_bytes: int
+    hits: int
+    misses: int
+    evictions: int
+
+
+class ExecutorStats(BaseModel):
+    workers: int
+    running: int
+    queued_jobs: int
+    queued_cost: int
+    max_queued_jobs: int
+    max_queued_cost: int
+    completed: int
+    rejected: int
+    avg_wait_seconds: float
+    max_wait_seconds: float
+    avg_run_seconds: float
+
+
+class StatsResponse(BaseModel):
+    caches: dict[str, CacheStats]
+    executors: dict[str, ExecutorStats]
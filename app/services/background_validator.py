@@ -1,96 +1,345 @@
+"""
+Background validation of pending modifications.
+
+BackgroundValidator talks to the API over HTTP. DirectValidator
+(``--direct``) claims and reverses modifications in process through
+SessionLocal and GeneratorService, and can also run inside the API
+process (APP_VALIDATOR_MODE=embedded).
+
+Usage:
+    python -m app.services.background_validator [--direct]
+"""
+import argparse
+import json
 import os
+import socket
+import threading
 import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
 
 import requests
+from fastapi import HTTPException
+from requests.adapters import HTTPAdapter
+from sqlalchemy.orm import Session
 from tenacity import retry, stop_after_attempt, wait_exponential
 
+from app.database import SessionLocal
+from app.services.cpu_executor import CPUExecutor
+from app.services.generator_service import GeneratorService
+from app.services.modification_leases import claim_modifications, pending_modifications
 from app.utils.logging import get_json_logger
 
 
-class BackgroundValidator:
-    def __init__(self, api_endpoint: str):
-        self.api_endpoint = api_endpoint
-        self.log = get_json_logger("app.services.BackgroundValidator")
+class BaseValidator(ABC):
+    """
+    Claim-and-validate loop shared by the HTTP and in-process validators.
+    Subclasses implement claim_modifications and validate_modifications_batch.
+    """
 
-        if not self.api_endpoint:
-            raise ValueError("APP_API_ENDPOINT is not set")
+    def __init__(
+        self,
+        max_in_flight: int = 4,
+        batch_size: int = 25,
+        worker_id: str | None = None,
+        lease_seconds: int = 300,
+    ):
+        self.max_in_flight = max(1, max_in_flight)
+        self.batch_size = max(1, batch_size)
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.lease_seconds = lease_seconds
+        self.stop_event = threading.Event()
+        self.log = get_json_logger(f"app.services.{type(self).__name__}")
 
-    def run(self, poll_interval: int = 5) -> None:
+    def run(self, wait_seconds: float = 30) -> None:
+        """
+        Claim and validate modifications until stopped. Each claim
+        waits up to wait_seconds for new uploads, so they are picked
+        up as soon as they are committed without polling while idle.
+        """
         self.log.info(
-            f"Polling database every {poll_interval} seconds"
-            f"using api {self.api_endpoint}"
+            f"Waiting for modifications up to {wait_seconds} seconds per claim "
+            f"as worker {self.worker_id}"
         )
 
-        while True:
-            modifications = self.get_pending_modifications()
-            self.log.info(f"Fetched {len(modifications)} pending modifications")
+        while not self.stop_event.is_set():
+            ids = self.claim_modifications(wait_seconds=wait_seconds)
+            self.log.info(f"Claimed {len(ids)} modifications")
+
+            if len(ids) > 0:
+                self.validate_pending(ids)
 
-            if len(modifications) > 0:
-                for m in modifications:
-                    id = int(m.get("id", ""))
+    def stop(self) -> None:
+        self.stop_event.set()
 
-                    response = self.validate_modification(id)
-                    is_reversible = response.get("is_reversible")
+    @abstractmethod
+    def claim_modifications(
+        self, limit: int = 100, wait_seconds: float = 0
+    ) -> list[int]:
+        """
+        Claim up to limit pending modifications for this worker, waiting up
+        to wait_seconds for new ones when none are pending.
+        """
+
+    @abstractmethod
+    def validate_modifications_batch(
+        self, modification_ids: list[int], should_save_reversed_img: bool = False
+    ) -> list[dict[str, Any]]:
+        """
+        Reverse and verify modifications, returning one ReverseBatchItem
+        dict per id.
+        """
 
+    def validate_pending(self, ids: list[int]) -> int:
+        """
+        Validate modifications in batches of batch_size, with up to
+        max_in_flight batch requests running at once.
+        Returns the number of modifications verified in this cycle.
+        """
+        started_at = time.perf_counter()
+        batches = []
+        for start in range(0, len(ids), self.batch_size):
+            end = start + self.batch_size
+            batches.append(ids[start:end])
+        verified = 0
+
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as pool:
+            for results in pool.map(self.validate_modifications_batch, batches):
+                for result in results:
+                    id = result.get("modification_id")
+                    if result.get("error"):
+                        self.log.error(f"Failed to verify mod {id}: {result['error']}")
+                        continue
+
+                    verified += 1
+                    is_reversible = result.get("is_reversible")
                     self.log.info(f"Verified mod {id}, is_reversible: {is_reversible}")
 
-            time.sleep(poll_interval)
+        elapsed = time.perf_counter() - started_at
+        self.log.info(
+            f"Verified {verified}/{len(ids)} modifications in {elapsed:.2f}s "
+            f"({verified / elapsed:.1f}/s, {len(batches)} batches)"
+        )
+        return verified
+
+
+class BackgroundValidator(BaseValidator):
+    def __init__(self, api_endpoint: str, **kwargs: Any):
+        super().__init__(**kwargs)
+        self.api_endpoint = api_endpoint
+
+        if not self.api_endpoint:
+            raise ValueError("APP_API_ENDPOINT is not set")
+
+        self.log.info(f"Using api {self.api_endpoint}")
+
+        # Keep-alive connections shared by all in-flight requests
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_in_flight)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
 
     @retry(
         stop=stop_after_attempt(5),
         wait=wait_exponential(multiplier=2, min=10, max=20),
         reraise=True,
     )
-    def get_pending_modifications(
-        self,
-        skip: int = 0,
-        limit: int = 100,
-        status: str = "pending",
-    ) -> list[dict[str, int | str]]:
+    def claim_modifications(
+        self, limit: int = 100, wait_seconds: float = 0
+    ) -> list[int]:
         """
-        Fetches pending modifications from api.
+        Claims a batch of pending modifications for this worker, waiting up
+        to wait_seconds for new ones when none are pending.
+        Claimed rows are leased, so other validators skip them until the
+        lease expires.
         """
-        url = f"{self.api_endpoint}/api/modifications"
+        url = f"{self.api_endpoint}/api/modifications/claim"
 
-        params: dict[str, int | str] = {
-            "skip": skip,
+        payload: dict[str, int | float | str] = {
+            "worker_id": self.worker_id,
             "limit": limit,
-            "status": status,
+            "lease_seconds": self.lease_seconds,
+            "wait_seconds": wait_seconds,
         }
 
-        response = requests.get(url, params=params, timeout=60)
+        response = self.session.post(url, json=payload, timeout=60 + wait_seconds)
         response.raise_for_status()
 
-        return response.json()
+        return response.json()["modification_ids"]
 
     @retry(
         stop=stop_after_attempt(5),
         wait=wait_exponential(multiplier=2, min=10, max=20),
         reraise=True,
     )
-    def validate_modification(
-        self, modification_id: int, should_save_reversed_img: bool = False
-    ) -> dict[str, str]:
+    def validate_modifications_batch(
+        self, modification_ids: list[int], should_save_reversed_img: bool = False
+    ) -> list[dict[str, Any]]:
         """
-        Validate a modification by calling the reverse endpoint.
+        Validate several modifications with one call to the batch reverse endpoint.
+        The endpoint streams one JSON result per line.
         """
-        url = f"{self.api_endpoint}/api/modifications/{modification_id}/reverse/"
+        url = f"{self.api_endpoint}/api/modifications/reverse-batch"
 
-        payload = {"should_save_reversed_img": should_save_reversed_img}
+        payload = {
+            "modification_ids": modification_ids,
+            "should_save_reversed_img": should_save_reversed_img,
+        }
 
         try:
-            response = requests.post(url, json=payload, timeout=60)
+            response = self.session.post(url, json=payload, timeout=60, stream=True)
             response.raise_for_status()
+            return [json.loads(line) for line in response.iter_lines() if line]
         except requests.RequestException as e:
-            self.log.error(f"Failed to validate modification {modification_id}: {e}")
+            self.log.error(
+                f"Failed to validate {len(modification_ids)} modifications: {e}"
+            )
             raise RuntimeError(
-                f"Failed to validate modification {modification_id}: {e}"
+                f"Failed to validate {len(modification_ids)} modifications: {e}"
             ) from e
 
-        return response.json()
+
+class DirectValidator(BaseValidator):
+    """
+    Validator that uses the database and GeneratorService in process,
+    without HTTP. Every claim and batch uses its own session, so batches
+    can run concurrently. Inside the API process (embedded) it long-polls
+    for uploads and is given the shared CPU executor, so reversals go
+    through the same admission control as requests. Run on its own, it
+    cannot be woken by uploads to the API and polls every poll_seconds.
+    """
+
+    def __init__(
+        self,
+        storage_path: str,
+        verification_mode: str = "region",
+        reverse_workers: int = 4,
+        session_factory: Callable[[], Session] = SessionLocal,
+        executor: Optional[CPUExecutor] = None,
+        embedded: bool = False,
+        poll_seconds: float = 5,
+        **kwargs: Any,
+    ):
+        super().__init__(**kwargs)
+        self.storage_path = storage_path
+        self.verification_mode = verification_mode
+        self.reverse_workers = reverse_workers
+        self.session_factory = session_factory
+        self.executor = executor
+        self.embedded = embedded
+        self.poll_seconds = poll_seconds
+
+    def stop(self) -> None:
+        super().stop()
+        # wake a claim that is waiting for new uploads
+        pending_modifications.notify()
+
+    def claim_modifications(
+        self, limit: int = 100, wait_seconds: float = 0
+    ) -> list[int]:
+        """
+        Claims a batch of pending modifications for this worker. Embedded,
+        the wait is woken by uploads committed in the API process. Otherwise
+        uploads cannot wake it, so when nothing is pending it sleeps for at
+        most poll_seconds and returns, and the next claim polls again.
+        """
+        with self.session_factory() as db:
+            ids = claim_modifications(
+                db,
+                worker_id=self.worker_id,
+                limit=limit,
+                lease_seconds=self.lease_seconds,
+                wait_seconds=wait_seconds if self.embedded else 0,
+                stop_event=self.stop_event,
+            ).modification_ids
+
+        if not ids and not self.embedded:
+            self.stop_event.wait(min(wait_seconds, self.poll_seconds))
+        return ids
+
+    def validate_modifications_batch(
+        self, modification_ids: list[int], should_save_reversed_img: bool = False
+    ) -> list[dict[str, Any]]:
+        """
+        Reverse and verify a batch of modifications with GeneratorService.
+        """
+        with self.session_factory() as db:
+            service = GeneratorService(
+                db=db,
+                storage_path=self.storage_path,
+                verification_mode=self.verification_mode,
+                reverse_workers=self.reverse_workers,
+                executor=self.executor,
+            )
+            if self.executor is not None and not self._wait_for_capacity(
+                self.executor, service.estimate_reversal_cost(modification_ids)
+            ):
+                return []
+            return [
+                item.model_dump()
+                for item in service.reverse_modifications_batch(
+                    modification_ids, should_save_reversed_img
+                )
+            ]
+
+    def _wait_for_capacity(self, executor: CPUExecutor, cost: int) -> bool:
+        """
+        Wait until the executor would admit a batch of this cost, backing
+        off for its Retry-After while it is full, like an HTTP client of
+        the batch endpoint would.
+        Returns False if the validator was stopped while waiting.
+        """
+        while not self.stop_event.is_set():
+            try:
+                executor.check_capacity(cost)
+                return True
+            except HTTPException as e:
+                retry_after = float((e.headers or {}).get("Retry-After", "1"))
+                self.log.info(f"CPU executor is full, retrying in {retry_after}s")
+                self.stop_event.wait(retry_after)
+        return False
+
+
+def validator_from_env(
+    direct: bool, executor: Optional[CPUExecutor] = None, embedded: bool = False
+) -> BaseValidator:
+    """
+    Build a validator configured from APP_* environment variables.
+    A direct validator runs its reversals on executor when given, and
+    long-polls for uploads when embedded in the API process.
+    """
+    options: dict[str, Any] = {
+        "max_in_flight": int(os.getenv("APP_VALIDATOR_MAX_IN_FLIGHT", "4")),
+        "batch_size": int(os.getenv("APP_VALIDATOR_BATCH_SIZE", "25")),
+        "lease_seconds": int(os.getenv("APP_VALIDATOR_LEASE_SECONDS", "300")),
+    }
+
+    if direct:
+        return DirectValidator(
+            storage_path=os.getenv("APP_STORAGE_BASE_PATH", "storage"),
+            verification_mode=os.getenv("APP_VERIFICATION_MODE", "region"),
+            reverse_workers=int(os.getenv("APP_REVERSE_WORKERS", "4")),
+            executor=executor,
+            embedded=embedded,
+            poll_seconds=float(os.getenv("APP_VALIDATOR_POLL_SECONDS", "5")),
+            **options,
+        )
+
+    return BackgroundValidator(
+        api_endpoint=os.getenv("APP_API_ENDPOINT", "").rstrip("/"), **options
+    )
 
 
 if __name__ == "__main__":
-    BackgroundValidator(
-        api_endpoint=os.getenv("APP_API_ENDPOINT", "").rstrip("/")
-    ).run()
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--direct",
+        action="store_true",
+        help="use the database directly instead of the HTTP API",
+    )
+    args = parser.parse_args()
+
+    validator_from_env(direct=args.direct).run(
+        wait_seconds=float(os.getenv("APP_VALIDATOR_WAIT_SECONDS", "30"))
+    )
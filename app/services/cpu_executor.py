@@ -0,0 +1,198 @@
+"""
+Server-wide executor for CPU-heavy work, so concurrent uploads and
+reversals share a fixed number of threads instead of each taking one
+from the default pool.
+
+Each submission carries a cost, the number of pixels it will touch.
+Submissions are rejected with 503 and a Retry-After estimate while the
+queued cost or the number of queued jobs is over budget.
+"""
+import asyncio
+import math
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Optional, TypedDict, TypeVar
+
+from fastapi import HTTPException
+
+from app.utils.logging import get_json_logger
+
+T = TypeVar("T")
+
+log = get_json_logger("app.services.cpu_executor")
+
+CPU_WORKERS = int(os.getenv("APP_CPU_WORKERS", str(os.cpu_count() or 1)))
+MAX_QUEUED_JOBS = int(os.getenv("APP_MAX_QUEUED_JOBS", "32"))
+MAX_QUEUED_COST = int(os.getenv("APP_MAX_QUEUED_COST", str(2_000_000_000)))
+
+
+class CPUExecutorStats(TypedDict):
+    workers: int
+    running: int
+    queued_jobs: int
+    queued_cost: int
+    max_queued_jobs: int
+    max_queued_cost: int
+    completed: int
+    rejected: int
+    avg_wait_seconds: float
+    max_wait_seconds: float
+    avg_run_seconds: float
+
+
+class CPUExecutor:
+    """
+    Thread pool with a bounded queue, measured in jobs and in cost.
+    A job is always admitted when nothing is queued, however large it is.
+    Tracks queue depth, queue wait and run times.
+    """
+
+    def __init__(self, max_workers: int, max_queued_jobs: int, max_queued_cost: int):
+        self.max_workers = max(1, max_workers)
+        self.max_queued_jobs = max_queued_jobs
+        self.max_queued_cost = max_queued_cost
+        self.queued_jobs = 0
+        self.queued_cost = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.total_run_seconds = 0.0
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def submit(
+        self,
+        fn: Callable[..., T],
+        *args: Any,
+        cost: int,
+        force: bool = False,
+        **kwargs: Any,
+    ) -> "Future[T]":
+        """
+        Queue fn(*args, **kwargs), or raise HTTPException 503 with a
+        Retry-After header when the queue is over budget. Forced
+        submissions skip the budget check, for work that was admitted
+        through check_capacity.
+        """
+        with self._lock:
+            if not force:
+                self._check_capacity(cost)
+
+            self.queued_jobs += 1
+            self.queued_cost += cost
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="cpu"
+                )
+            return self._executor.submit(
+                self._run, time.perf_counter(), cost, fn, *args, **kwargs
+            )
+
+    def check_capacity(self, cost: int) -> None:
+        """
+        Raise HTTPException 503 if a job of this cost would be rejected now,
+        without queueing anything.
+        """
+        with self._lock:
+            self._check_capacity(cost)
+
+    async def run(
+        self, fn: Callable[..., T], *args: Any, cost: int, **kwargs: Any
+    ) -> T:
+        """
+        Like submit, but awaits the result from async code.
+        """
+        return await asyncio.wrap_future(self.submit(fn, *args, cost=cost, **kwargs))
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def stats(self) -> CPUExecutorStats:
+        with self._lock:
+            started = self.completed + self.running
+            return {
+                "workers": self.max_workers,
+                "running": self.running,
+                "queued_jobs": self.queued_jobs,
+                "queued_cost": self.queued_cost,
+                "max_queued_jobs": self.max_queued_jobs,
+                "max_queued_cost": self.max_queued_cost,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "avg_wait_seconds": (
+                    self.total_wait_seconds / started if started else 0
+                ),
+                "max_wait_seconds": self.max_wait_seconds,
+                "avg_run_seconds": (
+                    self.total_run_seconds / self.completed if self.completed else 0
+                ),
+            }
+
+    def _run(
+        self,
+        submitted_at: float,
+        cost: int,
+        fn: Callable[..., T],
+        *args: Any,
+        **kwargs: Any,
+    ) -> T:
+        started_at = time.perf_counter()
+        wait_seconds = started_at - submitted_at
+        with self._lock:
+            self.queued_jobs -= 1
+            self.queued_cost -= cost
+            self.running += 1
+            self.total_wait_seconds += wait_seconds
+            self.max_wait_seconds = max(self.max_wait_seconds, wait_seconds)
+
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self._lock:
+                self.running -= 1
+                self.completed += 1
+                self.total_run_seconds += time.perf_counter() - started_at
+
+    def _check_capacity(self, cost: int) -> None:
+        """
+        Raise HTTPException 503 when a job of this cost does not fit in the
+        queue. Called with the lock held.
+        """
+        if self.queued_jobs == 0 or (
+            self.queued_jobs < self.max_queued_jobs
+            and self.queued_cost + cost <= self.max_queued_cost
+        ):
+            return
+
+        self.rejected += 1
+        retry_after = self._retry_after()
+        log.info(
+            f"Rejected job of cost {cost}, {self.queued_jobs} queued, "
+            f"retry after {retry_after}s"
+        )
+        raise HTTPException(
+            status_code=503,
+            detail="Server is busy, try again later",
+            headers={"Retry-After": str(retry_after)},
+        )
+
+    def _retry_after(self) -> int:
+        """
+        Seconds until the queue is likely to have drained, from the
+        average run time so far. Called with the lock held.
+        """
+        avg_run_seconds = (
+            self.total_run_seconds / self.completed if self.completed else 1.0
+        )
+        pending = self.queued_jobs + self.running
+        return max(1, math.ceil(pending * avg_run_seconds / self.max_workers))
+
+
+cpu_executor = CPUExecutor(CPU_WORKERS, MAX_QUEUED_JOBS, MAX_QUEUED_COST)
@@ -2,109 +2,407 @@
 Service layer for image modification operations.
 Handles business logic for image processing, database operations, and file management.
 """
+import hashlib
 import io
 import json
 import os
 import random
+import shutil
+import tempfile
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
 from datetime import datetime, timezone
+from functools import partial
+from itertools import groupby
 from pathlib import Path
-from typing import Any
+from typing import IO, Any, Callable, Iterator, NamedTuple, Optional
 
+import numpy as np
 from fastapi import HTTPException
 from PIL import Image as PILImage
+from PIL import ImageOps
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session, joinedload
 
 from app.models import DBImage, DBImageModification
-from app.schemas import Modification, Paths, ReverseModificationResponse, UploadResponse
+from app.schemas import (
+    Modification,
+    Paths,
+    ReverseBatchItem,
+    ReverseModificationResponse,
+    Thumbnail,
+    UploadResponse,
+    VariantImage,
+)
+from app.services.cpu_executor import CPUExecutor
 from app.services.image_processor import (
-    apply_pixel_color_modifications,
-    compare_images_by_hash,
-    reverse_pixel_color_modifications,
+    compute_row_digests,
+    decode_modification_params,
+    get_modification_algorithm,
+    image_digest,
+    image_hash,
+    image_pixels,
+    map_raw_image,
+    pixels_hash,
+    render_modifications,
+    reverse_modifications,
+    save_raw_image,
+    verify_region_digests,
+)
+from app.services.modification_leases import MAX_VERIFY_ATTEMPTS, pending_modifications
+from app.services.variant_codecs import (
+    PNG_COMPRESS_LEVEL,
+    get_variant_codec,
+    load_variant,
+)
+from app.services.variant_worker import (
+    SharedImage,
+    VariantResult,
+    VariantTask,
+    get_generation_pool,
+    run_shared_variant_task,
+    run_variant_task,
+    variant_seeds,
+)
+from app.utils.archive_stream import (
+    CHUNK_SIZE,
+    ArchiveEntry,
+    file_chunks,
+    stream_archive,
 )
 from app.utils.logging import get_json_logger
+from app.utils.lru_cache import LRUCache
+
+RENDER_CACHE_BYTES = int(os.getenv("APP_RENDER_CACHE_BYTES", str(256 * 1024 * 1024)))
+
+ORIGINAL_CACHE_BYTES = int(
+    os.getenv("APP_ORIGINAL_CACHE_BYTES", str(512 * 1024 * 1024))
+)
+
+THUMBNAIL_QUALITY = int(os.getenv("APP_THUMBNAIL_QUALITY", "85"))
+
+MAPPED_ORIGINAL_BYTES = int(
+    os.getenv("APP_MAPPED_ORIGINAL_BYTES", str(4 * 1024 * 1024 * 1024))
+)
+
+NUM_VARIANTS = 100
+
+INSERT_CHUNK_BYTES = int(os.getenv("APP_INSERT_CHUNK_BYTES", str(16 * 1024 * 1024)))
+
+EXPORT_BATCH_SIZE = int(os.getenv("APP_EXPORT_BATCH_SIZE", "20"))
+
+# manifests larger than this are spooled to a temporary file while exporting
+MANIFEST_SPOOL_BYTES = 1024 * 1024
+
+
+class CachedOriginal(NamedTuple):
+    """
+    A decoded original, or the memory-mapped pixels of its raw copy.
+    """
+
+    size: tuple[int, int]
+    digest: str
+    image: Optional[PILImage.Image] = None
+    pixels: Optional[np.ndarray] = None
+
+    def to_image(self) -> PILImage.Image:
+        """
+        A new RGB image of the original, which the caller may modify.
+        """
+        if self.pixels is not None:
+            return PILImage.fromarray(self.pixels)
+        assert self.image is not None
+        return self.image.copy()
+
+
+class PreparedUpload(NamedTuple):
+    image_id: int
+    paths: Paths
+    image: PILImage.Image
+    row_digests: list[bytes]
+    digest: str
+
+
+class ReversalJob(NamedTuple):
+    modification_id: int
+    image_id: int
+    original_path: str
+    modified_image_path: str
+    storage_mode: str
+    codec: str
+    modification_algorithm: str
+    modification_params: str
+
+
+rendered_variants: LRUCache[bytes] = LRUCache(RENDER_CACHE_BYTES, sizeof=len)
+# Pillow keeps RGB pixels in 4 bytes each
+decoded_originals: LRUCache[CachedOriginal] = LRUCache(
+    ORIGINAL_CACHE_BYTES,
+    sizeof=lambda original: original.size[0] * original.size[1] * 4,
+)
+# bounded by mapped bytes, which live in the page cache rather than the heap
+mapped_originals: LRUCache[CachedOriginal] = LRUCache(
+    MAPPED_ORIGINAL_BYTES,
+    sizeof=lambda original: original.size[0] * original.size[1] * 3,
+)
+
+
+def raw_original_path(original_path: str) -> str:
+    """
+    Path of the memory-mappable raw copy of an original.
+    """
+    return str(Path(original_path).with_suffix(".npy"))
+
+
+def _isoformat(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value is not None else None
 
 
 class GeneratorService:
-    def __init__(self, db: Session, storage_path: str):
+    def __init__(
+        self,
+        db: Session,
+        storage_path: str,
+        generation_workers: int = 0,
+        variant_storage: str = "file",
+        verification_mode: str = "region",
+        reverse_workers: int = 4,
+        executor: Optional[CPUExecutor] = None,
+        max_upload_pixels: int = 0,
+        variant_codec: str = "png",
+        png_compress_level: int = PNG_COMPRESS_LEVEL,
+        raw_originals: bool = False,
+    ):
         self.db = db
         self.storage_path = storage_path
+        self.generation_workers = generation_workers
+        self.variant_storage = variant_storage
+        self.verification_mode = verification_mode
+        self.reverse_workers = reverse_workers
+        self.executor = executor
+        self.max_upload_pixels = max_upload_pixels
+        self.variant_codec = variant_codec
+        self.png_compress_level = png_compress_level
+        self.raw_originals = raw_originals
         self.log = get_json_logger(__name__)
 
     def process_uploaded_image(
         self,
-        file_contents: bytes,
+        file_contents: bytes | IO[bytes],
         modification_color: tuple[int, int, int] = (0, 255, 0),
+        modification_algorithm: str = "pixel_color",
+        seed: Optional[int] = None,
     ) -> UploadResponse:
         """
         Process an uploaded image and generate 100 variants.
 
+        Variants are generated in a process pool when generation_workers > 1,
+        each with its own generator seeded from the base seed, so the same
+        seed produces the same variants in either mode.
+
+        File-stored variants are written with variant_codec. With
+        variant_storage "delta" only the modification params are stored
+        and variants are rendered from the original on request.
+
+        Uploads whose decoded pixels match an existing image, by content
+        digest, return that image instead of generating new variants.
+
+        With raw_originals an uncompressed copy of the original is written
+        next to original.png, and reversals memory-map it instead of
+        decoding the PNG.
+
         Args:
-            file_contents: Raw image file contents
+            file_contents: Raw image file contents, or a file to read them from
             modification_color: RGB color for modifications (default: green)
+            modification_algorithm: Name of a registered modification algorithm
+            seed: Base seed for reproducible variants (random if not given)
 
         Returns:
             UploadResponse with image_id, message, original_image path,
             and modifications list
         """
+        upload = self.prepare_upload(file_contents, modification_algorithm)
+        if isinstance(upload, UploadResponse):
+            return upload
+
+        return self.generate_upload_variants(
+            upload,
+            modification_color=modification_color,
+            modification_algorithm=modification_algorithm,
+            seed=seed,
+        )
+
+    def prepare_upload(
+        self,
+        file_contents: bytes | IO[bytes],
+        modification_algorithm: str = "pixel_color",
+    ) -> PreparedUpload | UploadResponse:
+        """
+        Decode an upload, create its image record and save the original,
+        without generating variants. The image record is flushed but not
+        committed, and its digest is only set once the variants exist, so
+        other uploads never deduplicate to an unfinished or failed one.
+
+        Args:
+            file_contents: Raw image file contents, or a file to read them from
+            modification_algorithm: Name of a registered modification algorithm
+
+        Returns:
+            PreparedUpload to pass to generate_upload_variants, or the
+            UploadResponse of an already uploaded image with the same digest
+        """
         self.log.info("Processing image")
+        # fail before anything is stored if the algorithm or codec is unknown
+        get_modification_algorithm(modification_algorithm)
+        get_variant_codec(self.variant_codec)
         og_image = self._load_and_validate_image(file_contents)
-        width, height = og_image.size
-        max_pixels = width * height
 
-        image_record = self._create_image_record()
+        row_digests = compute_row_digests(og_image)
+        digest = image_digest(og_image, row_digests)
+
+        existing_image = self._get_image_by_digest(digest)
+        if existing_image:
+            return self._existing_upload_response(existing_image)
 
+        image_record = self._create_image_record()
         paths = self._prepare_storage_paths(image_record.id)
 
         og_image.save(paths.og_image_path, "PNG")
+        if self.raw_originals:
+            save_raw_image(og_image, raw_original_path(paths.og_image_path))
 
         image_record.original_image_path = paths.og_image_path
 
-        created_modifications: list[Modification] = []
+        return PreparedUpload(
+            image_id=image_record.id,
+            paths=paths,
+            image=og_image,
+            row_digests=row_digests,
+            digest=digest,
+        )
 
-        for variant_num in range(100):
-            num_modifications = random.randint(100, min(max_pixels, 1000000))
+    def generate_upload_variants(
+        self,
+        upload: PreparedUpload,
+        modification_color: tuple[int, int, int] = (0, 255, 0),
+        modification_algorithm: str = "pixel_color",
+        seed: Optional[int] = None,
+        on_variant: Optional[Callable[[int], None]] = None,
+    ) -> UploadResponse:
+        """
+        Generate and store the 100 variants of a prepared upload, then set
+        the image digest and commit.
 
-            self.log.info(
-                f"Creating {num_modifications} modifications, "
-                f"image_id: {image_record.id}, variant: {variant_num}"
-            )
+        Rows are inserted in bulk, in chunks of about INSERT_CHUNK_BYTES of
+        modification params, so params are not kept in the session.
+
+        If the same image finished uploading meanwhile, this upload is
+        discarded and the existing image is returned instead.
+
+        Args:
+            upload: Upload returned by prepare_upload
+            modification_color: RGB color for modifications (default: green)
+            modification_algorithm: Name of a registered modification algorithm
+            seed: Base seed for reproducible variants (random if not given)
+            on_variant: Called with each variant number once it is generated
 
-            modified_path, modification_params = self._generate_and_save_variant(
-                original_image=og_image,
+        Returns:
+            UploadResponse with image_id, message, original_image path,
+            and modifications list
+        """
+        width, height = upload.image.size
+        max_pixels = width * height
+
+        rng = random.Random(seed)
+        tasks = [
+            VariantTask(
                 variant_num=variant_num,
-                num_modifications=num_modifications,
-                modified_folder=paths.modified_folder,
+                num_modifications=rng.randint(100, min(max_pixels, 1000000)),
+                seed=variant_seed,
+                modified_folder=upload.paths.modified_folder,
                 modification_color=modification_color,
+                modification_algorithm=modification_algorithm,
+                storage_mode=self.variant_storage,
+                codec=self.variant_codec,
+                compress_level=self.png_compress_level,
+            )
+            for variant_num, variant_seed in enumerate(
+                variant_seeds(rng.getrandbits(64), NUM_VARIANTS)
             )
+        ]
 
-            modification_record = DBImageModification(
-                image_id=image_record.id,
-                modified_image_path=modified_path,
-                modification_algorithm=modification_params["algorithm"],
-                modification_params=json.dumps(modification_params),
-                num_modifications=modification_params["num_modifications"],
-                verification_status="pending",
+        created_modifications: list[Modification] = []
+        pending_results: list[VariantResult] = []
+        pending_bytes = 0
+
+        for task, result in zip(
+            tasks, self._generate_variants(upload.image, tasks, upload.row_digests)
+        ):
+            self.log.info(
+                f"Created {task.num_modifications} modifications, "
+                f"image_id: {upload.image_id}, variant: {task.variant_num}"
             )
-            self.db.add(modification_record)
-            self.db.flush()
 
-            created_modifications.append(
-                Modification(
-                    id=modification_record.id,
-                    variant_num=variant_num,
-                    num_modifications=num_modifications,
+            pending_results.append(result)
+            pending_bytes += len(result.modification_params)
+            if pending_bytes >= INSERT_CHUNK_BYTES:
+                created_modifications += self._insert_modifications(
+                    upload.image_id, pending_results
                 )
+                pending_results = []
+                pending_bytes = 0
+
+            if on_variant is not None:
+                on_variant(task.variant_num)
+
+        if pending_results:
+            created_modifications += self._insert_modifications(
+                upload.image_id, pending_results
             )
 
-        self.db.commit()
+        try:
+            self.db.execute(
+                update(DBImage)
+                .where(DBImage.id == upload.image_id)
+                .values(digest=upload.digest)
+            )
+            self.db.commit()
+        except IntegrityError:
+            # a concurrent upload of the same image committed first
+            self.db.rollback()
+            existing_image = self._get_image_by_digest(upload.digest)
+            if not existing_image:
+                raise
+            self.discard_upload(upload)
+            return self._existing_upload_response(existing_image)
+
+        pending_modifications.notify()
 
         return UploadResponse(
-            image_id=image_record.id,
-            message="Successfully created 100 image variants",
-            original_image=paths.og_image_path,
+            image_id=upload.image_id,
+            message=f"Successfully created {NUM_VARIANTS} image variants",
+            original_image=upload.paths.og_image_path,
             modifications=created_modifications,
         )
 
+    def discard_upload(self, upload: PreparedUpload) -> None:
+        """
+        Delete a committed upload whose variants could not be generated,
+        so the same image can be uploaded again.
+
+        Args:
+            upload: Upload returned by prepare_upload
+        """
+        self.log.info(f"Discarding upload, image_id: {upload.image_id}")
+        self.db.query(DBImageModification).filter(
+            DBImageModification.image_id == upload.image_id
+        ).delete()
+        self.db.query(DBImage).filter(DBImage.id == upload.image_id).delete()
+        self.db.commit()
+        shutil.rmtree(upload.paths.image_folder, ignore_errors=True)
+
     def reverse_modification(
         self,
         modification_id: int,
@@ -130,25 +428,14 @@ class GeneratorService:
             original_path, modification_id
         )
 
-        modified_image = self._load_modified_image(modification.modified_image_path)
-
-        modification_params = self._parse_and_convert_modification_params(
-            modification.modification_params
+        is_reversible = self._run_reversal(
+            self._reversal_job(modification), should_save_reversed_img
         )
 
-        reversed_image = reverse_pixel_color_modifications(
-            modified_image, modification_params
-        )
-
-        if should_save_reversed_img:
-            reversed_image.save(reversed_path, "PNG")
-
-        og_image = PILImage.open(original_path)
-        # is_reversible = compare_images_pixelwise(og_image, reversed_image)
-        is_reversible = compare_images_by_hash(og_image, reversed_image)
-
         modification.verification_status = "true" if is_reversible else "false"
         modification.verified_at = datetime.now(timezone.utc)
+        modification.lease_owner = None
+        modification.lease_expires_at = None
         self.db.commit()
 
         return ReverseModificationResponse(
@@ -160,27 +447,561 @@ class GeneratorService:
             is_reversible=is_reversible,
         )
 
-    def _load_and_validate_image(self, file_contents: bytes) -> PILImage.Image:
+    def reverse_modifications_batch(
+        self,
+        modification_ids: list[int],
+        should_save_reversed_img: bool = False,
+    ) -> Iterator[ReverseBatchItem]:
+        """
+        Reverse several modifications, yielding a result per id as it completes.
+
+        Modifications are grouped by image so each original that is needed
+        is decoded once per group. Reversals run on the service's executor,
+        or in a pool of reverse_workers threads without one, and all
+        verification results are written with one bulk UPDATE at the end.
+        Claimed modifications that fail are released for another claim,
+        or marked "error" once their last attempt has failed.
+
+        Args:
+            modification_ids: IDs of the modifications to reverse
+            should_save_reversed_img: Whether to save the reversed images to disk
+
+        Returns:
+            Iterator of ReverseBatchItem, with an error for unknown ids
+            and failed reversals
+        """
+        modifications = (
+            self.db.query(DBImageModification)
+            .options(joinedload(DBImageModification.image))
+            .filter(DBImageModification.id.in_(modification_ids))
+            .order_by(DBImageModification.image_id, DBImageModification.id)
+            .all()
+        )
+        jobs = [self._reversal_job(modification) for modification in modifications]
+        self.log.info(f"Reversing {len(jobs)} modifications in batch")
+
+        found_ids = {job.modification_id for job in jobs}
+        for modification_id in dict.fromkeys(modification_ids):
+            if modification_id not in found_ids:
+                yield ReverseBatchItem(
+                    modification_id=modification_id,
+                    error=f"Modification {modification_id} not found",
+                )
+
+        claimed_attempts = {
+            modification.id: modification.verify_attempts
+            for modification in modifications
+            if modification.verification_status == "in_progress"
+        }
+        updates: list[dict[str, Any]] = []
+        try:
+            with self._reversal_pool() as submit:
+                for (image_id, original_path), group in groupby(
+                    jobs, key=lambda job: (job.image_id, job.original_path)
+                ):
+                    group_jobs = list(group)
+                    original = None
+                    try:
+                        if self.verification_mode == "strict" or any(
+                            job.storage_mode == "delta" for job in group_jobs
+                        ):
+                            original = self._load_original(image_id, original_path)
+                    except Exception as e:
+                        self.log.error(f"Failed to load original {original_path}: {e}")
+                        for job in group_jobs:
+                            updates.extend(
+                                self._failed_reversal_updates(
+                                    job.modification_id, claimed_attempts
+                                )
+                            )
+                            yield ReverseBatchItem(
+                                modification_id=job.modification_id, error=str(e)
+                            )
+                        continue
+
+                    cost = self._original_pixels(original_path)
+                    futures = {
+                        submit(
+                            self._run_reversal,
+                            job,
+                            should_save_reversed_img,
+                            original,
+                            cost=cost,
+                        ): job
+                        for job in group_jobs
+                    }
+                    for future in as_completed(futures):
+                        job = futures[future]
+                        try:
+                            is_reversible = future.result()
+                        except Exception as e:
+                            self.log.error(
+                                f"Failed to reverse modification "
+                                f"{job.modification_id}: {e}"
+                            )
+                            updates.extend(
+                                self._failed_reversal_updates(
+                                    job.modification_id, claimed_attempts
+                                )
+                            )
+                            yield ReverseBatchItem(
+                                modification_id=job.modification_id, error=str(e)
+                            )
+                            continue
+
+                        updates.append(
+                            {
+                                "id": job.modification_id,
+                                "verification_status": (
+                                    "true" if is_reversible else "false"
+                                ),
+                                "verified_at": datetime.now(timezone.utc),
+                                "lease_owner": None,
+                                "lease_expires_at": None,
+                            }
+                        )
+                        yield ReverseBatchItem(
+                            modification_id=job.modification_id,
+                            is_reversible=is_reversible,
+                            reversed_path=(
+                                self._prepare_reversed_image_path(
+                                    job.original_path, job.modification_id
+                                )
+                                if should_save_reversed_img
+                                else None
+                            ),
+                        )
+        finally:
+            if updates:
+                self.db.execute(update(DBImageModification), updates)
+                self.db.commit()
+
+    @staticmethod
+    def _failed_reversal_updates(
+        modification_id: int, claimed_attempts: dict[int, int]
+    ) -> list[dict[str, Any]]:
+        """
+        Status update for a modification whose reversal failed. A claimed
+        one goes back to "pending", or to "error" after MAX_VERIFY_ATTEMPTS
+        claims, and its lease is cleared. Unclaimed ones are left as they are.
+
+        Args:
+            modification_id: ID of the failed modification
+            claimed_attempts: Claim count of each in-progress modification
+
+        Returns:
+            A bulk UPDATE row, or none
+        """
+        if modification_id not in claimed_attempts:
+            return []
+
+        exhausted = claimed_attempts[modification_id] >= MAX_VERIFY_ATTEMPTS
+        return [
+            {
+                "id": modification_id,
+                "verification_status": "error" if exhausted else "pending",
+                "verified_at": datetime.now(timezone.utc) if exhausted else None,
+                "lease_owner": None,
+                "lease_expires_at": None,
+            }
+        ]
+
+    def estimate_reversal_cost(self, modification_ids: list[int]) -> int:
+        """
+        Estimate the CPU cost of reversing modifications, as the total
+        number of pixels of their originals, read from the image headers.
+        Originals that cannot be read count as 0, so their reversals fail
+        on their own instead of failing admission.
+
+        Args:
+            modification_ids: IDs of the modifications to reverse
+
+        Returns:
+            Total pixel count, 0 for unknown ids
+        """
+        originals = (
+            self.db.query(DBImage.original_image_path, func.count())
+            .join(DBImageModification, DBImageModification.image_id == DBImage.id)
+            .filter(DBImageModification.id.in_(modification_ids))
+            .group_by(DBImage.id, DBImage.original_image_path)
+            .all()
+        )
+        return sum(
+            self._original_pixels(original_path) * count
+            for original_path, count in originals
+        )
+
+    def get_modification_image(self, modification_id: int) -> VariantImage:
+        """
+        Get the variant image of a modification.
+
+        Variants stored in a format browsers display are returned by path.
+        Delta-stored variants are rendered from the original, and variants in
+        other formats are decoded, and both are cached as PNG bytes.
+
+        Args:
+            modification_id: ID of the modification
+
+        Returns:
+            VariantImage with either path or PNG content, and its media type
+        """
+        modification = self._get_modification_with_image(modification_id)
+
+        codec = get_variant_codec(modification.codec)
+        if modification.storage_mode != "delta" and codec.browser_native:
+            if not os.path.exists(modification.modified_image_path):
+                raise HTTPException(
+                    status_code=404,
+                    detail=f"Modified image not found: "
+                    f"{modification.modified_image_path}",
+                )
+            return VariantImage(
+                path=modification.modified_image_path, media_type=codec.media_type
+            )
+
+        content = rendered_variants.get(modification_id)
+        if content is None:
+            if modification.storage_mode == "delta":
+                modified_image = self._render_modified_image(
+                    modification.image_id,
+                    modification.image.original_image_path,
+                    modification.modification_algorithm,
+                    self._parse_and_convert_modification_params(
+                        modification.modification_params
+                    ),
+                )
+            else:
+                modified_image = self._load_modified_image(
+                    modification.modified_image_path, modification.codec
+                )
+            buffer = io.BytesIO()
+            modified_image.save(buffer, "PNG")
+            content = buffer.getvalue()
+            rendered_variants.put(modification_id, content)
+
+        return VariantImage(content=content)
+
+    def get_image_thumbnail(self, image_id: int, size: int) -> Thumbnail:
+        """
+        Get a JPEG thumbnail of an original that fits in size x size pixels,
+        rendered on first request and cached on disk next to the original.
+
+        Args:
+            image_id: ID of the image
+            size: Maximum width and height of the thumbnail
+
+        Returns:
+            Thumbnail with JPEG content and a strong ETag
+
+        Raises:
+            HTTPException: If image not found
+        """
+        image = self.db.get(DBImage, image_id)
+        if not image or not image.original_image_path:
+            raise HTTPException(status_code=404, detail=f"Image {image_id} not found")
+
+        return self._cached_thumbnail(
+            self._thumbnail_path(image.original_image_path, f"original_{size}"),
+            lambda: self._load_original(image_id, image.original_image_path).to_image(),
+            size,
+        )
+
+    def get_modification_thumbnail(self, modification_id: int, size: int) -> Thumbnail:
+        """
+        Get a JPEG thumbnail of a variant that fits in size x size pixels,
+        rendered on first request and cached on disk next to the original.
+
+        Args:
+            modification_id: ID of the modification
+            size: Maximum width and height of the thumbnail
+
+        Returns:
+            Thumbnail with JPEG content and a strong ETag
+
+        Raises:
+            HTTPException: If modification not found
+        """
+        modification = self._get_modification_with_image(modification_id)
+        job = self._reversal_job(modification)
+
+        def render() -> PILImage.Image:
+            if job.storage_mode == "delta":
+                return self._render_modified_image(
+                    job.image_id,
+                    job.original_path,
+                    job.modification_algorithm,
+                    self._parse_and_convert_modification_params(
+                        job.modification_params
+                    ),
+                )
+            return self._load_modified_image(job.modified_image_path, job.codec)
+
+        return self._cached_thumbnail(
+            self._thumbnail_path(
+                job.original_path, f"modification_{modification_id}_{size}"
+            ),
+            render,
+            size,
+        )
+
+    def export_image(self, image_id: int, archive_format: str) -> Iterator[bytes]:
+        """
+        Stream a ZIP or tar archive of all variants of an image, with a
+        manifest.json of their modification metadata at the end.
+
+        Stored variants are copied from disk in chunks, deflated only when
+        their codec does not compress. Delta-stored variants are rendered one
+        at a time. Modifications are fetched EXPORT_BATCH_SIZE rows at a time
+        and the manifest is spooled to disk, so memory use does not grow with
+        the number of variants.
+
+        Args:
+            image_id: ID of the image
+            archive_format: "zip" or "tar"
+
+        Returns:
+            Iterator of archive chunks
+
+        Raises:
+            HTTPException: If image not found
+        """
+        image = self.db.get(DBImage, image_id)
+        if not image:
+            raise HTTPException(status_code=404, detail=f"Image {image_id} not found")
+
+        self.log.info(f"Exporting image_id: {image_id} as {archive_format}")
+        return stream_archive(archive_format, self._export_entries(image))
+
+    def _export_entries(self, image: DBImage) -> Iterator[ArchiveEntry]:
+        """
+        Archive entries of an image's variants, followed by the manifest.
+        Variants whose file is missing are listed in the manifest
+        with a null file.
+        """
+        modifications = self.db.scalars(
+            select(DBImageModification)
+            .where(DBImageModification.image_id == image.id)
+            .order_by(DBImageModification.id)
+            .execution_options(yield_per=EXPORT_BATCH_SIZE)
+        )
+
+        with tempfile.SpooledTemporaryFile(max_size=MANIFEST_SPOOL_BYTES) as manifest:
+            image_record = {
+                "id": image.id,
+                "original_image_path": image.original_image_path,
+                "digest": image.digest,
+                "created_at": _isoformat(image.created_at),
+            }
+            # {"image": {...}, "modifications": [...]}, written one
+            # modification at a time
+            manifest.write(b'{"image": ')
+            manifest.write(json.dumps(image_record).encode())
+            manifest.write(b', "modifications": [')
+
+            for count, modification in enumerate(modifications):
+                entry = self._export_entry(modification, image.original_image_path)
+                if entry is not None:
+                    yield entry
+
+                record = {
+                    "id": modification.id,
+                    "file": entry.name if entry is not None else None,
+                    "storage_mode": modification.storage_mode,
+                    "codec": modification.codec,
+                    "modification_algorithm": modification.modification_algorithm,
+                    "modification_params": modification.modification_params,
+                    "num_modifications": modification.num_modifications,
+                    "verification_status": modification.verification_status,
+                    "created_at": _isoformat(modification.created_at),
+                    "verified_at": _isoformat(modification.verified_at),
+                }
+                if count:
+                    manifest.write(b", ")
+                manifest.write(json.dumps(record).encode())
+
+            manifest.write(b"]}")
+            size = manifest.tell()
+            manifest.seek(0)
+            yield ArchiveEntry(
+                name="manifest.json",
+                size=size,
+                chunks=iter(partial(manifest.read, CHUNK_SIZE), b""),
+                compress=True,
+            )
+
+    def _export_entry(
+        self, modification: DBImageModification, original_path: str
+    ) -> Optional[ArchiveEntry]:
+        """
+        Archive entry of one variant under modified/, or None if its file is
+        missing. Delta-stored variants are rendered to PNG.
+        """
+        if modification.storage_mode == "delta":
+            image = self._render_modified_image(
+                modification.image_id,
+                original_path,
+                modification.modification_algorithm,
+                self._parse_and_convert_modification_params(
+                    modification.modification_params
+                ),
+            )
+            buffer = io.BytesIO()
+            image.save(buffer, "PNG", compress_level=self.png_compress_level)
+            content = buffer.getvalue()
+            return ArchiveEntry(
+                name=f"modified/modification_{modification.id}.png",
+                size=len(content),
+                chunks=(content,),
+            )
+
+        path = modification.modified_image_path
+        try:
+            stat_result = os.stat(path)
+        except FileNotFoundError:
+            self.log.warning(f"Modified image not found for export: {path}")
+            return None
+
+        return ArchiveEntry(
+            name=f"modified/{os.path.basename(path)}",
+            size=stat_result.st_size,
+            chunks=file_chunks(path),
+            compress=not get_variant_codec(modification.codec).precompressed,
+            mtime=stat_result.st_mtime,
+        )
+
+    def _thumbnail_path(self, original_path: str, name: str) -> str:
+        """
+        Path of a cached thumbnail in the thumbnails folder of an image.
+
+        Args:
+            original_path: Path to the original image
+            name: File name of the thumbnail, without extension
+
+        Returns:
+            Path of the thumbnail file
+        """
+        return os.path.join(Path(original_path).parent / "thumbnails", f"{name}.jpg")
+
+    def _cached_thumbnail(
+        self,
+        thumbnail_path: str,
+        render: Callable[[], PILImage.Image],
+        size: int,
+    ) -> Thumbnail:
+        """
+        Read a thumbnail from disk, rendering and writing it first if missing.
+        Thumbnails are written to a temporary file and renamed, so
+        concurrent requests never read a partial file.
+
+        Args:
+            thumbnail_path: Path of the cached thumbnail
+            render: Returns the full-size RGB image to shrink
+            size: Maximum width and height of the thumbnail
+
+        Returns:
+            Thumbnail with JPEG content and an ETag hashed from it
+        """
+        try:
+            with open(thumbnail_path, "rb") as file:
+                content = file.read()
+        except FileNotFoundError:
+            thumbnail = ImageOps.contain(
+                render(), (size, size), method=PILImage.Resampling.BILINEAR
+            )
+            buffer = io.BytesIO()
+            thumbnail.save(buffer, "JPEG", quality=THUMBNAIL_QUALITY)
+            content = buffer.getvalue()
+
+            os.makedirs(os.path.dirname(thumbnail_path), exist_ok=True)
+            tmp_path = f"{thumbnail_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as file:
+                file.write(content)
+            os.replace(tmp_path, thumbnail_path)
+
+        etag = hashlib.sha256(content).hexdigest()[:32]
+        return Thumbnail(content=content, etag=f'"{etag}"')
+
+    @contextmanager
+    def _reversal_pool(self) -> Iterator[Callable[..., Future]]:
+        """
+        Yield a submit(fn, *args, cost=...) function for batch reversals.
+        Work goes to the shared executor when the service has one; the
+        caller has already been admitted, so submissions are forced.
+        """
+        if self.executor is not None:
+            yield partial(self.executor.submit, force=True)
+            return
+
+        with ThreadPoolExecutor(max_workers=max(1, self.reverse_workers)) as pool:
+            yield lambda fn, *args, cost: pool.submit(fn, *args)
+
+    def _load_and_validate_image(
+        self, file_contents: bytes | IO[bytes]
+    ) -> PILImage.Image:
         """
         Load and validate image from file contents.
 
+        With max_upload_pixels set, the size is checked from the header
+        before decoding. JPEGs over the limit are decoded in draft mode at
+        the largest 1/2, 1/4 or 1/8 scale that fits, other formats are
+        rejected.
+
         Args:
-            file_contents: Raw image file contents
+            file_contents: Raw image file contents, or a file to read them from
 
         Returns:
             PIL Image object in RGB mode
+
+        Raises:
+            HTTPException: 413 if the image has more pixels than allowed
         """
-        image = PILImage.open(io.BytesIO(file_contents))
+        if isinstance(file_contents, bytes):
+            file_contents = io.BytesIO(file_contents)
+        file_contents.seek(0)
+
+        image = PILImage.open(file_contents)
+        width, height = image.size
+        if self.max_upload_pixels and width * height > self.max_upload_pixels:
+            draft_size = self._draft_size(image)
+            if draft_size is None:
+                raise HTTPException(
+                    status_code=413,
+                    detail=f"Image has {width * height} pixels, "
+                    f"at most {self.max_upload_pixels} are allowed",
+                )
+            self.log.info(f"Decoding {width}x{height} JPEG in draft mode")
+            image.draft("RGB", draft_size)
+
+        image.load()
         if image.mode != "RGB":
             image = image.convert("RGB")
         return image
 
-    def _create_image_record(self) -> DBImage:
+    def _draft_size(self, image: PILImage.Image) -> Optional[tuple[int, int]]:
         """
-        Create Image record in database and return it with ID assigned.
+        Find the largest JPEG draft size within max_upload_pixels.
 
         Args:
-            db: Database session
+            image: Opened, not yet decoded image
+
+        Returns:
+            Size to pass to Image.draft, or None if the image is not a JPEG
+            or does not fit even at 1/8 scale
+        """
+        if image.format != "JPEG":
+            return None
+
+        width, height = image.size
+        for scale in (2, 4, 8):
+            # the decoder rounds the scaled size up
+            decoded_pixels = -(-width // scale) * -(-height // scale)
+            if decoded_pixels <= self.max_upload_pixels:
+                return max(1, width // scale), max(1, height // scale)
+        return None
+
+    def _create_image_record(self) -> DBImage:
+        """
+        Create Image record in database and return it with ID assigned.
 
         Returns:
             Image record with ID assigned
@@ -190,6 +1011,51 @@ class GeneratorService:
         self.db.flush()
         return image_record
 
+    def _get_image_by_digest(self, digest: str) -> Optional[DBImage]:
+        """
+        Find an already uploaded image by content digest.
+
+        Args:
+            digest: Content digest of the decoded image
+
+        Returns:
+            Image record or None
+        """
+        return self.db.query(DBImage).filter(DBImage.digest == digest).first()
+
+    def _existing_upload_response(self, image_record: DBImage) -> UploadResponse:
+        """
+        Build the upload response for an image that was already uploaded.
+
+        Args:
+            image_record: Existing image record
+
+        Returns:
+            UploadResponse listing the existing modifications in variant order
+        """
+        self.log.info(f"Image already uploaded, image_id: {image_record.id}")
+
+        modifications = (
+            self.db.query(DBImageModification.id, DBImageModification.num_modifications)
+            .filter(DBImageModification.image_id == image_record.id)
+            .order_by(DBImageModification.id)
+            .all()
+        )
+
+        return UploadResponse(
+            image_id=image_record.id,
+            message="Image already uploaded",
+            original_image=image_record.original_image_path,
+            modifications=[
+                Modification(
+                    id=modification.id,
+                    variant_num=variant_num,
+                    num_modifications=modification.num_modifications,
+                )
+                for variant_num, modification in enumerate(modifications)
+            ],
+        )
+
     def _prepare_storage_paths(self, image_id: int) -> Paths:
         """
         Prepare directory structure and return paths for a new image upload.
@@ -218,36 +1084,91 @@ class GeneratorService:
             og_image_path=og_image_path,
         )
 
-    def _generate_and_save_variant(
+    def _generate_variants(
         self,
         original_image: PILImage.Image,
-        variant_num: int,
-        num_modifications: int,
-        modified_folder: str,
-        modification_color: tuple[int, int, int],
-    ) -> tuple[str, dict[str, object]]:
+        tasks: list[VariantTask],
+        row_digests: Optional[list[bytes]] = None,
+    ) -> Iterator[VariantResult]:
         """
-        Generate a single variant, save it, and return path and modification params.
+        Generate and save variants, yielding results in task order.
 
         Args:
-            original_image: Original PIL Image
-            variant_num: Variant number (0-99)
-            num_modifications: Number of modifications to apply
-            modified_folder: Folder to save modified image
-            modification_color: RGB color for modifications
+            original_image: Original PIL Image in RGB mode
+            tasks: Variant tasks to run
+            row_digests: Row digests of the original, reused when sequential
 
         Returns:
-            Tuple of (modified_path, modification_params)
+            Iterator of VariantResult in the same order as tasks
         """
-        modified_image, modification_params = apply_pixel_color_modifications(
-            original_image, num_modifications, color=modification_color
-        )
+        if self.generation_workers <= 1:
+            working_image = original_image.copy()
+            row_digests = row_digests or compute_row_digests(working_image)
+            for task in tasks:
+                yield run_variant_task(working_image, task, row_digests)
+            return
+
+        pool = get_generation_pool(self.generation_workers)
+        with SharedImage(original_image) as shared_image:
+            yield from pool.map(
+                run_shared_variant_task, [shared_image] * len(tasks), tasks
+            )
 
-        modified_filename = f"variant_{variant_num:03d}.png"
-        modified_path = os.path.join(modified_folder, modified_filename)
-        modified_image.save(modified_path, "PNG")
+    def _insert_modifications(
+        self, image_id: int, results: list[VariantResult]
+    ) -> list[Modification]:
+        """
+        Insert modification rows with one bulk INSERT ... RETURNING,
+        without loading them into the session.
 
-        return modified_path, modification_params
+        Args:
+            image_id: ID of the original image
+            results: Generated variants, in variant order
+
+        Returns:
+            Modification for each result, in the same order
+        """
+        ids = self.db.scalars(
+            insert(DBImageModification).returning(
+                DBImageModification.id, sort_by_parameter_order=True
+            ),
+            [
+                {
+                    "image_id": image_id,
+                    "modified_image_path": result.modified_path,
+                    "storage_mode": self.variant_storage,
+                    "codec": self.variant_codec,
+                    "modification_algorithm": result.modification_algorithm,
+                    "modification_params": result.modification_params,
+                    "num_modifications": result.num_modifications,
+                    "verification_status": "pending",
+                }
+                for result in results
+            ],
+        ).all()
+
+        if self.variant_storage == "delta":
+            self.db.execute(
+                update(DBImageModification),
+                [
+                    {
+                        "id": modification_id,
+                        "modified_image_path": (
+                            f"api/modifications/{modification_id}/image"
+                        ),
+                    }
+                    for modification_id in ids
+                ],
+            )
+
+        return [
+            Modification(
+                id=modification_id,
+                variant_num=result.variant_num,
+                num_modifications=result.num_modifications,
+            )
+            for modification_id, result in zip(ids, results)
+        ]
 
     def _get_modification_with_image(
         self,
@@ -300,12 +1221,93 @@ class GeneratorService:
 
         return reversed_path
 
-    def _load_modified_image(self, modified_image_path: str) -> PILImage.Image:
+    def _reversal_job(self, modification: DBImageModification) -> ReversalJob:
+        """
+        Copy the fields needed to reverse a modification off its ORM record,
+        so the reversal can run outside the session's thread.
+
+        Args:
+            modification: Modification record with its image loaded
+
+        Returns:
+            ReversalJob with plain values of the modification
+        """
+        return ReversalJob(
+            modification_id=modification.id,
+            image_id=modification.image_id,
+            original_path=modification.image.original_image_path,
+            modified_image_path=modification.modified_image_path,
+            storage_mode=modification.storage_mode,
+            codec=modification.codec,
+            modification_algorithm=modification.modification_algorithm,
+            modification_params=modification.modification_params,
+        )
+
+    def _run_reversal(
+        self,
+        job: ReversalJob,
+        should_save_reversed_img: bool = False,
+        original: Optional[CachedOriginal] = None,
+    ) -> bool:
+        """
+        Reverse one modification and verify it, without touching the database.
+
+        Args:
+            job: Modification to reverse
+            should_save_reversed_img: Whether to save the reversed image to disk
+            original: Already decoded original, loaded through the cache if None
+
+        Returns:
+            True if the reversed image matches the original
+        """
+        modification_params = self._parse_and_convert_modification_params(
+            job.modification_params
+        )
+
+        if job.storage_mode == "delta":
+            modified_image = self._render_modified_image(
+                job.image_id,
+                job.original_path,
+                job.modification_algorithm,
+                modification_params,
+                original=original,
+            )
+        else:
+            modified_image = self._load_modified_image(
+                job.modified_image_path, job.codec
+            )
+
+        reversed_image = reverse_modifications(
+            modified_image,
+            modification_params,
+            algorithm=job.modification_algorithm,
+        )
+
+        if should_save_reversed_img:
+            reversed_image.save(
+                self._prepare_reversed_image_path(
+                    job.original_path, job.modification_id
+                ),
+                "PNG",
+            )
+
+        return self._verify_reversed_image(
+            reversed_image,
+            job.image_id,
+            job.original_path,
+            modification_params,
+            original=original,
+        )
+
+    def _load_modified_image(
+        self, modified_image_path: str, codec: str = "png"
+    ) -> PILImage.Image:
         """
         Load and validate modified image from path.
 
         Args:
             modified_image_path: Path to modified image
+            codec: Name of the variant codec the image was written with
 
         Returns:
             PIL Image object in RGB mode
@@ -319,34 +1321,141 @@ class GeneratorService:
                 detail=f"Modified image not found: {modified_image_path}",
             )
 
-        image = PILImage.open(modified_image_path)
-        if image.mode != "RGB":
-            image = image.convert("RGB")
+        return load_variant(modified_image_path, codec)
+
+    def _verify_reversed_image(
+        self,
+        reversed_image: PILImage.Image,
+        image_id: int,
+        original_path: str,
+        modification_params: dict[str, Any],
+        original: Optional[CachedOriginal] = None,
+    ) -> bool:
+        """
+        Check whether a reversed image matches the original.
+
+        In "region" mode the reversed region and the rest of the image are
+        checked against the digests recorded at upload, without loading the
+        original. "strict" mode, and rows without digests, compare the full
+        image hash against the cached hash of the original.
+
+        Args:
+            reversed_image: Reversed PIL Image
+            image_id: ID of the original image
+            original_path: Path to the original image
+            modification_params: Decoded modification params
+            original: Already decoded original, loaded through the cache if None
+
+        Returns:
+            True if the reversed image matches the original
+        """
+        digests = modification_params.get("digests")
+
+        if self.verification_mode == "region" and digests:
+            return verify_region_digests(
+                reversed_image, modification_params["region"], digests
+            )
+
+        if original is None:
+            original = self._load_original(image_id, original_path)
+        # is_reversible = compare_images_pixelwise(og_image, reversed_image)
+        return (
+            reversed_image.size == original.size
+            and image_hash(reversed_image) == original.digest
+        )
+
+    def _original_pixels(self, original_path: str) -> int:
+        """
+        Pixel count of an original from its header, 0 if it cannot be read.
+        """
+        try:
+            return image_pixels(original_path)
+        except OSError as e:
+            self.log.warning(f"Cannot read original {original_path}: {e}")
+            return 0
+
+    def _load_original(self, image_id: int, original_path: str) -> CachedOriginal:
+        """
+        Load a decoded original and its hash through the per-process cache.
+        Entries are keyed by image ID and file mtime, so a replaced file is
+        decoded again.
 
+        Originals with a raw copy are memory-mapped instead of decoded, and
+        cached separately since their pixels live in the page cache. Images
+        are only built from the mapped pixels when a caller needs one.
+
+        Args:
+            image_id: ID of the original image
+            original_path: Path to the original image
+
+        Returns:
+            CachedOriginal with the RGB image or mapped pixels, and its hash
+        """
+        raw_path = raw_original_path(original_path)
+        if os.path.exists(raw_path):
+            key = (image_id, os.stat(raw_path).st_mtime_ns)
+            original = mapped_originals.get(key)
+            if original is None:
+                pixels = map_raw_image(raw_path)
+                original = CachedOriginal(
+                    size=(pixels.shape[1], pixels.shape[0]),
+                    digest=pixels_hash(pixels),
+                    pixels=pixels,
+                )
+                mapped_originals.put(key, original)
+            return original
+
+        key = (image_id, os.stat(original_path).st_mtime_ns)
+
+        original = decoded_originals.get(key)
+        if original is None:
+            image = PILImage.open(original_path).convert("RGB")
+            original = CachedOriginal(
+                size=image.size, digest=image_hash(image), image=image
+            )
+            decoded_originals.put(key, original)
+
+        return original
+
+    def _render_modified_image(
+        self,
+        image_id: int,
+        original_path: str,
+        modification_algorithm: str,
+        modification_params: dict[str, Any],
+        original: Optional[CachedOriginal] = None,
+    ) -> PILImage.Image:
+        """
+        Render a delta-stored variant by re-applying its modifications
+        to the original image.
+
+        Args:
+            image_id: ID of the original image
+            original_path: Path to the original image
+            modification_algorithm: Name of the modification algorithm
+            modification_params: Decoded modification params
+            original: Already decoded original, loaded through the cache if None
+
+        Returns:
+            PIL Image object of the variant in RGB mode
+        """
+        if original is None:
+            original = self._load_original(image_id, original_path)
+        image = original.to_image()
+        render_modifications(image, modification_params, modification_algorithm)
         return image
 
     def _parse_and_convert_modification_params(
         self, modification_params_json: str
     ) -> dict[str, Any]:
         """
-        Parse modification parameters from JSON and convert lists to tuples.
+        Decode stored modification parameters.
 
         Args:
-            modification_params_json: JSON string of modification parameters
+            modification_params_json: Stored modification params, either the
+                compact versioned format or legacy JSON
 
         Returns:
-            Dictionary with converted modification parameters
+            Dictionary with decoded modification parameters
         """
-        modification_params = json.loads(modification_params_json)
-
-        original_pixels = modification_params.get("original_pixels", [])
-        if original_pixels:
-            original_pixels = [
-                (int(p[0]), int(p[1]), tuple(int(c) for c in p[2]))
-                if isinstance(p[2], list)
-                else (int(p[0]), int(p[1]), p[2])
-                for p in original_pixels
-            ]
-            modification_params["original_pixels"] = original_pixels
-
-        return modification_params
+        return decode_modification_params(modification_params_json)
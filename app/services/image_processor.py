@@ -1,15 +1,24 @@
+import base64
 import hashlib
+import json
 import random
-from typing import Any
+import zlib
+from dataclasses import dataclass
+from typing import IO, Any, Callable, Optional
 
+import numpy as np
 from PIL import Image
 
+PARAMS_VERSION = 2
+PARAMS_COMPRESS_LEVEL = 1
+
 
 def apply_pixel_color_modifications(
     image: Image.Image,
     num_modifications: int,
     color: tuple[int, int, int] = (0, 255, 0),
-) -> tuple[Image.Image, dict[str, object]]:
+    rng: Optional[random.Random] = None,
+) -> tuple[Image.Image, dict[str, Any]]:
     """
     Apply reversible pixel color modifications.
     Changes a large square region of pixels to a specified color (default: green)
@@ -19,31 +28,324 @@ def apply_pixel_color_modifications(
         image: PIL Image object
         num_modifications: Number of pixels to modify
         color: RGB tuple for the color to apply (default: green)
+        rng: Random generator for the region (default: module random)
 
     Returns:
         Tuple of (modified_image, modification_params_dict)
     """
-    img = image.copy()
-    width, height = img.size
-    pixels = img.load()
+    img = image.convert("RGB") if image.mode != "RGB" else image.copy()
+    modification_params, _ = stamp_pixel_color_modifications(
+        img, num_modifications, color=color, rng=rng
+    )
+    return img, modification_params
+
 
+def stamp_pixel_color_modifications(
+    image: Image.Image,
+    num_modifications: int,
+    color: tuple[int, int, int] = (0, 255, 0),
+    rng: Optional[random.Random] = None,
+) -> tuple[dict[str, Any], np.ndarray]:
+    """
+    Apply pixel color modifications to an RGB image in place.
+
+    The original patch is captured with one crop and the region is filled
+    with one paste, so only patch-sized memory is allocated.
+
+    Args:
+        image: PIL Image object in RGB mode, modified in place
+        num_modifications: Number of pixels to modify
+        color: RGB tuple for the color to apply (default: green)
+        rng: Random generator for the region (default: module random)
+
+    Returns:
+        Tuple of (modification_params_dict, original_patch)
+    """
+    width, height = image.size
     start_x, start_y, rect_width, rect_height = compute_modification_region(
-        width, height, num_modifications
+        width, height, num_modifications, rng=rng
     )
+    region = {
+        "start_x": start_x,
+        "start_y": start_y,
+        "width": rect_width,
+        "height": rect_height,
+    }
 
-    original_pixels = []
-
-    for x in range(start_x, start_x + rect_width):
-        for y in range(start_y, start_y + rect_height):
-            original_color = pixels[x, y]
-            original_pixels.append((x, y, original_color))
-            pixels[x, y] = color
+    original_patch = _region_as_array(image, region)
+    image.paste(color, _region_box(region))
 
     modification_params = {
         "algorithm": "pixel_color",
-        "original_pixels": original_pixels,
+        "original_patch": original_patch,
         "modification_color": color,
-        "num_modifications": len(original_pixels),
+        "num_modifications": rect_width * rect_height,
+        "region": region,
+    }
+
+    return modification_params, original_patch
+
+
+def render_pixel_color_modifications(
+    image: Image.Image, modification_params: dict[str, Any]
+) -> None:
+    """
+    Re-apply stored pixel color modifications to an RGB image in place.
+    """
+    image.paste(
+        tuple(modification_params["modification_color"]),
+        _region_box(modification_params["region"]),
+    )
+
+
+def restore_region(
+    image: Image.Image, region: dict[str, int], original_patch: np.ndarray
+) -> None:
+    """
+    Paste an original patch back into its region in place.
+    """
+    image.paste(
+        Image.fromarray(np.ascontiguousarray(original_patch, dtype=np.uint8)),
+        (region["start_x"], region["start_y"]),
+    )
+
+
+def encode_modification_params(
+    modification_params: dict[str, Any], compress: bool = True
+) -> str:
+    """
+    Encode modification params into the compact versioned format
+    stored in the database.
+
+    The original patch is stored as the raw RGB bytes of the region,
+    optionally zlib-compressed, and base64-encoded next to the
+    remaining JSON fields.
+
+    Args:
+        modification_params: Params returned by apply_pixel_color_modifications
+        compress: Whether to zlib-compress the patch bytes
+
+    Returns:
+        Encoded modification params string
+    """
+    params = dict(modification_params)
+    original_patch = params.pop("original_patch", None)
+    params.pop("original_pixels", None)
+
+    encoded: dict[str, Any] = {"version": PARAMS_VERSION, **params}
+
+    if original_patch is not None:
+        patch_bytes = np.ascontiguousarray(original_patch, dtype=np.uint8).tobytes()
+        if compress:
+            patch_bytes = zlib.compress(patch_bytes, PARAMS_COMPRESS_LEVEL)
+
+        encoded["patch_encoding"] = "zlib" if compress else "raw"
+        encoded["patch"] = base64.b64encode(patch_bytes).decode("ascii")
+
+    return json.dumps(encoded)
+
+
+def decode_modification_params(modification_params: str) -> dict[str, Any]:
+    """
+    Decode modification params stored in the database.
+
+    Accepts both the compact versioned format and legacy JSON rows with
+    a per-pixel ``original_pixels`` list. Legacy rows that cover their
+    whole region are converted to an ``original_patch`` array.
+
+    Args:
+        modification_params: Stored modification params string
+
+    Returns:
+        Dictionary with modification params
+    """
+    params: dict[str, Any] = json.loads(modification_params)
+    version = params.pop("version", 1)
+
+    if version == 1:
+        return _convert_legacy_params(params)
+
+    if version != PARAMS_VERSION:
+        raise ValueError(f"Unsupported modification params version: {version}")
+
+    patch = params.pop("patch", None)
+    patch_encoding = params.pop("patch_encoding", "raw")
+
+    if patch is not None:
+        patch_bytes = base64.b64decode(patch)
+        if patch_encoding == "zlib":
+            patch_bytes = zlib.decompress(patch_bytes)
+
+        region = params["region"]
+        params["original_patch"] = np.frombuffer(patch_bytes, dtype=np.uint8).reshape(
+            region["height"], region["width"], 3
+        )
+
+    return params
+
+
+def _convert_legacy_params(params: dict[str, Any]) -> dict[str, Any]:
+    """
+    Replace a legacy ``original_pixels`` list with an ``original_patch``
+    array when the list covers the whole region.
+    """
+    region = params.get("region")
+    original_pixels = params.get("original_pixels") or []
+
+    if not region or len(original_pixels) != region["width"] * region["height"]:
+        return params
+
+    xs, ys, colors = _pixel_list_to_arrays(original_pixels)
+
+    original_patch = np.zeros((region["height"], region["width"], 3), np.uint8)
+    original_patch[ys - region["start_y"], xs - region["start_x"]] = colors
+
+    params = dict(params)
+    del params["original_pixels"]
+    params["original_patch"] = original_patch
+
+    return params
+
+
+def reverse_pixel_color_modifications(
+    image: Image.Image, modification_params: dict[str, Any]
+) -> Image.Image:
+    """
+    Reverse pixel color modifications by restoring original pixel colors.
+
+    The original patch is rebuilt as a contiguous array and pasted back
+    in one operation. Legacy params with a per-pixel ``original_pixels``
+    list are converted to arrays without a per-pixel loop.
+
+    Args:
+        image: Modified PIL Image object
+        modification_params: Dictionary containing original_patch and region,
+            or legacy original_pixels
+
+    Returns:
+        Reversed PIL Image object
+    """
+    img = image.copy()
+    region: dict[str, int] = modification_params.get("region") or {}
+    original_patch = modification_params.get("original_patch")
+
+    if original_patch is None:
+        original_pixels = modification_params.get("original_pixels", [])
+        if len(original_pixels) == 0:
+            return img
+
+        xs, ys, colors = _pixel_list_to_arrays(original_pixels)
+
+        if not region:
+            pixels = np.array(img)
+            pixels[ys, xs] = colors
+            return Image.fromarray(pixels)
+
+        original_patch = np.array(
+            _region_as_array(img, region), dtype=np.uint8, copy=True
+        )
+        original_patch[ys - region["start_y"], xs - region["start_x"]] = colors
+
+    restore_region(img, region, original_patch)
+
+    return img
+
+
+def _pixel_list_to_arrays(
+    original_pixels: list[Any],
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Convert a legacy list of (x, y, color) entries into coordinate
+    and color arrays.
+
+    Returns:
+        (xs, ys, colors) with colors shaped (N, 3)
+    """
+    entries = np.array(original_pixels, dtype=object)
+    xs = entries[:, 0].astype(np.intp)
+    ys = entries[:, 1].astype(np.intp)
+    colors = np.array(entries[:, 2].tolist(), dtype=np.uint8)
+    return xs, ys, colors
+
+
+def _region_box(region: dict[str, int]) -> tuple[int, int, int, int]:
+    """
+    Return the region as a (left, upper, right, lower) box.
+    """
+    return (
+        region["start_x"],
+        region["start_y"],
+        region["start_x"] + region["width"],
+        region["start_y"] + region["height"],
+    )
+
+
+def _region_as_array(image: Image.Image, region: dict[str, int]) -> np.ndarray:
+    """
+    Return the pixels of the given region as an (h, w, 3) array.
+    """
+    return np.asarray(image.crop(_region_box(region)))
+
+
+def apply_xor_mask_modifications(
+    image: Image.Image,
+    num_modifications: int,
+    seed: Optional[int] = None,
+    rng: Optional[random.Random] = None,
+) -> tuple[Image.Image, dict[str, Any]]:
+    """
+    Apply reversible modifications by XOR-ing a square region
+    with a seeded random mask.
+
+    Only the seed and the region are needed to reverse the modification,
+    so the params size does not grow with the region size.
+
+    Args:
+        image: PIL Image object
+        num_modifications: Number of pixels to modify
+        seed: Seed for the mask generator (drawn from rng if not given)
+        rng: Random generator for the region and seed (default: module random)
+
+    Returns:
+        Tuple of (modified_image, modification_params_dict)
+    """
+    img = image.convert("RGB") if image.mode != "RGB" else image.copy()
+    modification_params, _ = stamp_xor_mask_modifications(
+        img, num_modifications, seed=seed, rng=rng
+    )
+    return img, modification_params
+
+
+def stamp_xor_mask_modifications(
+    image: Image.Image,
+    num_modifications: int,
+    seed: Optional[int] = None,
+    rng: Optional[random.Random] = None,
+) -> tuple[dict[str, Any], np.ndarray]:
+    """
+    Apply XOR mask modifications to an RGB image in place.
+
+    Args:
+        image: PIL Image object in RGB mode, modified in place
+        num_modifications: Number of pixels to modify
+        seed: Seed for the mask generator (drawn from rng if not given)
+        rng: Random generator for the region and seed (default: module random)
+
+    Returns:
+        Tuple of (modification_params_dict, original_patch)
+    """
+    if seed is None:
+        seed = rng.getrandbits(63) if rng else random.getrandbits(63)
+
+    width, height = image.size
+    start_x, start_y, rect_width, rect_height = compute_modification_region(
+        width, height, num_modifications, rng=rng
+    )
+
+    modification_params: dict[str, Any] = {
+        "algorithm": "xor_mask",
+        "seed": seed,
+        "num_modifications": rect_width * rect_height,
         "region": {
             "start_x": start_x,
             "start_y": start_y,
@@ -52,51 +354,185 @@ def apply_pixel_color_modifications(
         },
     }
 
-    return img, modification_params
+    original_patch = _xor_region_in_place(image, modification_params)
 
+    return modification_params, original_patch
 
-def reverse_pixel_color_modifications(
+
+def reverse_xor_mask_modifications(
     image: Image.Image, modification_params: dict[str, Any]
 ) -> Image.Image:
     """
-    Reverse pixel color modifications by restoring original pixel colors.
+    Reverse XOR mask modifications by regenerating the mask from the seed.
 
     Args:
         image: Modified PIL Image object
-        modification_params: Dictionary containing original_pixels
+        modification_params: Dictionary containing seed and region
 
     Returns:
         Reversed PIL Image object
     """
     img = image.copy()
-    pixels = img.load()
+    _xor_region_in_place(img, modification_params)
+    return img
+
+
+def render_xor_mask_modifications(
+    image: Image.Image, modification_params: dict[str, Any]
+) -> None:
+    """
+    Re-apply stored XOR mask modifications to an RGB image in place.
+    """
+    _xor_region_in_place(image, modification_params)
+
 
-    original_pixels = modification_params.get(
-        "original_pixels", []  # type: ignore[var-annotated]
+def _xor_region_in_place(
+    image: Image.Image, modification_params: dict[str, Any]
+) -> np.ndarray:
+    """
+    XOR the region of the image with the seeded mask in place.
+
+    Returns:
+        The region pixels before the XOR
+    """
+    region = modification_params["region"]
+    mask = np.random.default_rng(modification_params["seed"]).integers(
+        0, 256, size=(region["height"], region["width"], 3), dtype=np.uint8
     )
 
-    for pixel_data in original_pixels:
-        if isinstance(pixel_data, (list, tuple)):
-            x, y = int(pixel_data[0]), int(pixel_data[1])
-            original_color = pixel_data[2]
+    patch = _region_as_array(image, region)
+    image.paste(Image.fromarray(patch ^ mask), (region["start_x"], region["start_y"]))
+    return patch
 
-            if isinstance(original_color, list):
-                original_color = tuple(int(c) for c in original_color)
-            elif not isinstance(original_color, tuple):
-                original_color = tuple(original_color)
 
-            pixels[x, y] = original_color
+@dataclass(frozen=True)
+class ModificationAlgorithm:
+    name: str
+    apply: Callable[..., tuple[Image.Image, dict[str, Any]]]
+    stamp: Callable[..., tuple[dict[str, Any], np.ndarray]]
+    render: Callable[[Image.Image, dict[str, Any]], None]
+    reverse: Callable[[Image.Image, dict[str, Any]], Image.Image]
+    options: tuple[str, ...] = ()
 
-    return img
+
+MODIFICATION_ALGORITHMS: dict[str, ModificationAlgorithm] = {}
+
+
+def register_modification_algorithm(algorithm: ModificationAlgorithm) -> None:
+    """
+    Register a modification algorithm under its name.
+    """
+    MODIFICATION_ALGORITHMS[algorithm.name] = algorithm
+
+
+def get_modification_algorithm(name: str) -> ModificationAlgorithm:
+    """
+    Look up a registered modification algorithm.
+
+    Raises:
+        ValueError: If no algorithm is registered under the name
+    """
+    try:
+        return MODIFICATION_ALGORITHMS[name]
+    except KeyError:
+        raise ValueError(f"Unknown modification algorithm: {name}") from None
+
+
+def apply_modifications(
+    image: Image.Image,
+    num_modifications: int,
+    algorithm: str = "pixel_color",
+    **options: Any,
+) -> tuple[Image.Image, dict[str, Any]]:
+    """
+    Apply modifications with a registered algorithm.
+
+    Options the algorithm does not declare (e.g. ``color`` for ``xor_mask``)
+    are ignored.
+
+    Returns:
+        Tuple of (modified_image, modification_params_dict)
+    """
+    modification_algorithm = get_modification_algorithm(algorithm)
+    algorithm_options = {
+        k: v for k, v in options.items() if k in modification_algorithm.options
+    }
+    return modification_algorithm.apply(image, num_modifications, **algorithm_options)
+
+
+def stamp_modifications(
+    image: Image.Image,
+    num_modifications: int,
+    algorithm: str = "pixel_color",
+    **options: Any,
+) -> tuple[dict[str, Any], np.ndarray]:
+    """
+    Apply modifications with a registered algorithm to an RGB image in place.
+    Pass the returned patch to restore_region to undo the change.
+
+    Returns:
+        Tuple of (modification_params_dict, original_patch)
+    """
+    modification_algorithm = get_modification_algorithm(algorithm)
+    algorithm_options = {
+        k: v for k, v in options.items() if k in modification_algorithm.options
+    }
+    return modification_algorithm.stamp(image, num_modifications, **algorithm_options)
+
+
+def render_modifications(
+    image: Image.Image, modification_params: dict[str, Any], algorithm: str
+) -> None:
+    """
+    Re-apply stored modifications to an RGB image of the original in place,
+    producing the variant without reading a stored variant file.
+    """
+    get_modification_algorithm(algorithm).render(image, modification_params)
+
+
+def reverse_modifications(
+    image: Image.Image, modification_params: dict[str, Any], algorithm: str
+) -> Image.Image:
+    """
+    Reverse modifications with a registered algorithm.
+
+    Returns:
+        Reversed PIL Image object
+    """
+    return get_modification_algorithm(algorithm).reverse(image, modification_params)
+
+
+register_modification_algorithm(
+    ModificationAlgorithm(
+        name="pixel_color",
+        apply=apply_pixel_color_modifications,
+        stamp=stamp_pixel_color_modifications,
+        render=render_pixel_color_modifications,
+        reverse=reverse_pixel_color_modifications,
+        options=("color", "rng"),
+    )
+)
+register_modification_algorithm(
+    ModificationAlgorithm(
+        name="xor_mask",
+        apply=apply_xor_mask_modifications,
+        stamp=stamp_xor_mask_modifications,
+        render=render_xor_mask_modifications,
+        reverse=reverse_xor_mask_modifications,
+        options=("seed", "rng"),
+    )
+)
 
 
 def compute_modification_region(
     width: int,
     height: int,
     num_modifications: int,
+    rng: Optional[random.Random] = None,
 ) -> tuple[int, int, int, int]:
     """
     Compute the modification region as a square inside the image.
+    The position is drawn from rng, or the module random if not given.
 
     Returns:
         (start_x, start_y, rect_width, rect_height)
@@ -116,8 +552,9 @@ def compute_modification_region(
     if max_x <= 0 or max_y <= 0:
         return 0, 0, width, height
 
-    start_x = random.randint(0, max_x)
-    start_y = random.randint(0, max_y)
+    randint = rng.randint if rng else random.randint
+    start_x = randint(0, max_x)
+    start_y = randint(0, max_y)
     return start_x, start_y, rect_width, rect_height
 
 
@@ -154,6 +591,47 @@ def image_hash(img: Image.Image, algorithm: str = "sha256") -> str:
     return hasher.hexdigest()
 
 
+def pixels_hash(pixels: np.ndarray, algorithm: str = "sha256") -> str:
+    """
+    Hash a C-contiguous RGB pixel array without copying it.
+    Equal to image_hash of the image the array holds.
+    """
+    hasher = hashlib.new(algorithm)
+    hasher.update(pixels.data.cast("B"))
+
+    return hasher.hexdigest()
+
+
+def save_raw_image(image: Image.Image, path: str) -> None:
+    """
+    Write the pixels of an RGB image uncompressed as a .npy file,
+    so they can be memory-mapped with map_raw_image.
+    """
+    np.save(path, np.asarray(image), allow_pickle=False)
+
+
+def map_raw_image(path: str) -> np.ndarray:
+    """
+    Memory-map a .npy file written by save_raw_image, so processes reading
+    the same file share the page cache. Pillow cannot map RGB pixels and
+    would copy them into an image, so callers build images only when needed.
+
+    Returns:
+        Read-only (height, width, 3) pixel array
+    """
+    return np.load(path, mmap_mode="r", allow_pickle=False)
+
+
+def image_pixels(fp: str | IO[bytes]) -> int:
+    """
+    Count the pixels of an image file from its header, without decoding it.
+    """
+    with Image.open(fp) as img:
+        width, height = img.size
+
+    return width * height
+
+
 def compare_images_by_hash(img1: Image.Image, img2: Image.Image) -> bool:
     """
     Compare two images using a cryptographic hash.
@@ -165,3 +643,104 @@ def compare_images_by_hash(img1: Image.Image, img2: Image.Image) -> bool:
         return False
 
     return image_hash(img1) == image_hash(img2)
+
+
+def compute_row_digests(
+    image: Image.Image, band_height: int = 256, algorithm: str = "sha256"
+) -> list[bytes]:
+    """
+    Compute a digest of every pixel row of an RGB image.
+    Rows are read in bands, so only one band is copied at a time.
+    """
+    width, height = image.size
+    digests: list[bytes] = []
+
+    for top in range(0, height, band_height):
+        band = np.asarray(image.crop((0, top, width, min(top + band_height, height))))
+        digests.extend(hashlib.new(algorithm, row).digest() for row in band)
+
+    return digests
+
+
+def image_digest(
+    image: Image.Image,
+    row_digests: Optional[list[bytes]] = None,
+    algorithm: str = "sha256",
+) -> str:
+    """
+    Compute a content digest of an RGB image from its size and row digests.
+
+    Pixels are read band by band, so no full-size copy of the image is made,
+    and precomputed row digests are reused when given.
+    """
+    width, height = image.size
+    hasher = hashlib.new(algorithm, f"{width}x{height}".encode())
+    for row in row_digests or compute_row_digests(image, algorithm=algorithm):
+        hasher.update(row)
+    return hasher.hexdigest()
+
+
+def region_digest(
+    image: Image.Image, region: dict[str, int], algorithm: str = "sha256"
+) -> str:
+    """
+    Compute a digest of the pixels inside the region.
+    """
+    return hashlib.new(algorithm, _region_as_array(image, region).data).hexdigest()
+
+
+def outside_region_digest(
+    image: Image.Image,
+    region: dict[str, int],
+    row_digests: Optional[list[bytes]] = None,
+    algorithm: str = "sha256",
+) -> str:
+    """
+    Compute a digest of the pixels outside the region.
+
+    Rows that do not cross the region are taken from row_digests when given
+    (they are the same for every variant of an image), so only the rows
+    crossing the region are hashed again.
+
+    Args:
+        image: PIL Image object in RGB mode
+        region: Region whose pixels are excluded
+        row_digests: Precomputed row digests from compute_row_digests
+
+    Returns:
+        Hex digest of the image size and the pixels outside the region
+    """
+    width, height = image.size
+    rows = list(row_digests or compute_row_digests(image, algorithm=algorithm))
+
+    start_x, start_y = region["start_x"], region["start_y"]
+    end_x, end_y = start_x + region["width"], start_y + region["height"]
+
+    left = np.asarray(image.crop((0, start_y, start_x, end_y)))
+    right = np.asarray(image.crop((end_x, start_y, width, end_y)))
+
+    for offset in range(region["height"]):
+        hasher = hashlib.new(algorithm, left[offset])
+        hasher.update(right[offset])
+        rows[start_y + offset] = hasher.digest()
+
+    hasher = hashlib.new(algorithm, f"{width}x{height}".encode())
+    for row in rows:
+        hasher.update(row)
+
+    return hasher.hexdigest()
+
+
+def verify_region_digests(
+    image: Image.Image, region: dict[str, int], digests: dict[str, str]
+) -> bool:
+    """
+    Check a reversed image against the digests recorded at upload time,
+    without reading the original image.
+
+    Returns:
+        True if both the region and the rest of the image match
+    """
+    return region_digest(image, region) == digests["region"] and (
+        outside_region_digest(image, region) == digests["outside"]
+    )
@@ -0,0 +1,135 @@
+"""
+Lease-based claiming of pending modifications, so several validators
+can split the verification backlog without verifying a row twice.
+
+Pending rows are the durable queue. Uploads signal pending_modifications
+after committing new rows, which wakes claims that are long-polling.
+Every claim counts an attempt, and a row is not claimed again after
+MAX_VERIFY_ATTEMPTS, so one that always fails does not loop forever.
+"""
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from threading import Event
+from typing import Optional
+
+from sqlalchemy import and_, or_, select, update
+from sqlalchemy.orm import Session
+
+from app.models import DBImageModification
+from app.schemas import ClaimResponse
+from app.utils.logging import get_json_logger
+from app.utils.notifier import Notifier
+
+log = get_json_logger("app.services.modification_leases")
+
+MAX_VERIFY_ATTEMPTS = int(os.getenv("APP_MAX_VERIFY_ATTEMPTS", "3"))
+
+pending_modifications = Notifier()
+
+
+def claim_modifications(
+    db: Session,
+    worker_id: str,
+    limit: int = 100,
+    lease_seconds: int = 300,
+    wait_seconds: float = 0,
+    stop_event: Optional[Event] = None,
+) -> ClaimResponse:
+    """
+    Claim a batch of modifications, waiting up to wait_seconds for new
+    uploads when nothing is claimable.
+
+    Args:
+        db: Database session
+        worker_id: Identifier of the claiming worker
+        limit: Maximum number of modifications to claim
+        lease_seconds: How long the claim is held before it can be reclaimed
+        wait_seconds: How long to long-poll for pending modifications
+        stop_event: Ends the wait early once set and notified
+
+    Returns:
+        ClaimResponse with the claimed modification ids and lease expiry
+    """
+    deadline = time.monotonic() + wait_seconds
+
+    while True:
+        version = pending_modifications.version
+        claim = _claim_once(db, worker_id, limit, lease_seconds)
+
+        remaining = deadline - time.monotonic()
+        stopped = stop_event is not None and stop_event.is_set()
+        if claim.modification_ids or remaining <= 0 or stopped:
+            return claim
+
+        pending_modifications.wait(version, remaining)
+
+
+def _claim_once(
+    db: Session, worker_id: str, limit: int, lease_seconds: int
+) -> ClaimResponse:
+    """
+    Atomically move a batch of claimable modifications to "in_progress".
+
+    Pending rows and in-progress rows whose lease has expired are claimable,
+    oldest first, until they have been claimed MAX_VERIFY_ATTEMPTS times.
+    The claim is a single UPDATE ... RETURNING, so concurrent callers never
+    receive the same row while its lease is live.
+
+    Args:
+        db: Database session
+        worker_id: Identifier of the claiming worker
+        limit: Maximum number of modifications to claim
+        lease_seconds: How long the claim is held before it can be reclaimed
+
+    Returns:
+        ClaimResponse with the claimed modification ids and lease expiry
+    """
+    now = datetime.now(timezone.utc)
+    lease_expires_at = now + timedelta(seconds=lease_seconds)
+
+    claimable = and_(
+        or_(
+            DBImageModification.verification_status == "pending",
+            and_(
+                DBImageModification.verification_status == "in_progress",
+                DBImageModification.lease_expires_at < now,
+            ),
+        ),
+        DBImageModification.verify_attempts < MAX_VERIFY_ATTEMPTS,
+    )
+
+    claimable_ids = (
+        select(DBImageModification.id)
+        .where(claimable)
+        .order_by(DBImageModification.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+
+    claimed_ids = (
+        db.execute(
+            update(DBImageModification)
+            .where(DBImageModification.id.in_(claimable_ids), claimable)
+            .values(
+                verification_status="in_progress",
+                lease_owner=worker_id,
+                lease_expires_at=lease_expires_at,
+                verify_attempts=DBImageModification.verify_attempts + 1,
+            )
+            .returning(DBImageModification.id),
+            execution_options={"synchronize_session": False},
+        )
+        .scalars()
+        .all()
+    )
+    db.commit()
+
+    if claimed_ids:
+        log.info(f"Worker {worker_id} claimed {len(claimed_ids)} modifications")
+
+    return ClaimResponse(
+        worker_id=worker_id,
+        lease_expires_at=lease_expires_at,
+        modification_ids=sorted(claimed_ids),
+    )
@@ -0,0 +1,102 @@
+"""
+Convert legacy per-pixel JSON modification params to the compact format.
+
+Usage:
+    python -m app.services.params_migration [--batch-size 20] [--no-compress]
+"""
+import argparse
+
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal
+from app.models import DBImageModification
+from app.services.image_processor import (
+    decode_modification_params,
+    encode_modification_params,
+)
+from app.utils.logging import get_json_logger
+
+log = get_json_logger("app.services.params_migration")
+
+COMPACT_PREFIX = '{"version"'
+
+
+def migrate_modification_params(
+    db: Session, batch_size: int = 20, compress: bool = True
+) -> int:
+    """
+    Re-encode legacy modification params rows in batches.
+
+    Rows are walked by id and each batch is written with one bulk UPDATE
+    and committed, so only one batch of legacy params is in memory at a time.
+    Rows whose legacy params do not cover a full region are left untouched.
+
+    Args:
+        db: Database session
+        batch_size: Number of rows loaded and updated per batch
+        compress: Whether to zlib-compress the stored patch bytes
+
+    Returns:
+        Number of converted rows
+    """
+    converted = 0
+    last_id = 0
+
+    while True:
+        rows = db.execute(
+            select(DBImageModification.id, DBImageModification.modification_params)
+            .where(
+                DBImageModification.id > last_id,
+                ~DBImageModification.modification_params.startswith(COMPACT_PREFIX),
+            )
+            .order_by(DBImageModification.id)
+            .limit(batch_size)
+        ).all()
+
+        if not rows:
+            break
+
+        last_id = rows[-1].id
+        updates = []
+
+        for row in rows:
+            try:
+                params = decode_modification_params(row.modification_params)
+            except ValueError as e:
+                log.warning(f"Skipping modification {row.id}: {e}")
+                continue
+
+            if "original_patch" not in params:
+                log.warning(f"Skipping modification {row.id}: no full region")
+                continue
+
+            updates.append(
+                {
+                    "id": row.id,
+                    "modification_params": encode_modification_params(
+                        params, compress=compress
+                    ),
+                }
+            )
+
+        if updates:
+            db.execute(update(DBImageModification), updates)
+            db.commit()
+
+        converted += len(updates)
+        log.info(f"Converted {converted} rows, last id {last_id}")
+
+    return converted
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--batch-size", type=int, default=20)
+    parser.add_argument("--no-compress", action="store_true")
+    args = parser.parse_args()
+
+    with SessionLocal() as session:
+        migrate_modification_params(
+            session, batch_size=args.batch_size, compress=not args.no_compress
+        )
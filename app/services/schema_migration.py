@@ -0,0 +1,83 @@
+"""
+Bring the tables of an existing database up to date with the models.
+
+create_all only creates missing tables, so columns and indexes added to
+the models later are added here: columns with ALTER TABLE ... ADD COLUMN,
+filled with their scalar default on existing rows, and indexes with
+CREATE INDEX. Running it again changes nothing.
+
+Usage:
+    python -m app.services.schema_migration
+"""
+from sqlalchemy import Column, ColumnDefault, Engine, inspect, literal, text
+from sqlalchemy.engine import Dialect
+
+from app.database import Base, engine
+from app.models import DBImage, DBImageModification
+from app.utils.logging import get_json_logger
+
+log = get_json_logger("app.services.schema_migration")
+
+MODELS = (DBImage, DBImageModification)
+
+
+def migrate_schema(bind: Engine) -> list[str]:
+    """
+    Add model columns and indexes missing from existing tables.
+
+    Args:
+        bind: Engine of the database to migrate
+
+    Returns:
+        Names of the added columns, as "table.column"
+    """
+    inspector = inspect(bind)
+    added: list[str] = []
+
+    with bind.begin() as connection:
+        for model in MODELS:
+            table = Base.metadata.tables[model.__tablename__]
+            if not inspector.has_table(table.name):
+                continue
+
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                connection.execute(text(_add_column_sql(column, bind.dialect)))
+                added.append(f"{table.name}.{column.name}")
+                log.info(f"Added column {table.name}.{column.name}")
+
+            for index in table.indexes:
+                index.create(connection, checkfirst=True)
+
+    return added
+
+
+def _add_column_sql(column: Column, dialect: Dialect) -> str:
+    """
+    ALTER TABLE statement adding a column. Existing rows get the column's
+    scalar default, and the column is NOT NULL only when it has one.
+    """
+    preparer = dialect.identifier_preparer
+    sql = (
+        f"ALTER TABLE {preparer.format_table(column.table)} "
+        f"ADD COLUMN {preparer.format_column(column)} "
+        f"{column.type.compile(dialect=dialect)}"
+    )
+
+    default = column.default
+    if isinstance(default, ColumnDefault) and default.is_scalar:
+        value = literal(default.arg, column.type).compile(
+            dialect=dialect, compile_kwargs={"literal_binds": True}
+        )
+        sql += f" DEFAULT {value}"
+        if not column.nullable:
+            sql += " NOT NULL"
+
+    return sql
+
+
+if __name__ == "__main__":
+    Base.metadata.create_all(bind=engine)
+    migrate_schema(engine)
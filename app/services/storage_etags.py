@@ -0,0 +1,55 @@
+"""
+ETags of files served from storage, derived from the persisted content
+digest of their image, so they survive restarts and copies of the files.
+"""
+import hashlib
+import os
+from typing import Callable, Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal
+from app.models import DBImage
+from app.utils.lru_cache import LRUCache
+
+storage_etags: LRUCache[str] = LRUCache(1024 * 1024, sizeof=len)
+
+
+def storage_etag(
+    relative_path: str,
+    stat_result: os.stat_result,
+    session_factory: Callable[[], Session] = SessionLocal,
+) -> Optional[str]:
+    """
+    ETag of a file under storage/{image_id}/, derived from the image's
+    persisted content digest and the file's path within the image folder.
+    Cached per path and mtime, so a recreated file is looked up again.
+    Queries the database on a miss, so call it from a worker thread.
+
+    Args:
+        relative_path: Path of the file relative to the storage directory
+        stat_result: Result of stat on the file
+        session_factory: Creates the session the digest is read with
+
+    Returns:
+        The ETag, or None for files of images without a digest, which
+        keep the mtime-based ETag
+    """
+    key = (relative_path, stat_result.st_mtime_ns)
+    etag = storage_etags.get(key)
+    if etag is not None:
+        return etag
+
+    image_id, _, file_path = relative_path.partition("/")
+    if not image_id.isdigit():
+        return None
+
+    with session_factory() as db:
+        digest = db.scalar(select(DBImage.digest).where(DBImage.id == int(image_id)))
+    if digest is None:
+        return None
+
+    etag = f'"{hashlib.sha256(f"{digest}/{file_path}".encode()).hexdigest()[:32]}"'
+    storage_etags.put(key, etag)
+    return etag
@@ -0,0 +1,159 @@
+"""
+In-process upload jobs, so uploads can return as soon as the original is
+saved while variants are generated in the background.
+
+Jobs run on the shared CPU executor and live in memory: their progress
+is lost on restart, but the variants they committed are not.
+"""
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Callable, Iterator, Optional
+
+from app.schemas import JobResponse, UploadResponse
+from app.services.cpu_executor import CPUExecutor, cpu_executor
+from app.utils.logging import get_json_logger
+from app.utils.notifier import Notifier
+
+log = get_json_logger("app.services.upload_jobs")
+
+MAX_FINISHED_JOBS = int(os.getenv("APP_MAX_FINISHED_JOBS", "1000"))
+
+
+class UploadJob:
+    """
+    Progress of one background upload. Every change bumps the progress
+    notifier, so streams can wait for the next change.
+    """
+
+    def __init__(self, image_id: int, total_variants: int):
+        self.id = uuid.uuid4().hex
+        self.image_id = image_id
+        self.status = "queued"
+        self.total_variants = total_variants
+        self.completed_variants = 0
+        self.created_at = datetime.now(timezone.utc)
+        self.finished_at: Optional[datetime] = None
+        self.result: Optional[UploadResponse] = None
+        self.error: Optional[str] = None
+        self.progress = Notifier()
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in ("succeeded", "failed")
+
+    def start(self) -> None:
+        self.status = "running"
+        self.progress.notify()
+
+    def advance(self) -> None:
+        self.completed_variants += 1
+        self.progress.notify()
+
+    def succeed(self, result: UploadResponse) -> None:
+        self.result = result
+        self.finished_at = datetime.now(timezone.utc)
+        self.status = "succeeded"
+        self.progress.notify()
+
+    def fail(self, error: str) -> None:
+        self.error = error
+        self.finished_at = datetime.now(timezone.utc)
+        self.status = "failed"
+        self.progress.notify()
+
+    def snapshot(self) -> JobResponse:
+        return JobResponse(
+            id=self.id,
+            image_id=self.image_id,
+            status=self.status,
+            total_variants=self.total_variants,
+            completed_variants=self.completed_variants,
+            created_at=self.created_at,
+            finished_at=self.finished_at,
+            result=self.result,
+            error=self.error,
+        )
+
+    def watch(self, heartbeat_seconds: float = 15) -> Iterator[Optional[JobResponse]]:
+        """
+        Yield a snapshot now and after every change until the job finishes.
+        Yields None when heartbeat_seconds pass without a change.
+        """
+        while True:
+            version = self.progress.version
+            snapshot = self.snapshot()
+            yield snapshot
+            if self.is_finished:
+                return
+
+            while not self.progress.wait(version, heartbeat_seconds):
+                yield None
+
+
+class UploadJobs:
+    """
+    Registry of upload jobs, which run on a CPUExecutor.
+    Only the most recent max_finished finished jobs are kept.
+    """
+
+    def __init__(self, executor: CPUExecutor, max_finished: int = 1000):
+        self.executor = executor
+        self.max_finished = max_finished
+        self._jobs: OrderedDict[str, UploadJob] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(
+        self,
+        image_id: int,
+        total_variants: int,
+        run: Callable[[UploadJob], UploadResponse],
+        cost: int,
+    ) -> UploadJob:
+        """
+        Queue run(job) on the executor and return the job right away.
+        run reports progress through job.advance().
+
+        Raises:
+            HTTPException: 503 if the executor queue is full
+        """
+        job = UploadJob(image_id=image_id, total_variants=total_variants)
+
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+
+        try:
+            self.executor.submit(self._run, job, run, cost=cost)
+        except Exception:
+            with self._lock:
+                del self._jobs[job.id]
+            raise
+
+        log.info(f"Queued upload job {job.id} for image_id: {image_id}")
+        return job
+
+    def get(self, job_id: str) -> Optional[UploadJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job: UploadJob, run: Callable[[UploadJob], UploadResponse]) -> None:
+        job.start()
+        try:
+            job.succeed(run(job))
+        except Exception as e:
+            log.error(f"Upload job {job.id} failed: {e}")
+            job.fail(str(e))
+            return
+
+        log.info(f"Upload job {job.id} finished, image_id: {job.image_id}")
+
+    def _prune(self) -> None:
+        finished = [job_id for job_id, job in self._jobs.items() if job.is_finished]
+        for job_id in finished[: max(0, len(finished) - self.max_finished)]:
+            del self._jobs[job_id]
+
+
+upload_jobs = UploadJobs(cpu_executor, max_finished=MAX_FINISHED_JOBS)
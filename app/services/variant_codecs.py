@@ -0,0 +1,130 @@
+"""
+Registry of file formats that variants can be stored in.
+
+Each stored variant records the name of the codec that wrote it, so it
+is read back with the same codec whatever the current setting is.
+"""
+from dataclasses import dataclass
+from typing import Any, Callable
+
+import numpy as np
+from PIL import Image
+
+PNG_COMPRESS_LEVEL = 6
+
+
+@dataclass(frozen=True)
+class VariantCodec:
+    name: str
+    extension: str
+    media_type: str
+    save: Callable[..., None]
+    load: Callable[[str], Image.Image]
+    options: tuple[str, ...] = ()
+    # whether browsers can display the stored file as is
+    browser_native: bool = True
+    # whether the stored file is already compressed, so archiving it
+    # should not compress it again
+    precompressed: bool = True
+
+
+VARIANT_CODECS: dict[str, VariantCodec] = {}
+
+
+def register_variant_codec(codec: VariantCodec) -> None:
+    """
+    Register a variant codec under its name.
+    """
+    VARIANT_CODECS[codec.name] = codec
+
+
+def get_variant_codec(name: str) -> VariantCodec:
+    """
+    Look up a registered variant codec.
+
+    Raises:
+        ValueError: If no codec is registered under the name
+    """
+    try:
+        return VARIANT_CODECS[name]
+    except KeyError:
+        raise ValueError(f"Unknown variant codec: {name}") from None
+
+
+def save_variant(image: Image.Image, path: str, codec: str, **options: Any) -> None:
+    """
+    Write an RGB image with a registered codec.
+
+    Options the codec does not declare (e.g. ``compress_level`` for ``npy``)
+    are ignored.
+    """
+    variant_codec = get_variant_codec(codec)
+    codec_options = {k: v for k, v in options.items() if k in variant_codec.options}
+    variant_codec.save(image, path, **codec_options)
+
+
+def load_variant(path: str, codec: str) -> Image.Image:
+    """
+    Read a variant written by a registered codec.
+
+    Returns:
+        PIL Image object in RGB mode
+    """
+    image = get_variant_codec(codec).load(path)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    return image
+
+
+def _save_png(
+    image: Image.Image, path: str, compress_level: int = PNG_COMPRESS_LEVEL
+) -> None:
+    image.save(path, "PNG", compress_level=compress_level)
+
+
+def _save_webp(image: Image.Image, path: str) -> None:
+    image.save(path, "WEBP", lossless=True)
+
+
+def _save_npy(image: Image.Image, path: str) -> None:
+    np.save(path, np.asarray(image), allow_pickle=False)
+
+
+def _load_pil(path: str) -> Image.Image:
+    return Image.open(path)
+
+
+def _load_npy(path: str) -> Image.Image:
+    return Image.fromarray(np.load(path, allow_pickle=False))
+
+
+register_variant_codec(
+    VariantCodec(
+        name="png",
+        extension="png",
+        media_type="image/png",
+        save=_save_png,
+        load=_load_pil,
+        options=("compress_level",),
+    )
+)
+register_variant_codec(
+    VariantCodec(
+        name="webp",
+        extension="webp",
+        media_type="image/webp",
+        save=_save_webp,
+        load=_load_pil,
+    )
+)
+register_variant_codec(
+    VariantCodec(
+        name="npy",
+        extension="npy",
+        media_type="application/octet-stream",
+        save=_save_npy,
+        load=_load_npy,
+        browser_native=False,
+        precompressed=False,
+    )
+)
@@ -0,0 +1,268 @@
+"""
+Variant generation that can run inside a process pool.
+The decoded original is shared with workers through shared memory
+instead of being pickled for every variant.
+
+Variants are generated in place on one working image: the patch is stamped,
+the variant is encoded, and the saved patch is restored before the next variant,
+so each variant allocates only patch-sized memory.
+"""
+import hashlib
+import multiprocessing
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from threading import Lock
+from typing import Any, NamedTuple, Optional
+
+import numpy as np
+from PIL import Image as PILImage
+
+from app.services.image_processor import (
+    compute_row_digests,
+    encode_modification_params,
+    outside_region_digest,
+    restore_region,
+    stamp_modifications,
+)
+from app.services.variant_codecs import (
+    PNG_COMPRESS_LEVEL,
+    get_variant_codec,
+    save_variant,
+)
+
+
+class VariantTask(NamedTuple):
+    variant_num: int
+    num_modifications: int
+    seed: int
+    modified_folder: str
+    modification_color: tuple[int, int, int]
+    modification_algorithm: str
+    storage_mode: str = "file"
+    codec: str = "png"
+    compress_level: int = PNG_COMPRESS_LEVEL
+
+
+class VariantResult(NamedTuple):
+    variant_num: int
+    modified_path: str
+    modification_algorithm: str
+    modification_params: str
+    num_modifications: int
+
+
+class SharedImageInfo(NamedTuple):
+    name: str
+    shape: tuple[int, ...]
+
+
+def variant_seeds(seed: Optional[int], num_variants: int) -> list[int]:
+    """
+    Derive one independent, reproducible seed per variant from a base seed.
+    """
+    seed_sequence = np.random.SeedSequence(seed)
+    return [int(s) for s in seed_sequence.generate_state(num_variants, np.uint64)]
+
+
+def generate_and_save_variant(
+    original_image: PILImage.Image,
+    variant_num: int,
+    num_modifications: int,
+    modified_folder: str,
+    modification_color: tuple[int, int, int],
+    modification_algorithm: str = "pixel_color",
+    rng: Optional[random.Random] = None,
+    row_digests: Optional[list[bytes]] = None,
+    save: bool = True,
+    codec: str = "png",
+    compress_level: int = PNG_COMPRESS_LEVEL,
+) -> tuple[str, dict[str, Any]]:
+    """
+    Generate a single variant, save it, and return path and modification params.
+
+    The variant is stamped onto original_image in place and the original
+    patch is restored after saving, so the image is unchanged on return.
+    The params include digests of the original region and of the pixels
+    outside it, used for region-scoped verification.
+
+    Args:
+        original_image: Original PIL Image in RGB mode, used as working buffer
+        variant_num: Variant number (0-99)
+        num_modifications: Number of modifications to apply
+        modified_folder: Folder to save modified image
+        modification_color: RGB color for modifications
+        modification_algorithm: Name of a registered modification algorithm
+        rng: Random generator used by the algorithm
+        row_digests: Row digests of the original from compute_row_digests
+        save: Whether to write the variant file (empty path if not)
+        codec: Name of a registered variant codec to write the file with
+        compress_level: zlib level for the png codec
+
+    Returns:
+        Tuple of (modified_path, modification_params)
+    """
+    modification_params, original_patch = stamp_modifications(
+        original_image,
+        num_modifications,
+        algorithm=modification_algorithm,
+        color=modification_color,
+        rng=rng,
+    )
+    region = modification_params["region"]
+
+    try:
+        modification_params["digests"] = {
+            "region": hashlib.sha256(original_patch.data).hexdigest(),
+            "outside": outside_region_digest(original_image, region, row_digests),
+        }
+
+        modified_path = ""
+        if save:
+            extension = get_variant_codec(codec).extension
+            modified_filename = f"variant_{variant_num:03d}.{extension}"
+            modified_path = os.path.join(modified_folder, modified_filename)
+            save_variant(
+                original_image, modified_path, codec, compress_level=compress_level
+            )
+    finally:
+        restore_region(original_image, region, original_patch)
+
+    return modified_path, modification_params
+
+
+def run_variant_task(
+    original_image: PILImage.Image,
+    task: VariantTask,
+    row_digests: Optional[list[bytes]] = None,
+) -> VariantResult:
+    """
+    Generate one variant with its own seeded generator and encode its
+    params for storage. In "delta" storage mode no image file is written
+    and the returned modified_path is empty.
+    """
+    modified_path, modification_params = generate_and_save_variant(
+        original_image=original_image,
+        variant_num=task.variant_num,
+        num_modifications=task.num_modifications,
+        modified_folder=task.modified_folder,
+        modification_color=task.modification_color,
+        modification_algorithm=task.modification_algorithm,
+        rng=random.Random(task.seed),
+        row_digests=row_digests,
+        save=task.storage_mode != "delta",
+        codec=task.codec,
+        compress_level=task.compress_level,
+    )
+
+    return VariantResult(
+        variant_num=task.variant_num,
+        modified_path=modified_path,
+        modification_algorithm=str(modification_params["algorithm"]),
+        modification_params=encode_modification_params(modification_params),
+        num_modifications=modification_params["num_modifications"],
+    )
+
+
+_working_image: Optional[tuple[str, PILImage.Image, list[bytes]]] = None
+
+
+def run_shared_variant_task(
+    shared_image: SharedImageInfo, task: VariantTask
+) -> VariantResult:
+    """
+    Process pool entry point: run the task on this worker's working image.
+
+    The shared original is copied into the worker's working image, and its
+    row digests computed, on the first task of each upload and reused for
+    the following ones.
+    """
+    global _working_image
+
+    if _working_image is None or _working_image[0] != shared_image.name:
+        _working_image = None
+        working_image = _copy_shared_image(shared_image)
+        _working_image = (
+            shared_image.name,
+            working_image,
+            compute_row_digests(working_image),
+        )
+
+    _, working_image, row_digests = _working_image
+    return run_variant_task(working_image, task, row_digests)
+
+
+def _copy_shared_image(shared_image: SharedImageInfo) -> PILImage.Image:
+    """
+    Copy the shared original into a new image owned by this process.
+    """
+    shm = shared_memory.SharedMemory(name=shared_image.name)
+    try:
+        pixels: np.ndarray = np.ndarray(
+            shared_image.shape, dtype=np.uint8, buffer=shm.buf
+        )
+        image = PILImage.fromarray(pixels)
+        del pixels
+        return image
+    finally:
+        shm.close()
+
+
+class SharedImage:
+    """
+    Copy of an RGB image in a shared memory block, released on exit.
+    """
+
+    def __init__(self, image: PILImage.Image):
+        pixels = np.asarray(image)
+        self.shm = shared_memory.SharedMemory(create=True, size=pixels.nbytes)
+        shared: np.ndarray = np.ndarray(
+            pixels.shape, dtype=np.uint8, buffer=self.shm.buf
+        )
+        shared[...] = pixels
+        del shared
+        self.info = SharedImageInfo(name=self.shm.name, shape=pixels.shape)
+
+    def __enter__(self) -> SharedImageInfo:
+        return self.info
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.shm.close()
+        self.shm.unlink()
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_workers = 0
+_pool_lock = Lock()
+
+
+def get_generation_pool(max_workers: int) -> ProcessPoolExecutor:
+    """
+    Return the process pool shared by all uploads in this process,
+    creating it on first use.
+    """
+    global _pool, _pool_workers
+
+    with _pool_lock:
+        if _pool is None or _pool_workers != max_workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(
+                max_workers=max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            _pool_workers = max_workers
+        return _pool
+
+
+def shutdown_generation_pool() -> None:
+    """
+    Shut down the shared process pool if it was started.
+    """
+    global _pool
+
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
@@ -0,0 +1,143 @@
+"""
+ZIP and tar archives written as a stream of byte chunks, so an archive of
+any size can be sent without holding it in memory or on disk.
+"""
+import tarfile
+import time
+import zipfile
+from typing import IO, Iterable, Iterator, NamedTuple, cast
+
+CHUNK_SIZE = 1024 * 1024
+
+ARCHIVE_MEDIA_TYPES = {"zip": "application/zip", "tar": "application/x-tar"}
+
+
+class ArchiveEntry(NamedTuple):
+    name: str
+    size: int
+    chunks: Iterable[bytes]
+    # whether the content is worth deflating, only used for ZIP
+    compress: bool = False
+    mtime: float = 0
+
+
+def file_chunks(path: str, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    Read a file in chunks of at most chunk_size bytes.
+    """
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            yield chunk
+
+
+def stream_archive(
+    archive_format: str, entries: Iterable[ArchiveEntry]
+) -> Iterator[bytes]:
+    """
+    Stream an archive of the entries in one of ARCHIVE_MEDIA_TYPES.
+
+    Raises:
+        ValueError: If the format is unknown
+    """
+    if archive_format == "zip":
+        return stream_zip(entries)
+    if archive_format == "tar":
+        return stream_tar(entries)
+    raise ValueError(f"Unknown archive format: {archive_format}")
+
+
+class _ChunkWriter:
+    """
+    Write-only file object that collects what zipfile writes until taken.
+    Having no tell or seek makes zipfile write data descriptors instead of
+    seeking back to patch local headers.
+    """
+
+    def __init__(self) -> None:
+        self._chunks: list[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def stream_zip(entries: Iterable[ArchiveEntry]) -> Iterator[bytes]:
+    """
+    Stream a ZIP archive. Entries are deflated when marked compress and
+    stored as is otherwise, and only one chunk of content is buffered.
+
+    Raises:
+        ValueError: If an entry yields more or fewer bytes than its size
+    """
+    writer = _ChunkWriter()
+    with zipfile.ZipFile(cast(IO[bytes], writer), "w") as archive:
+        for entry in entries:
+            info = zipfile.ZipInfo(
+                entry.name, time.localtime(entry.mtime or time.time())[:6]
+            )
+            info.compress_type = (
+                zipfile.ZIP_DEFLATED if entry.compress else zipfile.ZIP_STORED
+            )
+            info.external_attr = 0o644 << 16
+            info.file_size = entry.size
+
+            with archive.open(info, "w") as f:
+                written = 0
+                for chunk in entry.chunks:
+                    f.write(chunk)
+                    written += len(chunk)
+                    if data := writer.take():
+                        yield data
+                _check_size(entry, written)
+            if data := writer.take():
+                yield data
+    yield writer.take()
+
+
+def stream_tar(entries: Iterable[ArchiveEntry]) -> Iterator[bytes]:
+    """
+    Stream an uncompressed POSIX tar archive, one chunk of content at a time.
+
+    Raises:
+        ValueError: If an entry yields more or fewer bytes than its size
+    """
+    total = 0
+    for entry in entries:
+        info = tarfile.TarInfo(entry.name)
+        info.size = entry.size
+        info.mtime = int(entry.mtime or time.time())
+        info.mode = 0o644
+
+        header = info.tobuf(tarfile.PAX_FORMAT)
+        total += len(header)
+        yield header
+
+        written = 0
+        for chunk in entry.chunks:
+            written += len(chunk)
+            yield chunk
+        _check_size(entry, written)
+
+        padding = -written % tarfile.BLOCKSIZE
+        total += written + padding
+        yield tarfile.NUL * padding
+
+    # two empty blocks end the archive, padded to a whole record like tarfile does
+    end = 2 * tarfile.BLOCKSIZE
+    end += -(total + end) % tarfile.RECORDSIZE
+    yield tarfile.NUL * end
+
+
+def _check_size(entry: ArchiveEntry, written: int) -> None:
+    if written != entry.size:
+        raise ValueError(
+            f"Archive entry {entry.name} is {written} bytes, expected {entry.size}"
+        )
@@ -0,0 +1,26 @@
+from threading import Condition
+
+
+class Notifier:
+    """
+    In-process wakeup channel. Each notify() bumps a version, and waiters
+    block until the version differs from the one they last saw, so a
+    notification sent between reading the version and waiting is not lost.
+    """
+
+    def __init__(self) -> None:
+        self.version = 0
+        self._condition = Condition()
+
+    def notify(self) -> None:
+        with self._condition:
+            self.version += 1
+            self._condition.notify_all()
+
+    def wait(self, version: int, timeout: float) -> bool:
+        """
+        Block until notified after version, or until timeout seconds pass.
+        Returns True if notified.
+        """
+        with self._condition:
+            return self._condition.wait_for(lambda: self.version != version, timeout)
@@ -0,0 +1,61 @@
+import os
+from typing import Any, Callable, Optional
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, PathLike, StaticFiles
+from starlette.types import Scope
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+class ImmutableStaticFiles(StaticFiles):
+    """
+    StaticFiles for files that never change once written. Responses are
+    cacheable forever, and etag_for can derive ETags from persisted
+    content digests instead of the file mtime. etag_for may block, so it
+    runs in the threadpool. If-None-Match, If-Range and Range requests are
+    handled by StaticFiles and FileResponse.
+    """
+
+    def __init__(
+        self,
+        *,
+        etag_for: Callable[[str, os.stat_result], Optional[str]],
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(**kwargs)
+        self.etag_for = etag_for
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        response = await super().get_response(path, scope)
+        if not isinstance(response, FileResponse) or response.stat_result is None:
+            return response
+
+        relative_path = os.path.relpath(response.path, str(self.directory))
+        etag = await run_in_threadpool(
+            self.etag_for, relative_path.replace(os.sep, "/"), response.stat_result
+        )
+        if etag is not None:
+            response.headers["etag"] = etag
+
+        if self.is_not_modified(response.headers, Headers(scope=scope)):
+            return NotModifiedResponse(response.headers)
+        return response
+
+    def file_response(
+        self,
+        full_path: PathLike,
+        stat_result: os.stat_result,
+        scope: Scope,
+        status_code: int = 200,
+    ) -> Response:
+        # conditional requests are answered by get_response, once the ETag
+        # is known
+        return FileResponse(
+            full_path,
+            status_code=status_code,
+            stat_result=stat_result,
+            headers={"cache-control": IMMUTABLE_CACHE_CONTROL},
+        )
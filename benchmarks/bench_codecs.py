@@ -0,0 +1,73 @@
+"""
+Compare variant codecs by encode time, decode time and bytes on disk.
+
+Usage:
+    python -m benchmarks.bench_codecs --megapixels 12
+    python -m benchmarks.bench_codecs --image photo.jpg
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from PIL import Image
+
+from app.services.variant_codecs import get_variant_codec, load_variant, save_variant
+
+PROFILES: list[tuple[str, dict[str, int]]] = [
+    ("png", {"compress_level": 1}),
+    ("png", {"compress_level": 6}),
+    ("png", {"compress_level": 9}),
+    ("webp", {}),
+    ("npy", {}),
+]
+
+
+def make_images(megapixels: float) -> dict[str, Image.Image]:
+    side = int((megapixels * 1_000_000) ** 0.5)
+    gradient = Image.radial_gradient("L").resize((side, side)).convert("RGB")
+    noise = Image.effect_noise((side, side), 64).convert("RGB")
+    return {"gradient": gradient, "noise": noise}
+
+
+def bench_codec(
+    image: Image.Image, codec: str, options: dict[str, int], folder: str
+) -> tuple[float, float, int]:
+    path = os.path.join(folder, f"variant.{get_variant_codec(codec).extension}")
+
+    start = time.perf_counter()
+    save_variant(image, path, codec, **options)
+    encode_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    load_variant(path, codec).load()
+    decode_seconds = time.perf_counter() - start
+
+    return encode_seconds, decode_seconds, os.path.getsize(path)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--megapixels", type=float, default=4)
+    parser.add_argument("--image", nargs="*", default=[])
+    args = parser.parse_args()
+
+    images = make_images(args.megapixels)
+    for path in args.image:
+        images[os.path.basename(path)] = Image.open(path).convert("RGB")
+
+    with tempfile.TemporaryDirectory() as folder:
+        for name, image in images.items():
+            raw_bytes = image.width * image.height * 3
+            for codec, options in PROFILES:
+                encode, decode, size = bench_codec(image, codec, options, folder)
+                label = codec + "".join(f" {k}={v}" for k, v in options.items())
+                print(
+                    f"{name} {label}: encode {encode * 1000:.0f} ms, "
+                    f"decode {decode * 1000:.0f} ms, "
+                    f"{size / 1024:.0f} KB ({size / raw_bytes:.0%} of raw)"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Benchmark a full 100-variant upload through GeneratorService.
+
+Usage:
+    python -m benchmarks.bench_generation --megapixels 12 --workers 0 4
+"""
+import argparse
+import io
+import logging
+import tempfile
+import time
+
+from PIL import Image
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base
+from app.services.generator_service import GeneratorService
+from app.services.variant_worker import shutdown_generation_pool
+
+
+def make_upload(megapixels: float) -> bytes:
+    side = int((megapixels * 1_000_000) ** 0.5)
+    buffer = io.BytesIO()
+    Image.radial_gradient("L").resize((side, side)).convert("RGB").save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def bench_upload(contents: bytes, workers: int) -> float:
+    engine = create_engine("sqlite+pysqlite:///:memory:")
+    Base.metadata.create_all(bind=engine)
+
+    with tempfile.TemporaryDirectory() as storage_path:
+        with sessionmaker(bind=engine)() as db:
+            service = GeneratorService(
+                db=db, storage_path=storage_path, generation_workers=workers
+            )
+            start = time.perf_counter()
+            service.process_uploaded_image(contents, seed=0)
+            return time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--megapixels", type=float, default=1)
+    parser.add_argument("--workers", type=int, nargs="+", default=[0, 4])
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    contents = make_upload(args.megapixels)
+
+    try:
+        for workers in args.workers:
+            elapsed = bench_upload(contents, workers)
+            print(f"{args.megapixels}MP, workers={workers}: {elapsed:.2f} s")
+    finally:
+        shutdown_generation_pool()
+
+
+if __name__ == "__main__":
+    main()
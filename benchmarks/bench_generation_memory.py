@@ -0,0 +1,66 @@
+"""
+Measure peak RSS of a 100-variant upload relative to the decoded image size.
+
+Each run happens in a fresh process so ru_maxrss only covers that upload.
+
+Usage:
+    python -m benchmarks.bench_generation_memory --megapixels 24
+"""
+import argparse
+import logging
+import multiprocessing
+import resource
+import tempfile
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base
+from app.services.generator_service import GeneratorService
+from benchmarks.bench_generation import make_upload
+
+
+def peak_rss_bytes() -> int:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def measure_upload(contents: bytes, queue: multiprocessing.Queue) -> None:
+    logging.disable(logging.INFO)
+
+    engine = create_engine("sqlite+pysqlite:///:memory:")
+    Base.metadata.create_all(bind=engine)
+
+    with tempfile.TemporaryDirectory() as storage_path:
+        with sessionmaker(bind=engine)() as db:
+            service = GeneratorService(db=db, storage_path=storage_path)
+            baseline = peak_rss_bytes()
+            service.process_uploaded_image(contents, seed=0)
+            queue.put((baseline, peak_rss_bytes()))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--megapixels", type=float, default=24)
+    args = parser.parse_args()
+
+    side = int((args.megapixels * 1_000_000) ** 0.5)
+    decoded_size = side * side * 3
+
+    ctx = multiprocessing.get_context("spawn")
+    queue: multiprocessing.Queue = ctx.Queue()
+    contents = make_upload(args.megapixels)
+    process = ctx.Process(target=measure_upload, args=(contents, queue))
+    process.start()
+    baseline, peak = queue.get()
+    process.join()
+
+    growth = peak - baseline
+    print(
+        f"{args.megapixels}MP: decoded {decoded_size / 2**20:.0f} MiB, "
+        f"peak RSS growth {growth / 2**20:.0f} MiB "
+        f"({growth / decoded_size:.2f}x decoded size)"
+    )
+
+
+if __name__ == "__main__":
+    main()
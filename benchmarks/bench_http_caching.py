@@ -0,0 +1,82 @@
+"""
+Benchmark bytes served when the details page of an image is loaded twice
+against a running API, the second time revalidating every resource with
+the ETag from the first load, as a browser cache would.
+
+Usage:
+    python -m benchmarks.bench_http_caching --image-id 1
+    python -m benchmarks.bench_http_caching --base-url http://localhost:8000
+"""
+import argparse
+from typing import Optional
+
+import requests
+
+
+def details_page_urls(
+    session: requests.Session, base_url: str, image_id: int
+) -> list[str]:
+    """
+    Files the details page loads: the original, its thumbnail and the
+    thumbnail and stored file of every variant.
+    """
+    response = session.get(f"{base_url}/api/images/{image_id}")
+    response.raise_for_status()
+    image = response.json()
+
+    urls = [
+        f"{base_url}/{image['original_image_path']}",
+        f"{base_url}/api/images/{image_id}/thumbnail?size=512",
+    ]
+    for modification in image["modifications"]:
+        urls.append(f"{base_url}/{modification['modified_image_path']}")
+        urls.append(
+            f"{base_url}/api/modifications/{modification['id']}/thumbnail?size=256"
+        )
+    return urls
+
+
+def load(
+    session: requests.Session, urls: list[str], etags: dict[str, Optional[str]]
+) -> tuple[int, int]:
+    """
+    GET every url, sending If-None-Match when an ETag is known.
+
+    Returns:
+        Bytes received and the number of 304 responses
+    """
+    received = 0
+    not_modified = 0
+    for url in urls:
+        etag = etags.get(url)
+        headers = {"If-None-Match": etag} if etag else {}
+        response = session.get(url, headers=headers)
+        if response.status_code == 304:
+            not_modified += 1
+            continue
+        response.raise_for_status()
+        received += len(response.content)
+        etags[url] = response.headers.get("etag")
+    return received, not_modified
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--image-id", type=int, default=1)
+    args = parser.parse_args()
+
+    with requests.Session() as session:
+        urls = details_page_urls(session, args.base_url, args.image_id)
+        etags: dict[str, Optional[str]] = {}
+
+        for label in ("first load", "reload"):
+            received, not_modified = load(session, urls, etags)
+            print(
+                f"{label}: {len(urls)} requests, {received / 1024:.1f} KB, "
+                f"{not_modified} not modified"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Benchmark apply_pixel_color_modifications against the per-pixel loop it replaced.
+
+Usage:
+    python -m benchmarks.bench_pixel_color
+"""
+import random
+import time
+from typing import Callable
+
+from PIL import Image
+
+from app.services.image_processor import (
+    apply_pixel_color_modifications,
+    compute_modification_region,
+)
+
+SIZES = {
+    "1MP": (1000, 1000),
+    "12MP": (4000, 3000),
+}
+NUM_MODIFICATIONS = 1_000_000
+REPEATS = 3
+
+
+def apply_pixel_loop(
+    image: Image.Image,
+    num_modifications: int,
+    color: tuple[int, int, int] = (0, 255, 0),
+) -> tuple[Image.Image, dict[str, object]]:
+    """Per-pixel implementation kept as the reference point."""
+    img = image.copy()
+    width, height = img.size
+    pixels = img.load()
+    assert pixels is not None
+
+    start_x, start_y, rect_width, rect_height = compute_modification_region(
+        width, height, num_modifications
+    )
+
+    original_pixels = []
+    for x in range(start_x, start_x + rect_width):
+        for y in range(start_y, start_y + rect_height):
+            original_pixels.append((x, y, pixels[x, y]))
+            pixels[x, y] = color
+
+    return img, {"original_pixels": original_pixels}
+
+
+def best_of(fn: Callable[[], object], repeats: int = REPEATS) -> float:
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def bench_size(label: str, size: tuple[int, int]) -> None:
+    image = Image.effect_noise(size, 64).convert("RGB")
+
+    random.seed(0)
+    loop_image, _ = apply_pixel_loop(image, NUM_MODIFICATIONS)
+    random.seed(0)
+    array_image, _ = apply_pixel_color_modifications(image, NUM_MODIFICATIONS)
+    assert loop_image.tobytes() == array_image.tobytes()
+
+    loop_time = best_of(lambda: apply_pixel_loop(image, NUM_MODIFICATIONS))
+    array_time = best_of(
+        lambda: apply_pixel_color_modifications(image, NUM_MODIFICATIONS)
+    )
+
+    print(
+        f"{label}: pixel loop {loop_time * 1000:.1f} ms, "
+        f"array {array_time * 1000:.1f} ms, "
+        f"speedup {loop_time / array_time:.1f}x"
+    )
+
+
+def main() -> None:
+    for label, size in SIZES.items():
+        bench_size(label, size)
+
+
+if __name__ == "__main__":
+    main()
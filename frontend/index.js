@@ -3,25 +3,27 @@ import { raiseForStatus } from './utils.js';
 function indexApp() {
   return {
     images: [],
-    page: 1,
+    nextCursor: null,
     isUploading: false,
+    job: null,
 
     async init() {
-      await this.getImages(this.page)
+      await this.getImages()
     },
 
-    async getImages(page) {
-        if (page == null) return
-
+    async getImages(cursor = null) {
         try {
-            const res = await fetch(`/api/images/`)
+            const params = new URLSearchParams()
+            if (cursor) params.set('cursor', cursor)
+
+            const res = await fetch(`/api/images?${params}`)
             const resJson = await raiseForStatus(res)
-            if (page = 1) {
+            if (cursor == null) {
               this.images = resJson
             } else {
               this.images.push(...resJson)
             }
-            this.page += 1
+            this.nextCursor = res.headers.get('X-Next-Cursor')
         } catch(err) {
             this.error = err
             console.log(this.error)
@@ -43,14 +45,17 @@ function indexApp() {
         const formData = new FormData()
         formData.append('file', file)
 
-        const res = await fetch('/api/images/', {
+        const res = await fetch('/api/images?background=true', {
           method: 'POST',
           body: formData,
         })
 
-        await raiseForStatus(res)
+        const resJson = await raiseForStatus(res)
+        if (res.status === 202) {
+          await this.watchJob(resJson)
+        }
 
-        await this.getImages(1)
+        await this.getImages()
         this.$refs.fileInput.value = ''
 
       } catch(err) {
@@ -59,8 +64,41 @@ function indexApp() {
         alert('Upload failed: ' + err.message);
       } finally {
         this.isUploading = false;
+        this.job = null;
       }
     },
+
+    watchJob(job) {
+      this.job = job
+
+      return new Promise((resolve, reject) => {
+        const events = new EventSource(`/api/jobs/${job.id}/events`)
+
+        events.addEventListener('progress', (e) => {
+          this.job = JSON.parse(e.data)
+        })
+
+        events.addEventListener('done', (e) => {
+          events.close()
+          this.job = JSON.parse(e.data)
+          if (this.job.status === 'failed') {
+            reject(new Error(this.job.error))
+          } else {
+            resolve(this.job)
+          }
+        })
+
+        events.onerror = () => {
+          events.close()
+          reject(new Error(`Lost progress of job ${job.id}`))
+        }
+      })
+    },
+
+    jobPercent() {
+      if (!this.job || !this.job.total_variants) return 0
+      return Math.round(100 * this.job.completed_variants / this.job.total_variants)
+    },
   }
 }
 
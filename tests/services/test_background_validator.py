@@ -1,9 +1,21 @@
+import io
+import json
+import threading
+import time
+from pathlib import Path
 from typing import Any
 from unittest.mock import MagicMock, patch
 
 import pytest
+from PIL import Image as PILImage
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
 
-from app.services.background_validator import BackgroundValidator
+from app.database import Base
+from app.models import DBImageModification
+from app.services.background_validator import BackgroundValidator, DirectValidator
+from app.services.cpu_executor import CPUExecutor
+from app.services.generator_service import GeneratorService
 
 
 @pytest.fixture
@@ -19,54 +31,178 @@ def make_mock_response(data: Any, status_code: int = 200) -> MagicMock:
     return mock_resp
 
 
-def test_get_pending_modifications_success(
+def test_validate_modifications_batch_success(
     validator_service: BackgroundValidator,
 ) -> None:
-    mock_response: list[dict[str, str | int]] = [
-        {
-            "id": 0,
-            "image_id": 0,
-            "modified_image_path": "string",
-            "modification_algorithm": "string",
-            "num_modifications": 0,
-            "verification_status": "string",
-            "created_at": "2026-02-27T12:35:59.967Z",
-            "verified_at": "2026-02-27T12:35:59.967Z",
-        }
+    results = [
+        {"modification_id": 1, "is_reversible": True, "error": None},
+        {"modification_id": 2, "is_reversible": None, "error": "not found"},
     ]
+    mock_resp = make_mock_response(None)
+    mock_resp.iter_lines.return_value = [
+        json.dumps(result).encode() for result in results
+    ] + [b""]
 
-    with patch(
-        "requests.get", return_value=make_mock_response(mock_response)
-    ) as mock_get:
-        result = validator_service.get_pending_modifications()
+    with patch.object(
+        validator_service.session, "post", return_value=mock_resp
+    ) as mock_post:
+        result = validator_service.validate_modifications_batch([1, 2])
 
-    mock_get.assert_called_once_with(
-        f"{validator_service.api_endpoint}/api/modifications",
-        params={"skip": 0, "limit": 100, "status": "pending"},
+    mock_post.assert_called_once_with(
+        f"{validator_service.api_endpoint}/api/modifications/reverse-batch",
+        json={"modification_ids": [1, 2], "should_save_reversed_img": False},
         timeout=60,
+        stream=True,
+    )
+    assert result == results
+
+
+def test_validate_pending_runs_batches_concurrently() -> None:
+    validator_service = BackgroundValidator(
+        api_endpoint="http://fake:8000", max_in_flight=3, batch_size=4
     )
-    assert result == mock_response
-
-
-def test_validate_modification_success(validator_service: BackgroundValidator) -> None:
-    mod_id = 1
-    mock_response: dict[str, str | int] = {
-        "modification_id": mod_id,
-        "message": "string",
-        "reversed_path": "string",
-        "original_path": "string",
-        "modified_path": "string",
-        "is_reversible": True,
+    barrier = threading.Barrier(3, timeout=5)
+
+    def validate_batch(ids: list[int]) -> list[dict[str, Any]]:
+        barrier.wait()
+        return [{"modification_id": id, "is_reversible": id != 5} for id in ids]
+
+    with patch.object(
+        validator_service, "validate_modifications_batch", side_effect=validate_batch
+    ) as mock_batch:
+        verified = validator_service.validate_pending(list(range(10)))
+
+    assert verified == 10
+    assert [call.args[0] for call in mock_batch.call_args_list] == [
+        [0, 1, 2, 3],
+        [4, 5, 6, 7],
+        [8, 9],
+    ]
+
+
+def test_claim_modifications_success(validator_service: BackgroundValidator) -> None:
+    mock_response = {
+        "worker_id": validator_service.worker_id,
+        "lease_expires_at": "2026-02-27T12:40:59.967Z",
+        "modification_ids": [3, 4],
     }
 
-    with patch(
-        "requests.post", return_value=make_mock_response(mock_response)
+    with patch.object(
+        validator_service.session,
+        "post",
+        return_value=make_mock_response(mock_response),
     ) as mock_post:
-        result = validator_service.validate_modification(mod_id)
+        result = validator_service.claim_modifications(limit=2, wait_seconds=30)
 
     mock_post.assert_called_once_with(
-        f"{validator_service.api_endpoint}/api/modifications/{mod_id}/reverse/",
-        json={"should_save_reversed_img": False},
-        timeout=60,
+        f"{validator_service.api_endpoint}/api/modifications/claim",
+        json={
+            "worker_id": validator_service.worker_id,
+            "limit": 2,
+            "lease_seconds": 300,
+            "wait_seconds": 30,
+        },
+        timeout=90,
+    )
+    assert result == [3, 4]
+
+
+def test_direct_validator_verifies_uploads(tmp_path: Path) -> None:
+    engine = create_engine(f"sqlite:///{tmp_path / 'validator.db'}")
+    Base.metadata.create_all(bind=engine)
+    SessionLocal = sessionmaker(bind=engine)
+
+    validator = DirectValidator(
+        storage_path=str(tmp_path),
+        session_factory=SessionLocal,
+        embedded=True,
+        max_in_flight=2,
+        batch_size=30,
     )
-    assert result == mock_response
+    thread = threading.Thread(target=validator.run, kwargs={"wait_seconds": 10})
+    thread.start()
+
+    try:
+        buffer = io.BytesIO()
+        PILImage.effect_noise((16, 12), 64).convert("RGB").save(buffer, "PNG")
+        with SessionLocal() as session:
+            GeneratorService(
+                db=session, storage_path=str(tmp_path)
+            ).process_uploaded_image(buffer.getvalue(), seed=6)
+
+        with SessionLocal() as session:
+            for _ in range(100):
+                statuses = {
+                    m.verification_status
+                    for m in session.query(DBImageModification).all()
+                }
+                if statuses == {"true"}:
+                    break
+                session.expire_all()
+                time.sleep(0.05)
+    finally:
+        validator.stop()
+        thread.join(timeout=10)
+
+    assert not thread.is_alive()
+    assert statuses == {"true"}
+
+
+def test_standalone_direct_validator_polls(tmp_path: Path) -> None:
+    engine = create_engine(f"sqlite:///{tmp_path / 'validator.db'}")
+    Base.metadata.create_all(bind=engine)
+    SessionLocal = sessionmaker(bind=engine)
+    validator = DirectValidator(
+        storage_path=str(tmp_path), session_factory=SessionLocal, poll_seconds=0.1
+    )
+
+    started_at = time.monotonic()
+    ids = validator.claim_modifications(wait_seconds=30)
+
+    # uploads to another process cannot wake the wait, so it is short
+    assert ids == []
+    assert time.monotonic() - started_at < 5
+
+
+def test_direct_validator_waits_for_executor_capacity(tmp_path: Path) -> None:
+    engine = create_engine(f"sqlite:///{tmp_path / 'validator.db'}")
+    Base.metadata.create_all(bind=engine)
+    SessionLocal = sessionmaker(bind=engine)
+
+    buffer = io.BytesIO()
+    PILImage.effect_noise((16, 12), 64).convert("RGB").save(buffer, "PNG")
+    with SessionLocal() as session:
+        GeneratorService(db=session, storage_path=str(tmp_path)).process_uploaded_image(
+            buffer.getvalue(), seed=6
+        )
+        ids = [m.id for m in session.query(DBImageModification).limit(5)]
+
+    executor = CPUExecutor(max_workers=1, max_queued_jobs=1, max_queued_cost=10**9)
+    validator = DirectValidator(
+        storage_path=str(tmp_path), session_factory=SessionLocal, executor=executor
+    )
+    started = threading.Event()
+    release = threading.Event()
+
+    def block() -> None:
+        started.set()
+        release.wait(5)
+
+    try:
+        executor.submit(block, cost=1)
+        assert started.wait(5)
+        # the executor is busy with one job queued behind it
+        executor.submit(lambda: None, cost=1)
+        timer = threading.Timer(0.2, release.set)
+        timer.start()
+        results = validator.validate_modifications_batch(ids)
+        timer.join()
+    finally:
+        release.set()
+        executor.shutdown()
+
+    stats = executor.stats()
+    assert [r["is_reversible"] for r in results] == [True] * len(ids)
+    assert stats["rejected"] >= 1
+    # the reversals ran on the shared executor after the two queued jobs
+    assert stats["completed"] > 2
@@ -0,0 +1,76 @@
+import threading
+
+import pytest
+from fastapi import HTTPException
+
+from app.services.cpu_executor import CPUExecutor
+
+
+def test_cpu_executor_runs_jobs_and_records_stats() -> None:
+    executor = CPUExecutor(max_workers=2, max_queued_jobs=4, max_queued_cost=100)
+
+    try:
+        results = [executor.submit(pow, 2, n, cost=10).result() for n in range(3)]
+    finally:
+        executor.shutdown()
+
+    stats = executor.stats()
+    assert results == [1, 2, 4]
+    assert stats["completed"] == 3
+    assert stats["queued_jobs"] == 0
+    assert stats["queued_cost"] == 0
+    assert stats["running"] == 0
+
+
+def test_cpu_executor_rejects_when_queue_is_full() -> None:
+    executor = CPUExecutor(max_workers=1, max_queued_jobs=10, max_queued_cost=100)
+    started = threading.Event()
+    release = threading.Event()
+
+    def block() -> None:
+        started.set()
+        release.wait(5)
+
+    try:
+        running = executor.submit(block, cost=1000)
+        assert started.wait(5)
+        # one job over budget is admitted while nothing is queued
+        queued = executor.submit(lambda: None, cost=1000)
+
+        with pytest.raises(HTTPException) as exc_info:
+            executor.submit(lambda: None, cost=1)
+        with pytest.raises(HTTPException):
+            executor.check_capacity(1)
+        forced = executor.submit(lambda: None, cost=1, force=True)
+
+        assert exc_info.value.status_code == 503
+        assert exc_info.value.headers is not None
+        assert int(exc_info.value.headers["Retry-After"]) >= 1
+        assert executor.stats()["queued_jobs"] == 2
+    finally:
+        release.set()
+        executor.shutdown()
+
+    for future in (running, queued, forced):
+        assert future.done()
+    assert executor.stats()["rejected"] == 2
+
+
+def test_cpu_executor_limits_queued_jobs() -> None:
+    executor = CPUExecutor(max_workers=1, max_queued_jobs=1, max_queued_cost=10**9)
+    started = threading.Event()
+    release = threading.Event()
+
+    def block() -> None:
+        started.set()
+        release.wait(5)
+
+    try:
+        executor.submit(block, cost=1)
+        assert started.wait(5)
+        executor.submit(lambda: None, cost=1)
+        with pytest.raises(HTTPException):
+            executor.submit(lambda: None, cost=1)
+    finally:
+        release.set()
+        executor.shutdown()
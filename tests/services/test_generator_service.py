@@ -1,35 +1,45 @@
+import io
 import json
 import os
+import tarfile
+import zipfile
 from pathlib import Path
-from typing import Iterator
 
+import numpy as np
 import pytest
 from fastapi import HTTPException
 from PIL import Image as PILImage
-from sqlalchemy import create_engine
-from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.orm import Session
 
-from app.database import Base
 from app.models import DBImage, DBImageModification
-from app.services.generator_service import GeneratorService
-
-
-@pytest.fixture
-def db_session() -> Iterator[Session]:
-    engine = create_engine(
-        "sqlite+pysqlite:///:memory:",
-        connect_args={"check_same_thread": False},
-        future=True,
-    )
-
-    Base.metadata.create_all(bind=engine)
-
-    SessionLocal = sessionmaker(
-        bind=engine, autoflush=False, autocommit=False, future=True
-    )
-
-    with SessionLocal() as session:
-        yield session
+from app.schemas import UploadResponse
+from app.services import generator_service as generator_service_module
+from app.services.cpu_executor import CPUExecutor
+from app.services.generator_service import (
+    GeneratorService,
+    decoded_originals,
+    mapped_originals,
+    raw_original_path,
+)
+from app.services.image_processor import (
+    encode_modification_params,
+    image_digest,
+    image_hash,
+    map_raw_image,
+    pixels_hash,
+    reverse_pixel_color_modifications,
+)
+from app.services.modification_leases import MAX_VERIFY_ATTEMPTS, claim_modifications
+from app.services.variant_worker import (
+    generate_and_save_variant,
+    shutdown_generation_pool,
+)
+
+
+def forget_image_digests(db: Session) -> None:
+    """Let the same image be uploaded again instead of deduplicated."""
+    db.query(DBImage).update({DBImage.digest: None})
+    db.commit()
 
 
 @pytest.fixture
@@ -60,13 +70,11 @@ def test_create_image_record(generator_service: GeneratorService) -> None:
     assert image_record.original_image_path == ""
 
 
-def test_generate_and_save_variant(
-    generator_service: GeneratorService, tmp_path: Path
-) -> None:
+def test_generate_and_save_variant(tmp_path: Path) -> None:
     original = PILImage.new("RGB", (32, 32), (10, 20, 30))
     modified_folder = str(tmp_path)
 
-    out_path, params = generator_service._generate_and_save_variant(
+    out_path, params = generate_and_save_variant(
         original_image=original,
         variant_num=7,
         num_modifications=9,
@@ -83,6 +91,8 @@ def test_generate_and_save_variant(
 
     assert isinstance(params, dict)
     assert params.get("num_modifications") == 9
+    assert original.tobytes() == PILImage.new("RGB", (32, 32), (10, 20, 30)).tobytes()
+    assert saved.tobytes() != original.tobytes()
 
 
 def test_get_modification_with_image_found(generator_service: GeneratorService) -> None:
@@ -189,5 +199,642 @@ def test_parse_and_convert_modification_params(
 
     assert out["algorithm"] == "pixel_color"
     assert isinstance(out["original_pixels"], list)
-    assert out["original_pixels"][0] == (10, 20, (255, 1, 2))
-    assert out["original_pixels"][1] == (11, 21, (1, 255, 2))
+    assert out["original_pixels"][0] == [10, 20, [255, 1, 2]]
+    assert out["original_pixels"][1] == [11, 21, [1, 255, 2]]
+
+
+def test_parse_and_convert_modification_params_compact(
+    generator_service: GeneratorService, tmp_path: Path
+) -> None:
+    original = PILImage.effect_noise((32, 32), 64).convert("RGB")
+
+    out_path, params = generate_and_save_variant(
+        original_image=original,
+        variant_num=0,
+        num_modifications=49,
+        modified_folder=str(tmp_path),
+        modification_color=(0, 255, 0),
+    )
+
+    out = generator_service._parse_and_convert_modification_params(
+        encode_modification_params(params)
+    )
+
+    assert out["region"] == params["region"]
+    assert out["original_patch"].shape == (7, 7, 3)
+
+    reversed_image = reverse_pixel_color_modifications(PILImage.open(out_path), out)
+    assert reversed_image.tobytes() == original.tobytes()
+
+
+@pytest.mark.parametrize("algorithm", ["pixel_color", "xor_mask"])
+def test_process_uploaded_image_and_reverse(
+    generator_service: GeneratorService, algorithm: str
+) -> None:
+    buffer = io.BytesIO()
+    PILImage.effect_noise((16, 12), 64).convert("RGB").save(buffer, "PNG")
+
+    result = generator_service.process_uploaded_image(
+        buffer.getvalue(), modification_algorithm=algorithm
+    )
+
+    assert len(result.modifications) == 100
+    modification = generator_service.db.get(
+        DBImageModification, result.modifications[0].id
+    )
+    assert modification is not None
+    assert modification.modification_algorithm == algorithm
+
+    reversed_result = generator_service.reverse_modification(modification.id)
+
+    assert reversed_result.is_reversible is True
+    assert modification.verification_status == "true"
+
+
+def test_process_uploaded_image_unknown_algorithm(
+    generator_service: GeneratorService,
+) -> None:
+    with pytest.raises(ValueError):
+        generator_service.process_uploaded_image(b"", modification_algorithm="nope")
+
+
+def test_load_and_validate_image_from_file(
+    generator_service: GeneratorService, tmp_path: Path
+) -> None:
+    path = tmp_path / "upload.png"
+    PILImage.new("RGBA", (10, 8), (255, 0, 0, 128)).save(path, "PNG")
+
+    with open(path, "rb") as file:
+        file.read(4)
+        image = generator_service._load_and_validate_image(file)
+
+    assert image.mode == "RGB"
+    assert image.size == (10, 8)
+
+
+def test_load_and_validate_image_rejects_too_many_pixels(
+    db_session: Session, tmp_path: Path
+) -> None:
+    service = GeneratorService(
+        db=db_session, storage_path=str(tmp_path), max_upload_pixels=100
+    )
+    buffer = io.BytesIO()
+    PILImage.new("RGB", (20, 20)).save(buffer, "PNG")
+
+    with pytest.raises(HTTPException) as exc_info:
+        service._load_and_validate_image(buffer.getvalue())
+
+    assert exc_info.value.status_code == 413
+
+
+def test_load_and_validate_image_drafts_large_jpeg(
+    db_session: Session, tmp_path: Path
+) -> None:
+    service = GeneratorService(
+        db=db_session, storage_path=str(tmp_path), max_upload_pixels=40 * 30
+    )
+    buffer = io.BytesIO()
+    PILImage.effect_noise((160, 120), 64).convert("RGB").save(buffer, "JPEG")
+
+    image = service._load_and_validate_image(buffer.getvalue())
+
+    assert image.mode == "RGB"
+    assert image.size == (40, 30)
+
+
+def test_prepare_upload_then_generate_variants(
+    generator_service: GeneratorService,
+) -> None:
+    buffer = io.BytesIO()
+    PILImage.effect_noise((16, 12), 64).convert("RGB").save(buffer, "PNG")
+
+    upload = generator_service.prepare_upload(buffer.getvalue())
+    assert not isinstance(upload, UploadResponse)
+    assert Path(upload.paths.og_image_path).is_file()
+    generator_service.db.commit()
+
+    # an unfinished upload is not deduplicated to
+    duplicate = generator_service.prepare_upload(buffer.getvalue())
+    assert not isinstance(duplicate, UploadResponse)
+    generator_service.db.commit()
+
+    progress: list[int] = []
+    result = generator_service.generate_upload_variants(
+        upload, on_variant=progress.append
+    )
+
+    assert result.image_id == upload.image_id
+    assert progress == list(range(100))
+    assert [m.variant_num for m in result.modifications] == progress
+
+    again = generator_service.prepare_upload(buffer.getvalue())
+    assert isinstance(again, UploadResponse)
+    assert again.image_id == upload.image_id
+
+    # the duplicate loses to the finished upload and is discarded
+    duplicate_result = generator_service.generate_upload_variants(duplicate)
+    assert duplicate_result.image_id == upload.image_id
+    assert [m.id for m in duplicate_result.modifications] == [
+        m.id for m in result.modifications
+    ]
+    assert generator_service.db.get(DBImage, duplicate.image_id) is None
+    assert not Path(duplicate.paths.image_folder).exists()
+
+
+def test_generate_upload_variants_inserts_in_chunks(
+    generator_service: GeneratorService, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(generator_service_module, "INSERT_CHUNK_BYTES", 4096)
+    buffer = io.BytesIO()
+    PILImage.effect_noise((16, 12), 64).convert("RGB").save(buffer, "PNG")
+
+    result = generator_service.process_uploaded_image(buffer.getvalue(), seed=2)
+
+    ids = [m.id for m in result.modifications]
+    assert ids == sorted(ids)
+    assert not any(
+        isinstance(record, DBImageModification)
+        for record in generator_service.db.identity_map.values()
+    )
+    rows = (
+        generator_service.db.query(
+            DBImageModification.id, DBImageModification.modified_image_path
+        )
+        .filter(DBImageModification.image_id == result.image_id)
+        .order_by(DBImageModification.id)
+        .all()
+    )
+    assert [row.id for row in rows] == ids
+    assert [Path(row.modified_image_path).name for row in rows] == [
+        f"variant_{i:03d}.png" for i in range(100)
+    ]
+
+
+def test_discard_upload_removes_image(generator_service: GeneratorService) -> None:
+    buffer = io.BytesIO()
+    PILImage.effect_noise((16, 12), 64).convert("RGB").save(buffer, "PNG")
+
+    upload = generator_service.prepare_upload(buffer.getvalue())
+    assert not isinstance(upload, UploadResponse)
+    generator_service.db.commit()
+
+    generator_service.discard_upload(upload)
+
+    assert generator_service.db.get(DBImage, upload.image_id) is None
+    assert not Path(upload.paths.image_folder).exists()
+
+    again = generator_service.prepare_upload(buffer.getvalue())
+    assert not isinstance(again, UploadResponse)
+    assert again.image_id > upload.image_id
+
+
+def test_process_uploaded_image_parallel_matches_sequential(
+    db_session: Session, tmp_path: Path
+) -> None:
+    buffer = io.BytesIO()
+    PILImage.effect_noise((24, 20), 64).convert("RGB").save(buffer, "PNG")
+
+    results = []
+    try:
+        for workers in (0, 2):
+            service = GeneratorService(
+                db=db_session,
+                storage_path=str(tmp_path / f"workers_{workers}"),
+                generation_workers=workers,
+            )
+            results.append(service.process_uploaded_image(buffer.getvalue(), seed=42))
+            forget_image_digests(db_session)
+    finally:
+        shutdown_generation_pool()
+
+    sequential, parallel = (
+        db_session.query(DBImageModification)
+        .filter(DBImageModification.image_id == result.image_id)
+        .order_by(DBImageModification.id)
+        .all()
+        for result in results
+    )
+
+    assert [m.modification_params for m in sequential] == [
+        m.modification_params for m in parallel
+    ]
+    assert [Path(m.modified_image_path).name for m in parallel] == [
+        f"variant_{i:03d}.png" for i in range(100)
+    ]
+    for seq_mod, par_mod in zip(sequential, parallel):
+        assert (
+            PILImage.open(seq_mod.modified_image_path).tobytes()
+            == PILImage.open(par_mod.modified_image_path).tobytes()
+        )
+
+
+def test_process_uploaded_image_delta_storage(
+    db_session: Session, tmp_path: Path
+) -> None:
+    buffer = io.BytesIO()
+    PILImage.effect_noise((24, 20), 64).convert("RGB").save(buffer, "PNG")
+
+    file_service = GeneratorService(db=db_session, storage_path=str(tmp_path / "f"))
+    delta_service = GeneratorService(
+        db=db_session, storage_path=str(tmp_path / "d"), variant_storage="delta"
+    )
+    file_result = file_service.process_uploaded_image(buffer.getvalue(), seed=1)
+    forget_image_digests(db_session)
+    delta_result = delta_service.process_uploaded_image(buffer.getvalue(), seed=1)
+
+    assert (
+        list((tmp_path / "d" / str(delta_result.image_id) / "modified").iterdir()) == []
+    )
+
+    file_mod = file_result.modifications[3]
+    delta_mod = delta_result.modifications[3]
+
+    delta_record = db_session.get(DBImageModification, delta_mod.id)
+    assert delta_record is not None
+    assert delta_record.storage_mode == "delta"
+    assert delta_record.modified_image_path == f"api/modifications/{delta_mod.id}/image"
+
+    file_image = file_service.get_modification_image(file_mod.id)
+    delta_image = delta_service.get_modification_image(delta_mod.id)
+
+    assert file_image.path is not None
+    assert delta_image.content is not None
+    assert (
+        PILImage.open(io.BytesIO(delta_image.content)).tobytes()
+        == PILImage.open(file_image.path).tobytes()
+    )
+    assert delta_service.get_modification_image(delta_mod.id) == delta_image
+
+    assert delta_service.reverse_modification(delta_mod.id).is_reversible is True
+
+
+def test_reverse_modification_region_mode_skips_original(
+    generator_service: GeneratorService,
+) -> None:
+    buffer = io.BytesIO()
+    PILImage.effect_noise((24, 20), 64).convert("RGB").save(buffer, "PNG")
+    result = generator_service.process_uploaded_image(buffer.getvalue(), seed=3)
+
+    os.remove(result.original_image)
+    intact, tampered = result.modifications[0], result.modifications[1]
+
+    assert generator_service.reverse_modification(intact.id).is_reversible is True
+
+    record = generator_service.db.get(DBImageModification, tampered.id)
+    assert record is not None
+    params = generator_service._parse_and_convert_modification_params(
+        record.modification_params
+    )
+    region = params["region"]
+    modified = PILImage.open(record.modified_image_path).convert("RGB")
+    x = (region["start_x"] + region["width"]) % modified.width
+    y = (region["start_y"] + region["height"]) % modified.height
+    modified.putpixel((x, y), (1, 2, 3))
+    modified.save(record.modified_image_path)
+
+    assert generator_service.reverse_modification(tampered.id).is_reversible is False
+
+    generator_service.verification_mode = "strict"
+    with pytest.raises(FileNotFoundError):
+        generator_service.reverse_modification(intact.id)
+
+
+def test_process_uploaded_image_deduplicates_by_digest(
+    generator_service: GeneratorService, tmp_path: Path
+) -> None:
+    image = PILImage.effect_noise((16, 12), 64).convert("RGB")
+    png, bmp = io.BytesIO(), io.BytesIO()
+    image.save(png, "PNG")
+    image.save(bmp, "BMP")
+
+    first = generator_service.process_uploaded_image(png.getvalue())
+    second = generator_service.process_uploaded_image(bmp.getvalue())
+
+    assert second.image_id == first.image_id
+    assert second.message == "Image already uploaded"
+    assert [m.id for m in second.modifications] == [m.id for m in first.modifications]
+    assert generator_service.db.query(DBImage).count() == 1
+    assert sorted(p.name for p in tmp_path.iterdir()) == [str(first.image_id)]
+
+    record = generator_service.db.get(DBImage, first.image_id)
+    assert record is not None
+    assert record.digest == image_digest(image)
+
+
+def test_reverse_modification_strict_mode_caches_original(
+    generator_service: GeneratorService,
+) -> None:
+    buffer = io.BytesIO()
+    PILImage.effect_noise((24, 20), 64).convert("RGB").save(buffer, "PNG")
+    result = generator_service.process_uploaded_image(buffer.getvalue(), seed=4)
+
+    decoded_originals.clear()
+    hits, misses = decoded_originals.hits, decoded_originals.misses
+    generator_service.verification_mode = "strict"
+
+    for modification in result.modifications[:3]:
+        reversed_result = generator_service.reverse_modification(modification.id)
+        assert reversed_result.is_reversible is True
+
+    assert decoded_originals.misses - misses == 1
+    assert decoded_originals.hits - hits == 2
+    assert len(decoded_originals) == 1
+
+
+def test_reverse_modifications_batch(db_session: Session, tmp_path: Path) -> None:
+    service = GeneratorService(
+        db=db_session,
+        storage_path=str(tmp_path),
+        variant_storage="delta",
+        verification_mode="strict",
+    )
+    results = []
+    for size in ((24, 20), (16, 12)):
+        buffer = io.BytesIO()
+        PILImage.effect_noise(size, 64).convert("RGB").save(buffer, "PNG")
+        results.append(service.process_uploaded_image(buffer.getvalue(), seed=5))
+
+    ids = [m.id for result in results for m in result.modifications[:3]]
+    decoded_originals.clear()
+    misses = decoded_originals.misses
+
+    items = list(service.reverse_modifications_batch([*ids, 9999]))
+
+    assert items[0].modification_id == 9999
+    assert items[0].error is not None
+    assert sorted(item.modification_id for item in items[1:]) == ids
+    assert all(item.is_reversible is True for item in items[1:])
+    assert decoded_originals.misses - misses == 2
+
+    db_session.expire_all()
+    for modification_id in ids:
+        record = db_session.get(DBImageModification, modification_id)
+        assert record is not None
+        assert record.verification_status == "true"
+        assert record.verified_at is not None
+        assert record.lease_owner is None
+
+
+def test_reverse_modifications_batch_reports_missing_original_per_job(
+    db_session: Session, tmp_path: Path
+) -> None:
+    service = GeneratorService(
+        db=db_session, storage_path=str(tmp_path), verification_mode="strict"
+    )
+    results = []
+    for size in ((24, 20), (16, 12)):
+        buffer = io.BytesIO()
+        PILImage.effect_noise(size, 64).convert("RGB").save(buffer, "PNG")
+        results.append(service.process_uploaded_image(buffer.getvalue(), seed=5))
+    os.remove(results[0].original_image)
+
+    missing_ids = [m.id for m in results[0].modifications[:2]]
+    ids = [*missing_ids, *(m.id for m in results[1].modifications[:2])]
+
+    items = {
+        item.modification_id: item for item in service.reverse_modifications_batch(ids)
+    }
+
+    assert sorted(items) == sorted(ids)
+    for modification_id in ids:
+        if modification_id in missing_ids:
+            assert items[modification_id].error is not None
+        else:
+            assert items[modification_id].is_reversible is True
+
+
+def test_reverse_modifications_batch_gives_up_after_max_attempts(
+    db_session: Session, tmp_path: Path
+) -> None:
+    service = GeneratorService(
+        db=db_session, storage_path=str(tmp_path), verification_mode="strict"
+    )
+    buffer = io.BytesIO()
+    PILImage.effect_noise((16, 12), 64).convert("RGB").save(buffer, "PNG")
+    result = service.process_uploaded_image(buffer.getvalue(), seed=5)
+    os.remove(result.original_image)
+    modification_id = result.modifications[0].id
+
+    statuses = []
+    attempts = []
+    for _ in range(MAX_VERIFY_ATTEMPTS):
+        claim = claim_modifications(db_session, "worker-a", limit=1)
+        assert claim.modification_ids == [modification_id]
+        items = list(service.reverse_modifications_batch(claim.modification_ids))
+        assert items[0].error is not None
+
+        db_session.expire_all()
+        record = db_session.get(DBImageModification, modification_id)
+        assert record is not None
+        assert record.lease_owner is None
+        statuses.append(record.verification_status)
+        attempts.append(record.verify_attempts)
+
+    assert statuses == ["pending"] * (MAX_VERIFY_ATTEMPTS - 1) + ["error"]
+    assert attempts == list(range(1, MAX_VERIFY_ATTEMPTS + 1))
+    next_claim = claim_modifications(db_session, "worker-a", limit=1)
+    assert modification_id not in next_claim.modification_ids
+
+
+def test_reverse_modifications_batch_on_shared_executor(
+    db_session: Session, tmp_path: Path
+) -> None:
+    executor = CPUExecutor(max_workers=2, max_queued_jobs=1, max_queued_cost=1)
+    service = GeneratorService(
+        db=db_session, storage_path=str(tmp_path), executor=executor
+    )
+    buffer = io.BytesIO()
+    PILImage.effect_noise((16, 12), 64).convert("RGB").save(buffer, "PNG")
+    result = service.process_uploaded_image(buffer.getvalue(), seed=3)
+    ids = [m.id for m in result.modifications[:5]]
+
+    assert service.estimate_reversal_cost(ids) == 5 * 16 * 12
+
+    try:
+        items = list(service.reverse_modifications_batch(ids))
+    finally:
+        executor.shutdown()
+
+    assert sorted(item.modification_id for item in items) == ids
+    assert all(item.is_reversible is True for item in items)
+    assert executor.stats()["completed"] == 5
+    assert executor.stats()["rejected"] == 0
+
+
+def test_estimate_reversal_cost_skips_missing_originals(
+    generator_service: GeneratorService,
+) -> None:
+    results = []
+    for size in ((24, 20), (16, 12)):
+        buffer = io.BytesIO()
+        PILImage.effect_noise(size, 64).convert("RGB").save(buffer, "PNG")
+        results.append(
+            generator_service.process_uploaded_image(buffer.getvalue(), seed=5)
+        )
+    os.remove(results[0].original_image)
+
+    ids = [m.id for result in results for m in result.modifications[:2]]
+
+    assert generator_service.estimate_reversal_cost(ids) == 2 * 16 * 12
+
+
+@pytest.mark.parametrize("codec", ["webp", "npy"])
+def test_process_uploaded_image_with_codec(
+    db_session: Session, tmp_path: Path, codec: str
+) -> None:
+    service = GeneratorService(
+        db=db_session, storage_path=str(tmp_path), variant_codec=codec
+    )
+    buffer = io.BytesIO()
+    PILImage.effect_noise((16, 12), 64).convert("RGB").save(buffer, "PNG")
+
+    result = service.process_uploaded_image(buffer.getvalue(), seed=4)
+    modification = db_session.get(DBImageModification, result.modifications[0].id)
+
+    assert modification is not None
+    assert modification.codec == codec
+    assert modification.modified_image_path.endswith(f"variant_000.{codec}")
+    assert service.reverse_modification(modification.id).is_reversible is True
+
+    variant_image = service.get_modification_image(modification.id)
+    if codec == "npy":
+        assert variant_image.content is not None
+        assert PILImage.open(io.BytesIO(variant_image.content)).size == (16, 12)
+    else:
+        assert variant_image.path == modification.modified_image_path
+        assert variant_image.media_type == "image/webp"
+
+
+def test_reverse_modification_maps_raw_original(
+    db_session: Session, tmp_path: Path
+) -> None:
+    service = GeneratorService(
+        db=db_session,
+        storage_path=str(tmp_path),
+        variant_storage="delta",
+        verification_mode="strict",
+        raw_originals=True,
+    )
+    original = PILImage.effect_noise((24, 20), 64).convert("RGB")
+    buffer = io.BytesIO()
+    original.save(buffer, "PNG")
+
+    result = service.process_uploaded_image(buffer.getvalue(), seed=6)
+    raw_path = raw_original_path(result.original_image)
+    assert Path(raw_path).is_file()
+
+    decoded_misses = decoded_originals.misses
+    mapped_misses = mapped_originals.misses
+    for modification in result.modifications[:3]:
+        assert service.reverse_modification(modification.id).is_reversible is True
+
+    assert decoded_originals.misses == decoded_misses
+    assert mapped_originals.misses - mapped_misses == 1
+
+    cached = service._load_original(result.image_id, result.original_image)
+    assert cached.image is None
+    assert isinstance(cached.pixels, np.memmap)
+    assert not cached.pixels.flags.owndata
+    assert not cached.pixels.flags.writeable
+    assert cached.to_image().tobytes() == original.tobytes()
+
+    pixels = map_raw_image(raw_path)
+    assert pixels_hash(pixels) == image_hash(original)
+
+
+def test_thumbnails_are_cached_on_disk(
+    generator_service: GeneratorService, tmp_path: Path
+) -> None:
+    buffer = io.BytesIO()
+    PILImage.effect_noise((64, 32), 64).convert("RGB").save(buffer, "PNG")
+    result = generator_service.process_uploaded_image(buffer.getvalue(), seed=7)
+    modification_id = result.modifications[0].id
+
+    image_thumbnail = generator_service.get_image_thumbnail(result.image_id, 16)
+    thumbnail = generator_service.get_modification_thumbnail(modification_id, 16)
+
+    assert PILImage.open(io.BytesIO(image_thumbnail.content)).size == (16, 8)
+    assert PILImage.open(io.BytesIO(thumbnail.content)).size == (16, 8)
+    assert thumbnail.etag.startswith('"')
+
+    cached = tmp_path / str(result.image_id) / "thumbnails"
+    assert sorted(p.name for p in cached.iterdir()) == [
+        f"modification_{modification_id}_16.jpg",
+        "original_16.jpg",
+    ]
+    assert generator_service.get_modification_thumbnail(modification_id, 16) == (
+        thumbnail
+    )
+
+
+def test_thumbnail_of_unknown_image_raises_404(
+    generator_service: GeneratorService,
+) -> None:
+    with pytest.raises(HTTPException) as exc_info:
+        generator_service.get_image_thumbnail(999, 16)
+
+    assert exc_info.value.status_code == 404
+
+
+def test_export_image_as_zip(generator_service: GeneratorService) -> None:
+    buffer = io.BytesIO()
+    PILImage.effect_noise((24, 20), 64).convert("RGB").save(buffer, "PNG")
+    result = generator_service.process_uploaded_image(buffer.getvalue(), seed=3)
+
+    content = b"".join(generator_service.export_image(result.image_id, "zip"))
+
+    with zipfile.ZipFile(io.BytesIO(content)) as archive:
+        manifest = json.loads(archive.read("manifest.json"))
+        first = manifest["modifications"][0]
+        info = archive.getinfo(first["file"])
+        modification = generator_service.db.get(DBImageModification, first["id"])
+
+        assert modification is not None
+        assert info.compress_type == zipfile.ZIP_STORED
+        assert archive.read(info) == (
+            Path(modification.modified_image_path).read_bytes()
+        )
+
+    assert manifest["image"]["id"] == result.image_id
+    assert [m["id"] for m in manifest["modifications"]] == [
+        m.id for m in result.modifications
+    ]
+    assert first["modification_algorithm"] == "pixel_color"
+
+
+def test_export_image_as_tar_renders_delta_variants(
+    db_session: Session, tmp_path: Path
+) -> None:
+    buffer = io.BytesIO()
+    PILImage.effect_noise((24, 20), 64).convert("RGB").save(buffer, "PNG")
+    service = GeneratorService(
+        db=db_session, storage_path=str(tmp_path), variant_storage="delta"
+    )
+    result = service.process_uploaded_image(buffer.getvalue(), seed=3)
+    modification_id = result.modifications[5].id
+
+    content = b"".join(service.export_image(result.image_id, "tar"))
+
+    with tarfile.open(fileobj=io.BytesIO(content)) as archive:
+        names = archive.getnames()
+        exported = archive.extractfile(f"modified/modification_{modification_id}.png")
+        assert exported is not None
+        variant = service.get_modification_image(modification_id)
+
+        assert variant.content is not None
+        assert (
+            PILImage.open(exported).tobytes()
+            == PILImage.open(io.BytesIO(variant.content)).tobytes()
+        )
+
+    assert len(names) == len(result.modifications) + 1
+    assert names[-1] == "manifest.json"
+
+
+def test_export_of_unknown_image_raises_404(
+    generator_service: GeneratorService,
+) -> None:
+    with pytest.raises(HTTPException) as exc_info:
+        generator_service.export_image(999, "zip")
+
+    assert exc_info.value.status_code == 404
@@ -1,16 +1,49 @@
+import json
 import random
+from typing import Any
 
 import pytest
 from PIL import Image
 
 from app.services.image_processor import (
+    apply_modifications,
+    apply_pixel_color_modifications,
+    apply_xor_mask_modifications,
     compare_images_by_hash,
     compare_images_pixelwise,
     compute_modification_region,
+    compute_row_digests,
+    decode_modification_params,
+    encode_modification_params,
+    get_modification_algorithm,
+    image_digest,
+    outside_region_digest,
+    region_digest,
+    restore_region,
+    reverse_modifications,
     reverse_pixel_color_modifications,
+    stamp_modifications,
+    verify_region_digests,
 )
 
 
+def make_legacy_params_json(image: Image.Image, params: dict[str, Any]) -> str:
+    """Build a legacy params row with a per-pixel original_pixels list."""
+    region = params["region"]
+    pixels = image.load()
+    assert pixels is not None
+
+    original_pixels = [
+        (x, y, pixels[x, y])
+        for x in range(region["start_x"], region["start_x"] + region["width"])
+        for y in range(region["start_y"], region["start_y"] + region["height"])
+    ]
+
+    legacy = {k: v for k, v in params.items() if k != "original_patch"}
+    legacy["original_pixels"] = original_pixels
+    return json.dumps(legacy)
+
+
 def test_region_whole_image_when_num_mods_exceeds_total_pixels() -> None:
     width, height = 10, 5
     start_x, start_y, rect_w, rect_h = compute_modification_region(
@@ -64,6 +97,33 @@ def test_compare_images_pixelwise(
     assert compare_images_pixelwise(img1, img2) is expected
 
 
+def test_apply_pixel_color_modifications_matches_pixel_loop() -> None:
+    random.seed(3)
+    img = Image.effect_noise((20, 15), 64).convert("RGB")
+
+    modified, params = apply_pixel_color_modifications(img, 30, color=(0, 255, 0))
+
+    region = params["region"]
+    assert isinstance(region, dict)
+    start_x, start_y = region["start_x"], region["start_y"]
+    width, height = region["width"], region["height"]
+
+    expected = img.copy()
+    expected_pixels = expected.load()
+    assert expected_pixels is not None
+    for x in range(start_x, start_x + width):
+        for y in range(start_y, start_y + height):
+            expected_pixels[x, y] = (0, 255, 0)
+
+    original_patch = img.crop((start_x, start_y, start_x + width, start_y + height))
+
+    assert modified.mode == "RGB"
+    assert modified.tobytes() == expected.tobytes()
+    assert params["original_patch"].tobytes() == original_patch.tobytes()
+    assert params["num_modifications"] == width * height == 25
+    assert img.getpixel((start_x, start_y)) != (0, 255, 0)
+
+
 def test_reverse_pixel_color_modifications_single() -> None:
     img = Image.new("RGB", (10, 10), (255, 0, 0))
     img.putpixel((3, 4), (0, 255, 0))
@@ -80,6 +140,67 @@ def test_reverse_pixel_color_modifications_single() -> None:
     assert reversed_img.getpixel((0, 0)) == (255, 0, 0)
 
 
+def test_reverse_pixel_color_modifications_pastes_original_patch() -> None:
+    random.seed(5)
+    img = Image.effect_noise((40, 30), 64).convert("RGB")
+
+    modified, params = apply_pixel_color_modifications(img, 200)
+    reversed_img = reverse_pixel_color_modifications(modified, params)
+
+    assert modified.tobytes() != img.tobytes()
+    assert reversed_img.tobytes() == img.tobytes()
+
+
+def test_reverse_pixel_color_modifications_accepts_legacy_json() -> None:
+    random.seed(6)
+    img = Image.effect_noise((40, 30), 64).convert("RGB")
+
+    modified, params = apply_pixel_color_modifications(img, 200)
+    legacy_params = json.loads(make_legacy_params_json(img, params))
+
+    reversed_img = reverse_pixel_color_modifications(modified, legacy_params)
+
+    assert "original_patch" not in legacy_params
+    assert reversed_img.tobytes() == img.tobytes()
+
+
+@pytest.mark.parametrize("compress", [True, False], ids=["zlib", "raw"])
+def test_encode_decode_modification_params_roundtrip(compress: bool) -> None:
+    random.seed(7)
+    img = Image.effect_noise((40, 30), 64).convert("RGB")
+
+    modified, params = apply_pixel_color_modifications(img, 200)
+
+    encoded = encode_modification_params(params, compress=compress)
+    decoded = decode_modification_params(encoded)
+
+    assert json.loads(encoded)["version"] == 2
+    assert len(encoded) < len(make_legacy_params_json(img, params))
+    assert decoded["region"] == params["region"]
+    assert decoded["num_modifications"] == params["num_modifications"]
+    assert decoded["original_patch"].tobytes() == params["original_patch"].tobytes()
+
+    reversed_img = reverse_pixel_color_modifications(modified, decoded)
+    assert reversed_img.tobytes() == img.tobytes()
+
+
+def test_decode_modification_params_converts_legacy_json() -> None:
+    random.seed(8)
+    img = Image.effect_noise((40, 30), 64).convert("RGB")
+
+    _, params = apply_pixel_color_modifications(img, 200)
+
+    decoded = decode_modification_params(make_legacy_params_json(img, params))
+
+    assert "original_pixels" not in decoded
+    assert decoded["original_patch"].tobytes() == params["original_patch"].tobytes()
+
+
+def test_decode_modification_params_rejects_unknown_version() -> None:
+    with pytest.raises(ValueError):
+        decode_modification_params(json.dumps({"version": 99}))
+
+
 @pytest.mark.parametrize(
     "color1,size1,color2,size2,expected",
     [
@@ -102,3 +223,98 @@ def test_compare_image_by_hash(
     result = compare_images_by_hash(img1, img2)
 
     assert result == expected
+
+
+def test_xor_mask_modifications_roundtrip_with_constant_params() -> None:
+    random.seed(9)
+    img = Image.effect_noise((60, 40), 64).convert("RGB")
+
+    small_modified, small_params = apply_xor_mask_modifications(img, 25, seed=1)
+    large_modified, large_params = apply_xor_mask_modifications(img, 900, seed=1)
+
+    assert small_modified.tobytes() != img.tobytes()
+    assert large_params["num_modifications"] == 900
+    assert "original_patch" not in large_params
+
+    for modified, params in (
+        (small_modified, small_params),
+        (large_modified, large_params),
+    ):
+        decoded = decode_modification_params(encode_modification_params(params))
+        reversed_img = reverse_modifications(modified, decoded, algorithm="xor_mask")
+        assert reversed_img.tobytes() == img.tobytes()
+
+    assert len(encode_modification_params(large_params)) < 256
+
+
+@pytest.mark.parametrize("algorithm", ["pixel_color", "xor_mask"])
+def test_apply_modifications_dispatches_on_algorithm(algorithm: str) -> None:
+    random.seed(10)
+    img = Image.effect_noise((20, 20), 64).convert("RGB")
+
+    modified, params = apply_modifications(img, 16, algorithm, color=(1, 2, 3))
+
+    assert params["algorithm"] == algorithm
+    reversed_img = reverse_modifications(modified, params, algorithm)
+    assert reversed_img.tobytes() == img.tobytes()
+
+
+def test_get_modification_algorithm_unknown_raises() -> None:
+    with pytest.raises(ValueError):
+        get_modification_algorithm("does_not_exist")
+
+
+@pytest.mark.parametrize("algorithm", ["pixel_color", "xor_mask"])
+def test_stamp_modifications_in_place_and_restore(algorithm: str) -> None:
+    random.seed(11)
+    img = Image.effect_noise((30, 20), 64).convert("RGB")
+    working = img.copy()
+
+    params, original_patch = stamp_modifications(working, 36, algorithm)
+
+    assert working.tobytes() != img.tobytes()
+    assert original_patch.shape == (6, 6, 3)
+
+    restore_region(working, params["region"], original_patch)
+    assert working.tobytes() == img.tobytes()
+
+
+def test_outside_region_digest_ignores_region_pixels() -> None:
+    img = Image.effect_noise((30, 20), 64).convert("RGB")
+    region = {"start_x": 5, "start_y": 4, "width": 10, "height": 10}
+
+    digest = outside_region_digest(img, region)
+    assert outside_region_digest(img, region, compute_row_digests(img, 7)) == digest
+
+    inside = img.copy()
+    inside.putpixel((6, 5), (1, 2, 3))
+    assert outside_region_digest(inside, region) == digest
+
+    outside = img.copy()
+    outside.putpixel((20, 5), (1, 2, 3))
+    assert outside_region_digest(outside, region) != digest
+
+
+def test_verify_region_digests() -> None:
+    img = Image.effect_noise((30, 20), 64).convert("RGB")
+    region = {"start_x": 0, "start_y": 10, "width": 10, "height": 10}
+    digests = {
+        "region": region_digest(img, region),
+        "outside": outside_region_digest(img, region),
+    }
+
+    assert verify_region_digests(img, region, digests) is True
+
+    changed = img.copy()
+    changed.putpixel((0, 10), (1, 2, 3))
+    assert verify_region_digests(changed, region, digests) is False
+
+
+def test_image_digest_depends_on_size_and_pixels() -> None:
+    wide = Image.new("RGB", (8, 2), (1, 2, 3))
+    square = Image.new("RGB", (4, 4), (1, 2, 3))
+
+    assert wide.tobytes() == square.tobytes()
+    assert image_digest(wide) != image_digest(square)
+    assert image_digest(wide) == image_digest(wide.copy())
+    assert image_digest(wide, compute_row_digests(wide, 1)) == image_digest(wide)
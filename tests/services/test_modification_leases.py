@@ -0,0 +1,112 @@
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.database import Base
+from app.models import DBImage, DBImageModification
+from app.services.modification_leases import (
+    MAX_VERIFY_ATTEMPTS,
+    claim_modifications,
+    pending_modifications,
+)
+
+
+def add_modifications(db: Session, count: int) -> list[int]:
+    image = DBImage(original_image_path="original.png")
+    db.add(image)
+    db.flush()
+
+    modifications = [
+        DBImageModification(
+            image_id=image.id,
+            modified_image_path=f"variant_{i:03d}.png",
+            modification_algorithm="pixel_color",
+            modification_params="{}",
+            num_modifications=1,
+        )
+        for i in range(count)
+    ]
+    db.add_all(modifications)
+    db.commit()
+    return [m.id for m in modifications]
+
+
+def test_claim_modifications_splits_backlog(db_session: Session) -> None:
+    ids = add_modifications(db_session, 5)
+
+    first = claim_modifications(db_session, "worker-a", limit=3)
+    second = claim_modifications(db_session, "worker-b", limit=3)
+    third = claim_modifications(db_session, "worker-c", limit=3)
+
+    assert first.modification_ids == ids[:3]
+    assert second.modification_ids == ids[3:]
+    assert third.modification_ids == []
+
+    db_session.expire_all()
+    record = db_session.get(DBImageModification, ids[4])
+    assert record is not None
+    assert record.verification_status == "in_progress"
+    assert record.lease_owner == "worker-b"
+
+
+def test_claim_modifications_reclaims_expired_leases(db_session: Session) -> None:
+    ids = add_modifications(db_session, 3)
+    claim_modifications(db_session, "worker-a", limit=3)
+
+    expired = db_session.get(DBImageModification, ids[1])
+    assert expired is not None
+    expired.lease_expires_at = datetime.now(timezone.utc) - timedelta(seconds=1)
+    verified = db_session.get(DBImageModification, ids[2])
+    assert verified is not None
+    verified.verification_status = "true"
+    verified.lease_expires_at = datetime.now(timezone.utc) - timedelta(seconds=1)
+    db_session.commit()
+
+    reclaimed = claim_modifications(db_session, "worker-b")
+
+    assert reclaimed.modification_ids == [ids[1]]
+    db_session.expire_all()
+    assert expired.lease_owner == "worker-b"
+
+
+def test_claim_modifications_stops_after_max_attempts(db_session: Session) -> None:
+    [modification_id] = add_modifications(db_session, 1)
+    record = db_session.get(DBImageModification, modification_id)
+    assert record is not None
+
+    claims = []
+    for _ in range(MAX_VERIFY_ATTEMPTS + 1):
+        claims.append(claim_modifications(db_session, "worker-a").modification_ids)
+        # the worker died holding the lease
+        db_session.expire_all()
+        record.lease_expires_at = datetime.now(timezone.utc) - timedelta(seconds=1)
+        db_session.commit()
+
+    assert claims == [[modification_id]] * MAX_VERIFY_ATTEMPTS + [[]]
+    assert record.verify_attempts == MAX_VERIFY_ATTEMPTS
+
+
+def test_claim_modifications_waits_for_new_uploads(tmp_path: Path) -> None:
+    engine = create_engine(f"sqlite:///{tmp_path / 'claims.db'}")
+    Base.metadata.create_all(bind=engine)
+    SessionLocal = sessionmaker(bind=engine)
+
+    def upload() -> None:
+        with SessionLocal() as session:
+            add_modifications(session, 2)
+        pending_modifications.notify()
+
+    with SessionLocal() as session:
+        empty = claim_modifications(session, "worker-a", wait_seconds=0.01)
+        assert empty.modification_ids == []
+
+        threading.Timer(0.05, upload).start()
+        started_at = time.monotonic()
+        claim = claim_modifications(session, "worker-a", wait_seconds=10)
+
+    assert len(claim.modification_ids) == 2
+    assert time.monotonic() - started_at < 5
@@ -0,0 +1,59 @@
+import json
+import random
+
+from PIL import Image
+from sqlalchemy.orm import Session
+
+from app.models import DBImage, DBImageModification
+from app.services.image_processor import (
+    apply_pixel_color_modifications,
+    decode_modification_params,
+)
+from app.services.params_migration import migrate_modification_params
+
+
+def test_migrate_modification_params_converts_legacy_rows(
+    db_session: Session,
+) -> None:
+    random.seed(2)
+    img = Image.effect_noise((20, 20), 64).convert("RGB")
+    _, params = apply_pixel_color_modifications(img, 16)
+    region = params["region"]
+    pixels = img.load()
+    assert pixels is not None
+
+    legacy = {k: v for k, v in params.items() if k != "original_patch"}
+    legacy["original_pixels"] = [
+        (x, y, pixels[x, y])
+        for x in range(region["start_x"], region["start_x"] + region["width"])
+        for y in range(region["start_y"], region["start_y"] + region["height"])
+    ]
+    partial = {"algorithm": "pixel_color", "original_pixels": [[1, 2, [3, 4, 5]]]}
+
+    image_record = DBImage(original_image_path="storage/1/original.png")
+    db_session.add(image_record)
+    db_session.flush()
+
+    for payload in (legacy, partial):
+        db_session.add(
+            DBImageModification(
+                image_id=image_record.id,
+                modified_image_path="storage/1/modified/variant_000.png",
+                modification_algorithm="pixel_color",
+                modification_params=json.dumps(payload),
+                num_modifications=16,
+            )
+        )
+    db_session.commit()
+
+    assert migrate_modification_params(db_session, batch_size=1) == 1
+    assert migrate_modification_params(db_session) == 0
+
+    converted, skipped = db_session.query(DBImageModification).order_by(
+        DBImageModification.id
+    )
+    assert json.loads(converted.modification_params)["version"] == 2
+    assert json.loads(skipped.modification_params) == partial
+
+    decoded = decode_modification_params(converted.modification_params)
+    assert decoded["original_patch"].tobytes() == params["original_patch"].tobytes()
@@ -0,0 +1,71 @@
+from pathlib import Path
+
+from sqlalchemy import create_engine, inspect, text
+
+from app.services.schema_migration import migrate_schema
+
+# the tables as created before digests, delta storage, leases, codecs
+# and verify attempts
+BASELINE_SCHEMA = [
+    """
+    CREATE TABLE images (
+        id INTEGER NOT NULL PRIMARY KEY,
+        original_image_path VARCHAR NOT NULL,
+        created_at DATETIME
+    )
+    """,
+    """
+    CREATE TABLE image_modifications (
+        id INTEGER NOT NULL PRIMARY KEY,
+        image_id INTEGER NOT NULL REFERENCES images (id),
+        modified_image_path VARCHAR NOT NULL,
+        modification_algorithm VARCHAR NOT NULL,
+        modification_params VARCHAR NOT NULL,
+        num_modifications INTEGER NOT NULL,
+        verification_status VARCHAR NOT NULL,
+        created_at DATETIME,
+        verified_at DATETIME
+    )
+    """,
+    "INSERT INTO images (id, original_image_path) VALUES (1, 'storage/1/original.png')",
+    """
+    INSERT INTO image_modifications (
+        id, image_id, modified_image_path, modification_algorithm,
+        modification_params, num_modifications, verification_status
+    ) VALUES (1, 1, 'storage/1/modified/variant_000.png', 'pixel_color',
+        '{}', 10, 'pending')
+    """,
+]
+
+
+def test_migrate_schema_adds_missing_columns_and_indexes(tmp_path: Path) -> None:
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as connection:
+        for statement in BASELINE_SCHEMA:
+            connection.execute(text(statement))
+
+    added = migrate_schema(engine)
+
+    assert sorted(added) == [
+        "image_modifications.codec",
+        "image_modifications.lease_expires_at",
+        "image_modifications.lease_owner",
+        "image_modifications.storage_mode",
+        "image_modifications.verify_attempts",
+        "images.digest",
+    ]
+    assert migrate_schema(engine) == []
+
+    index_names = {index["name"] for index in inspect(engine).get_indexes("images")}
+    assert "ix_images_digest" in index_names
+
+    with engine.connect() as connection:
+        row = connection.execute(
+            text(
+                "SELECT storage_mode, codec, lease_owner, verify_attempts "
+                "FROM image_modifications"
+            )
+        ).one()
+    assert tuple(row) == ("file", "png", None, 0)
+
+    engine.dispose()
@@ -0,0 +1,80 @@
+import threading
+
+from app.schemas import UploadResponse
+from app.services.cpu_executor import CPUExecutor
+from app.services.upload_jobs import UploadJob, UploadJobs
+
+
+def make_jobs(max_finished: int = 1000) -> UploadJobs:
+    executor = CPUExecutor(max_workers=1, max_queued_jobs=10, max_queued_cost=10**9)
+    return UploadJobs(executor, max_finished=max_finished)
+
+
+def make_result(image_id: int) -> UploadResponse:
+    return UploadResponse(
+        image_id=image_id,
+        message="done",
+        original_image="original.png",
+        modifications=[],
+    )
+
+
+def test_upload_job_reports_progress_and_result() -> None:
+    jobs = make_jobs()
+    release = threading.Event()
+
+    def run(job: UploadJob) -> UploadResponse:
+        for _ in range(3):
+            job.advance()
+        release.wait(5)
+        return make_result(job.image_id)
+
+    try:
+        job = jobs.submit(image_id=7, total_variants=3, run=run, cost=1)
+        assert jobs.get(job.id) is job
+
+        snapshots = job.watch(heartbeat_seconds=0.01)
+        release.set()
+        statuses = [s.status for s in snapshots if s is not None]
+    finally:
+        jobs.executor.shutdown()
+
+    assert statuses[-1] == "succeeded"
+    assert job.completed_variants == 3
+    assert job.snapshot().result == make_result(7)
+    assert job.finished_at is not None
+
+
+def test_upload_job_failure_is_recorded() -> None:
+    jobs = make_jobs()
+
+    def run(job: UploadJob) -> UploadResponse:
+        raise RuntimeError("disk full")
+
+    try:
+        job = jobs.submit(image_id=1, total_variants=100, run=run, cost=1)
+        list(job.watch(heartbeat_seconds=0.01))
+    finally:
+        jobs.executor.shutdown()
+
+    assert job.status == "failed"
+    assert job.error == "disk full"
+    assert job.result is None
+
+
+def test_upload_jobs_keeps_recent_finished_jobs() -> None:
+    jobs = make_jobs(max_finished=2)
+
+    try:
+        submitted = []
+        for image_id in range(4):
+            job = jobs.submit(image_id, 0, run=lambda j: make_result(0), cost=1)
+            list(job.watch(heartbeat_seconds=0.01))
+            submitted.append(job)
+        jobs.submit(4, 0, run=lambda j: make_result(0), cost=1)
+    finally:
+        jobs.executor.shutdown()
+
+    assert jobs.get(submitted[0].id) is None
+    assert jobs.get(submitted[1].id) is None
+    assert jobs.get(submitted[3].id) is submitted[3]
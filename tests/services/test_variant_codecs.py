@@ -0,0 +1,34 @@
+from pathlib import Path
+
+import pytest
+from PIL import Image as PILImage
+
+from app.services.variant_codecs import get_variant_codec, load_variant, save_variant
+
+
+@pytest.mark.parametrize("codec", ["png", "webp", "npy"])
+def test_variant_codec_round_trip(codec: str, tmp_path: Path) -> None:
+    image = PILImage.effect_noise((24, 20), 64).convert("RGB")
+    path = str(tmp_path / f"variant.{get_variant_codec(codec).extension}")
+
+    save_variant(image, path, codec, compress_level=1)
+    loaded = load_variant(path, codec)
+
+    assert loaded.mode == "RGB"
+    assert loaded.tobytes() == image.tobytes()
+
+
+def test_png_compress_level_changes_size(tmp_path: Path) -> None:
+    image = PILImage.radial_gradient("L").convert("RGB")
+
+    save_variant(image, str(tmp_path / "fast.png"), "png", compress_level=0)
+    save_variant(image, str(tmp_path / "small.png"), "png", compress_level=9)
+
+    assert (tmp_path / "small.png").stat().st_size < (
+        tmp_path / "fast.png"
+    ).stat().st_size
+
+
+def test_get_variant_codec_unknown() -> None:
+    with pytest.raises(ValueError):
+        get_variant_codec("gif")
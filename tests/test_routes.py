@@ -0,0 +1,201 @@
+import hashlib
+from functools import partial
+from pathlib import Path
+from typing import Iterator
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from PIL import Image as PILImage
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.database import Base, get_db
+from app.models import DBImage
+from app.routes import router
+from app.services.storage_etags import storage_etag, storage_etags
+from app.utils.static_files import IMMUTABLE_CACHE_CONTROL, ImmutableStaticFiles
+
+
+@pytest.fixture
+def client(tmp_path: Path) -> Iterator[TestClient]:
+    # a file database, since requests are served from other threads
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'test.db'}",
+        connect_args={"check_same_thread": False},
+    )
+    Base.metadata.create_all(bind=engine)
+    SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
+
+    def get_test_db() -> Iterator[Session]:
+        with SessionLocal() as db:
+            yield db
+
+    app = FastAPI()
+    app.include_router(router)
+    app.dependency_overrides[get_db] = get_test_db
+
+    with SessionLocal() as db:
+        db.add_all(DBImage(original_image_path=f"{i}.png") for i in range(8))
+        db.commit()
+
+    with TestClient(app) as test_client:
+        yield test_client
+
+    engine.dispose()
+
+
+def test_get_images_follows_cursor_to_the_end(client: TestClient) -> None:
+    pages = []
+    params = {"limit": 3}
+    while True:
+        response = client.get("/api/images", params=params)
+        assert response.status_code == 200
+        pages.append([image["id"] for image in response.json()])
+
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+        params = {"limit": 3, "cursor": cursor}
+
+    assert pages == [[8, 7, 6], [5, 4, 3], [2, 1]]
+
+
+def test_get_images_rejects_invalid_cursor(client: TestClient) -> None:
+    response = client.get("/api/images", params={"cursor": "2026-01-01_3"})
+
+    assert response.status_code == 400
+
+
+@pytest.fixture
+def storage_client(tmp_path: Path) -> Iterator[TestClient]:
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'test.db'}",
+        connect_args={"check_same_thread": False},
+    )
+    Base.metadata.create_all(bind=engine)
+    SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
+
+    def get_test_db() -> Iterator[Session]:
+        with SessionLocal() as db:
+            yield db
+
+    storage = tmp_path / "storage"
+    with SessionLocal() as db:
+        # image 1 has a content digest, image 2 was stored before digests
+        for image_id, digest in ((1, "d" * 64), (2, None)):
+            original_path = storage / str(image_id) / "original.png"
+            original_path.parent.mkdir(parents=True)
+            PILImage.effect_noise((32, 24), 64).convert("RGB").save(original_path)
+            db.add(
+                DBImage(
+                    id=image_id, original_image_path=str(original_path), digest=digest
+                )
+            )
+        db.commit()
+
+    app = FastAPI()
+    app.include_router(router)
+    app.dependency_overrides[get_db] = get_test_db
+    app.mount(
+        "/storage",
+        ImmutableStaticFiles(
+            directory=storage,
+            etag_for=partial(storage_etag, session_factory=SessionLocal),
+        ),
+    )
+    storage_etags.clear()
+
+    with TestClient(app) as test_client:
+        yield test_client
+
+    storage_etags.clear()
+    engine.dispose()
+
+
+def test_storage_file_is_immutable_with_digest_etag(
+    storage_client: TestClient,
+) -> None:
+    response = storage_client.get("/storage/1/original.png")
+
+    digest_path = f"{'d' * 64}/original.png"
+    assert response.status_code == 200
+    assert response.headers["cache-control"] == IMMUTABLE_CACHE_CONTROL
+    assert response.headers["etag"] == (
+        f'"{hashlib.sha256(digest_path.encode()).hexdigest()[:32]}"'
+    )
+
+
+@pytest.mark.parametrize("weak", [False, True])
+def test_storage_file_not_modified_for_known_etag(
+    storage_client: TestClient, weak: bool
+) -> None:
+    etag = storage_client.get("/storage/1/original.png").headers["etag"]
+
+    response = storage_client.get(
+        "/storage/1/original.png",
+        headers={"If-None-Match": f'"other", {"W/" if weak else ""}{etag}'},
+    )
+
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == etag
+    assert response.headers["cache-control"] == IMMUTABLE_CACHE_CONTROL
+
+
+def test_storage_file_serves_ranges_for_current_etag(
+    storage_client: TestClient,
+) -> None:
+    full = storage_client.get("/storage/1/original.png")
+    etag = full.headers["etag"]
+
+    partial_response = storage_client.get(
+        "/storage/1/original.png", headers={"Range": "bytes=0-9", "If-Range": etag}
+    )
+    stale = storage_client.get(
+        "/storage/1/original.png",
+        headers={"Range": "bytes=0-9", "If-Range": '"stale"'},
+    )
+
+    assert partial_response.status_code == 206
+    assert partial_response.content == full.content[:10]
+    assert partial_response.headers["etag"] == etag
+    assert stale.status_code == 200
+    assert stale.content == full.content
+
+
+def test_storage_file_without_digest_keeps_default_etag(
+    storage_client: TestClient,
+) -> None:
+    response = storage_client.get("/storage/2/original.png")
+    etag = response.headers["etag"]
+    revalidated = storage_client.get(
+        "/storage/2/original.png", headers={"If-None-Match": etag}
+    )
+
+    assert response.status_code == 200
+    assert response.headers["cache-control"] == IMMUTABLE_CACHE_CONTROL
+    # the mtime-based ETag of StaticFiles, not one derived from a digest
+    digest_path = f"{'d' * 64}/original.png"
+    assert etag != f'"{hashlib.sha256(digest_path.encode()).hexdigest()[:32]}"'
+    assert revalidated.status_code == 304
+
+
+def test_thumbnail_is_immutable_and_revalidates(storage_client: TestClient) -> None:
+    url = "/api/images/1/thumbnail?size=128"
+    response = storage_client.get(url)
+    etag = response.headers["etag"]
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/jpeg"
+    assert response.headers["cache-control"] == IMMUTABLE_CACHE_CONTROL
+
+    for if_none_match in (etag, f'"other", W/{etag}', "*"):
+        revalidated = storage_client.get(url, headers={"If-None-Match": if_none_match})
+        assert revalidated.status_code == 304
+        assert revalidated.content == b""
+        assert revalidated.headers["etag"] == etag
+
+    changed = storage_client.get(url, headers={"If-None-Match": '"other"'})
+    assert changed.status_code == 200
+    assert changed.content == response.content
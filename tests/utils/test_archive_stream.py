@@ -0,0 +1,53 @@
+import io
+import tarfile
+import zipfile
+from typing import Iterator
+
+import pytest
+
+from app.utils.archive_stream import ArchiveEntry, stream_archive
+
+PAYLOAD = bytes(range(256)) * 5000
+
+
+def entries() -> Iterator[ArchiveEntry]:
+    chunks = []
+    for start in range(0, len(PAYLOAD), 65536):
+        end = start + 65536
+        chunks.append(PAYLOAD[start:end])
+    yield ArchiveEntry("modified/variant_000.png", len(PAYLOAD), chunks)
+    yield ArchiveEntry("manifest.json", 2, [b"{}"], compress=True)
+
+
+def test_stream_zip_stores_or_deflates_each_entry() -> None:
+    chunks = list(stream_archive("zip", entries()))
+
+    assert max(len(chunk) for chunk in chunks) < len(PAYLOAD)
+    with zipfile.ZipFile(io.BytesIO(b"".join(chunks))) as archive:
+        assert archive.testzip() is None
+        assert archive.getinfo("modified/variant_000.png").compress_type == (
+            zipfile.ZIP_STORED
+        )
+        manifest_info = archive.getinfo("manifest.json")
+        assert manifest_info.compress_type == zipfile.ZIP_DEFLATED
+        assert archive.read("modified/variant_000.png") == PAYLOAD
+        assert archive.read("manifest.json") == b"{}"
+
+
+def test_stream_tar_is_readable_by_tarfile() -> None:
+    content = b"".join(stream_archive("tar", entries()))
+
+    assert len(content) % tarfile.RECORDSIZE == 0
+    with tarfile.open(fileobj=io.BytesIO(content)) as archive:
+        assert archive.getnames() == ["modified/variant_000.png", "manifest.json"]
+        exported = archive.extractfile("modified/variant_000.png")
+        assert exported is not None
+        assert exported.read() == PAYLOAD
+
+
+@pytest.mark.parametrize("archive_format", ["zip", "tar"])
+def test_stream_archive_rejects_wrong_entry_size(archive_format: str) -> None:
+    entry = ArchiveEntry("a.bin", 3, [b"ab"])
+
+    with pytest.raises(ValueError):
+        b"".join(stream_archive(archive_format, [entry]))
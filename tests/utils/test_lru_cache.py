@@ -0,0 +1,44 @@
+from app.utils.lru_cache import LRUCache
+
+
+def test_lru_cache_evicts_least_recently_used() -> None:
+    cache: LRUCache[bytes] = LRUCache(max_bytes=10, sizeof=len)
+
+    cache.put("a", b"1234")
+    cache.put("b", b"1234")
+    assert cache.get("a") == b"1234"
+
+    cache.put("c", b"1234")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == b"1234"
+    assert cache.get("c") == b"1234"
+    assert cache.current_bytes == 8
+
+
+def test_lru_cache_skips_values_over_budget() -> None:
+    cache: LRUCache[bytes] = LRUCache(max_bytes=4, sizeof=len)
+
+    cache.put("a", b"12345")
+
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_lru_cache_counts_hits_misses_and_evictions() -> None:
+    cache: LRUCache[bytes] = LRUCache(max_bytes=4, sizeof=len)
+
+    cache.put("a", b"12")
+    cache.put("b", b"12")
+    cache.get("a")
+    cache.put("c", b"12")
+    cache.get("b")
+
+    assert cache.stats() == {
+        "entries": 2,
+        "current_bytes": 4,
+        "max_bytes": 4,
+        "hits": 1,
+        "misses": 1,
+        "evictions": 1,
+    }
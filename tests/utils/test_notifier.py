@@ -0,0 +1,22 @@
+import threading
+
+from app.utils.notifier import Notifier
+
+
+def test_notifier_wakes_waiters() -> None:
+    notifier = Notifier()
+    version = notifier.version
+
+    threading.Timer(0.05, notifier.notify).start()
+
+    assert notifier.wait(version, timeout=5) is True
+    assert notifier.version == version + 1
+
+
+def test_notifier_does_not_miss_earlier_notify() -> None:
+    notifier = Notifier()
+    version = notifier.version
+    notifier.notify()
+
+    assert notifier.wait(version, timeout=0) is True
+    assert notifier.wait(notifier.version, timeout=0.01) is False